@@ -6,6 +6,8 @@ import os
 import torch
 from app.gradio_ui import demo
 from app.database.database import init_db
+from app.models.warmup import warmup_state
+from app.utils.config import settings
 
 # Afficher les informations de l'environnement
 print("="*60)
@@ -25,6 +27,11 @@ print("="*60)
 print("\nInitialisation de la base de donnees...")
 init_db()
 
+# Préchauffage (SD_WARMUP_ENABLED): l'interface n'ouvre qu'une fois le modèle chaud
+if settings.SD_WARMUP_ENABLED:
+    print("\nPrechauffage du modele...")
+    warmup_state.run()
+
 # Lancer l'application Gradio
 print("\nLancement de l'interface Gradio...")
 if __name__ == "__main__":
@@ -1,126 +1,683 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
-from typing import Optional, List
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from typing import Dict, Optional, List, Tuple
+import asyncio
+import json
+import mimetypes
+import threading
 import time
-from pathlib import Path
 from sqlalchemy.orm import Session
 from app.api.schemas import (
-    GenerateRequest, GenerateResponse,
-    OptimizationRequest, OptimizationResponse
+    GenerateRequest, GenerateResponse, GeneratedImageResult,
+    OptimizationRequest, OptimizationResponse,
+    JobSubmitResponse, JobStatusResponse
 )
-from app.models.stable_diffusion import sd_generator
+from app.models.stable_diffusion import get_generator, sd_generator
+from app.models.schedulers import SCHEDULERS, get_scheduler_spec
+from app.models.admission import AdmissionRejected, get_admission_controller
 from app.models.aesthetic_scorer import aesthetic_scorer
+from app.models.warmup import warmup_state
 from app.models.rl_agent import get_rl_optimizer
 from app.utils.config import settings
-from app.utils.helpers import get_output_path
+from app.utils.image_store import image_store
+from app.utils.image_writer import PendingWrite, image_writer, resolve_image_format
 from app.utils.prompt_templates import apply_prompt_template, get_available_use_cases, get_available_styles
-from app.database.database import get_db
+from app.utils.job_queue import (
+    ANONYMOUS_USER, PRIORITIES, JobQueue, Job, JobStatus, QueueFullError, UserQueueFullError, current_job
+)
+from app.utils.result_cache import generation_cache_key, find_cached_image
+from app.utils.timings import image_timings
+from app.utils.metrics import ADMISSION_REJECTIONS, JOBS_QUEUED, JOBS_RUNNING, RESULT_CACHE
+from app.database.database import get_db, SessionLocal
 from app.database.repository import ImageRepository
 
 router = APIRouter()
 
-@router.post("/generate", response_model=GenerateResponse)
-async def generate_image(request: GenerateRequest, db: Session = Depends(get_db)):
+def _resolve_generation_params(request: GenerateRequest) -> dict:
     """
-    Génère une image avec Stable Diffusion.
+    Applique le template (use_case/style) et complète les paramètres
+    non spécifiés dans la requête avec ceux du template.
     
-    Si use_case et style sont fournis, applique le template approprié.
-    Si use_rl_optimization=True, l'agent RL optimise d'abord le prompt.
+    Scheduler: celui de la requête, sinon celui du template. Les steps et
+    le CFG du template sont réglés pour SON scheduler: si la requête en
+    choisit un autre, ce sont les valeurs recommandées par le registre
+    qui complètent la requête (ex: "lcm" → 6 steps, CFG 1.5).
+    
+    Variations (num_images): une seed par image, celles de la requête
+    ou seed, seed+1, ... (aléatoires si aucune seed n'est fixée).
+    
+    Format du fichier: celui de la requête, sinon celui du template,
+    sinon IMAGE_FORMAT.
+    
+    Raises:
+        ValueError: Scheduler, format ou qualité invalide, nombre d'images invalide
+    """
+    template_prompt, template_negative_prompt, template_params = apply_prompt_template(
+        base_prompt=request.prompt,
+        use_case=request.use_case,
+        style=request.style or "general"
+    )
+    
+    template_scheduler = template_params.get("scheduler")
+    spec = get_scheduler_spec(request.scheduler or template_scheduler)
+    default_steps = template_params.get("num_inference_steps", spec.default_steps)
+    default_guidance = template_params.get("guidance_scale", 7.5)
+    if spec.name != get_scheduler_spec(template_scheduler).name:
+        default_steps = spec.default_steps
+        default_guidance = spec.guidance_scale or default_guidance
+    
+    seeds = _resolve_seeds(request)
+    image_format = resolve_image_format(request.image_format or template_params.get("image_format"))
+    if request.image_quality is not None and not 1 <= request.image_quality <= 100:
+        raise ValueError(f"image_quality doit etre entre 1 et 100 (recu {request.image_quality})")
+    
+    # Utiliser les valeurs du template si non spécifiées dans la requête
+    return {
+        "prompt": template_prompt,
+        "negative_prompt": request.negative_prompt or template_negative_prompt,
+        "guidance_scale": request.guidance_scale or default_guidance,
+        "num_inference_steps": request.num_inference_steps or default_steps,
+        "width": request.width or template_params.get("width", 512),
+        "height": request.height or template_params.get("height", 512),
+        "seed": seeds[0],
+        "seeds": seeds,
+        "num_images": len(seeds),
+        "scheduler": spec.name,
+        "image_format": image_format,
+        "image_quality": request.image_quality,
+    }
+
+def _resolve_seeds(request: GenerateRequest) -> List[Optional[int]]:
+    """
+    Une seed par image demandée.
+    
+    Raises:
+        ValueError: num_images incohérent avec seeds, ou hors limites
     """
+    if request.seeds:
+        if request.num_images is not None and request.num_images != len(request.seeds):
+            raise ValueError(
+                f"num_images ({request.num_images}) different du nombre de seeds ({len(request.seeds)})"
+            )
+        seeds = list(request.seeds)
+    else:
+        num_images = request.num_images if request.num_images is not None else 1
+        if request.seed is None:
+            seeds = [None] * num_images
+        else:
+            seeds = [request.seed + i for i in range(num_images)]
+    if not 1 <= len(seeds) <= settings.SD_MAX_IMAGES_PER_REQUEST:
+        raise ValueError(
+            f"num_images doit etre entre 1 et {settings.SD_MAX_IMAGES_PER_REQUEST} (recu {len(seeds)})"
+        )
+    return seeds
+
+def _build_response(
+    request: GenerateRequest,
+    params: dict,
+    images: List[GeneratedImageResult],
+    cache_hit: bool = False
+) -> GenerateResponse:
+    """Construit la réponse d'une génération (nouvelle ou issue du cache)."""
+    return GenerateResponse(
+        message=(
+            "Image generated successfully" if len(images) == 1
+            else f"{len(images)} images generated successfully"
+        ),
+        prompt=request.prompt,
+        optimized_prompt=params["prompt"],  # Prompt final utilisé
+        parameters={
+            "guidance_scale": params["guidance_scale"],
+            "num_steps": params["num_inference_steps"],
+            "width": params["width"],
+            "height": params["height"],
+            "seed": params["seed"],
+            "seeds": params["seeds"],
+            "num_images": params["num_images"],
+            "scheduler": params["scheduler"]
+        },
+        score=images[0].score,
+        image_path=images[0].image_path,
+        cache_hit=cache_hit,
+        images=images,
+        timings=_mean_timings(images)
+    )
+
+def _mean_timings(images: List[GeneratedImageResult]) -> Optional[Dict[str, float]]:
+    """Temps moyens par image des étapes mesurées (None pour des images du cache)."""
+    measured = [image.timings for image in images if image.timings]
+    if not measured:
+        return None
+    stages = dict.fromkeys(stage for timings in measured for stage in timings)
+    return {stage: sum(t.get(stage, 0.0) for t in measured) / len(measured) for stage in stages}
+
+def _result_cache_keys(params: dict) -> List[Optional[str]]:
+    """Empreinte de chaque image (None sans seed ou cache désactivé)."""
+    if not settings.RESULT_CACHE_ENABLED:
+        return [None] * params["num_images"]
+    identity = sd_generator.cache_identity()
+    return [generation_cache_key(dict(params, seed=seed), identity) for seed in params["seeds"]]
+
+def _cached_response(request: GenerateRequest, params: dict, cache_keys: List[Optional[str]]) -> Optional[GenerateResponse]:
+    """
+    Réponse construite depuis des images identiques déjà générées (seeds
+    fixées), sans toucher au pipeline. None si l'une d'elles est absente
+    ou si use_cache=False.
+    """
+    if any(key is None for key in cache_keys) or not request.use_cache:
+        return None
+    db = SessionLocal()
     try:
-        # Appliquer le template selon use_case et style
-        template_prompt, template_negative_prompt, template_params = apply_prompt_template(
-            base_prompt=request.prompt,
-            use_case=request.use_case,
-            style=request.style or "general"
+        images = [find_cached_image(db, key) for key in cache_keys]
+    except Exception as e:
+        print(f"WARNING: Cache de resultats indisponible: {e}")
+        return None
+    finally:
+        db.close()
+    if any(image is None for image in images):
+        return None
+    results = [
+        GeneratedImageResult(
+            image_path=image.image_path, image_id=image.id, file_url=image.file_url,
+            thumbnail_urls=image.thumbnail_urls, score=image.score, seed=seed, file_size=image.file_size,
+            image_format=params["image_format"],
         )
-        
-        # Utiliser les valeurs du template si non spécifiées dans la requête
-        final_prompt = template_prompt
-        final_negative_prompt = request.negative_prompt or template_negative_prompt
-        final_guidance_scale = request.guidance_scale or template_params.get("guidance_scale", 7.5)
-        final_num_steps = request.num_inference_steps or template_params.get("num_inference_steps", 50)
-        final_width = request.width or template_params.get("width", 512)
-        final_height = request.height or template_params.get("height", 512)
-        
-        optimized_prompt = None
-        score = None
-        
-        # Optimisation RL du prompt (optionnel) - mettre de côté pour le moment
-        # if request.use_rl_optimization:
-        #     try:
-        #         rl_optimizer = get_rl_optimizer()
-        #         optimization_result = rl_optimizer.optimize_prompt(
-        #             base_prompt=final_prompt,
-        #             n_iterations=10
-        #         )
-        #         optimized_prompt = optimization_result['optimized_prompt']
-        #         final_prompt = optimized_prompt
-        #     except Exception as e:
-        #         # Si l'optimisation RL échoue, continuer sans optimisation
-        #         print(f"WARNING: Erreur lors de l'optimisation RL: {e}")
-        #         optimized_prompt = None
-        
-        # Génération de l'image
-        start_time = time.time()
-        image = sd_generator.generate(
+        for image, seed in zip(images, params["seeds"])
+    ]
+    return _build_response(request, params, results, cache_hit=True)
+
+def _run_generation(request: GenerateRequest) -> GenerateResponse:
+    """
+    Exécute une génération complète (handler des workers de la file).
+    
+    Tourne dans un thread worker, jamais sur la boucle d'événements:
+    génération, scoring et insertion en base. L'encodage et l'écriture des
+    fichiers sont confiés à image_writer: le worker n'attend pas qu'ils
+    soient sur disque pour passer au job suivant (taille du fichier et
+    durée d'écriture complètent le résultat et la base ensuite).
+    
+    Les variations (num_images) sont générées en un seul batch: le prompt
+    est encodé une fois, chaque image a sa seed, puis chacune est
+    écrite, scorée et insérée en base.
+    """
+    params = _resolve_generation_params(request)
+    final_prompt = params["prompt"]
+    num_images = params["num_images"]
+    
+    # Une requête identique a pu être générée pendant l'attente en file
+    cache_keys = _result_cache_keys(params)
+    cached = _cached_response(request, params, cache_keys)
+    if cached is not None:
+        return cached
+    
+    # Optimisation RL du prompt (optionnel) - mettre de côté pour le moment
+    # if request.use_rl_optimization:
+    #     try:
+    #         rl_optimizer = get_rl_optimizer()
+    #         optimization_result = rl_optimizer.optimize_prompt(
+    #             base_prompt=final_prompt,
+    #             n_iterations=10
+    #         )
+    #         optimized_prompt = optimization_result['optimized_prompt']
+    #         final_prompt = optimized_prompt
+    #     except Exception as e:
+    #         # Si l'optimisation RL échoue, continuer sans optimisation
+    #         print(f"WARNING: Erreur lors de l'optimisation RL: {e}")
+    #         optimized_prompt = None
+    
+    # Progression step par step publiée sur le job (GET /jobs/{id}/events)
+    # Annulation (DELETE /jobs/{id}, déconnexion du flux SSE) vérifiée
+    # entre deux steps de débruitage
+    job = current_job()
+    step_callback = None
+    cancel_token = None
+    if job is not None:
+        def step_callback(progress):
+            job.report_progress(progress.to_dict())
+        cancel_token = job.cancel_token
+    preview_every = request.preview_every
+    if preview_every is None:
+        preview_every = settings.SD_PREVIEW_EVERY
+    
+    # Génération des images (un seul appel pour toutes les variations)
+    # La progression du job suit la première image
+    start_time = time.time()
+    if num_images == 1:
+        images = [get_generator().generate(
             prompt=final_prompt,
-            negative_prompt=final_negative_prompt,
-            guidance_scale=final_guidance_scale,
-            num_inference_steps=final_num_steps,
-            width=final_width,
-            height=final_height,
-            seed=request.seed
+            negative_prompt=params["negative_prompt"],
+            guidance_scale=params["guidance_scale"],
+            num_inference_steps=params["num_inference_steps"],
+            width=params["width"],
+            height=params["height"],
+            seed=params["seed"],
+            step_callback=step_callback,
+            preview_every=preview_every,
+            cancel_token=cancel_token,
+            scheduler=params["scheduler"]
+        )]
+    else:
+        images = get_generator().generate_batch(
+            prompts=[final_prompt] * num_images,
+            negative_prompts=[params["negative_prompt"]] * num_images,
+            seeds=params["seeds"],
+            guidance_scale=params["guidance_scale"],
+            num_inference_steps=params["num_inference_steps"],
+            width=params["width"],
+            height=params["height"],
+            step_callbacks=[step_callback] + [None] * (num_images - 1),
+            preview_every=preview_every,
+            cancel_tokens=[cancel_token] * num_images,
+            scheduler=params["scheduler"]
         )
+    
+    # Annulé pendant le décodage final: ni sauvegarde, ni score, ni insertion
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+    
+    # Temps de génération par image (le batch est partagé)
+    generation_time = (time.time() - start_time) / num_images
+    results = []
+    writes = []
+    
+    # Fichiers nommés par leur contenu, écrits en arrière-plan (pendant le scoring)
+    for image in images:
+        writes.append(image_store.put(image, params["image_format"], params["image_quality"]))
+    
+    # Fichiers réservés jusqu'à l'insertion des lignes (voir image_store)
+    db = SessionLocal()
+    try:
+        # Scores de toutes les images en une passe vectorisée (temps réparti)
+        scoring_start = time.perf_counter()
+        scores = aesthetic_scorer.score_batch(images)
+        scoring_time = (time.perf_counter() - scoring_start) / len(images)
         
-        # Sauvegarder l'image
-        output_dir = get_output_path("portfolio")
-        timestamp = int(time.time())
-        filename = f"generated_{timestamp}.png"
-        filepath = output_dir / filename
-        image.save(str(filepath))
-        
-        # Calculer score
-        score = aesthetic_scorer.score(image)
-        
-        # Sauvegarder dans la base de données
-        generation_time = time.time() - start_time
+        for image, seed, cache_key, write, score in zip(images, params["seeds"], cache_keys, writes, scores):
+            # Temps du générateur (encodage, débruitage, décodage) + étapes suivantes
+            timings = image_timings(image)
+            timings.add("scoring", scoring_time)
+            filepath = write.path
+            
+            # Sauvegarder dans la base de données
+            # (session dédiée: on n'est pas dans le cycle d'une requête HTTP)
+            db_image = None
+            try:
+                with timings.measure("db_write"):
+                    db_image = ImageRepository.create(
+                        db=db,
+                        prompt=request.prompt,  # Prompt original de l'utilisateur
+                        image_path=str(filepath),
+                        negative_prompt=params["negative_prompt"],
+                        optimized_prompt=final_prompt,  # Prompt final utilisé (template ou optimisé)
+                        guidance_scale=params["guidance_scale"],
+                        num_inference_steps=params["num_inference_steps"],
+                        width=params["width"],
+                        height=params["height"],
+                        seed=seed,
+                        score=score,
+                        generation_time=generation_time,
+                        use_rl_optimization=request.use_rl_optimization,
+                        cache_key=cache_key,
+                        timings=timings.to_dict(),
+                    )
+            except Exception as e:
+                db.rollback()
+                print(f"WARNING: Erreur lors de la sauvegarde en base de donnees: {e}")
+            results.append(GeneratedImageResult(
+                image_path=str(filepath), score=score, seed=seed, timings=timings.to_dict(),
+                image_format=params["image_format"],
+                image_id=db_image.id if db_image is not None else None,
+                file_url=db_image.file_url if db_image is not None else None,
+                thumbnail_urls=db_image.thumbnail_urls if db_image is not None else None,
+            ))
+    finally:
+        db.close()
+        for write in writes:
+            image_store.release(write.path)
+    
+    response = _build_response(request, params, results)
+    _complete_on_write(response, writes, job)
+    return response
+
+def _complete_on_write(response: GenerateResponse, writes: List[PendingWrite], job: Optional[Job] = None) -> None:
+    """
+    Complète la réponse et la base quand chaque fichier est écrit: taille
+    du fichier et durée d'écriture (étape image_save).
+    
+    Si une écriture échoue (disque plein, droits), l'entrée de l'historique
+    est supprimée (elle désignerait un fichier absent) et le job passe en
+    échec, même s'il est déjà terminé.
+    
+    Les lecteurs du résultat attendent ces écritures (_wait_for_files).
+    """
+    lock = threading.Lock()
+    
+    def on_written(result: GeneratedImageResult, write: PendingWrite):
+        with lock:
+            result.file_size = write.result["file_size"]
+            result.timings = dict(result.timings or {}, image_save=write.result["seconds"])
+            response.timings = _mean_timings(response.images)
+        db = SessionLocal()
         try:
-            ImageRepository.create(
-                db=db,
-                prompt=request.prompt,  # Prompt original de l'utilisateur
-                image_path=str(filepath),
-                negative_prompt=final_negative_prompt,
-                optimized_prompt=final_prompt,  # Prompt final utilisé (template ou optimisé)
-                guidance_scale=final_guidance_scale,
-                num_inference_steps=final_num_steps,
-                width=final_width,
-                height=final_height,
-                seed=request.seed,
-                score=score,
-                generation_time=generation_time,
-                use_rl_optimization=request.use_rl_optimization,
+            ImageRepository.record_file(
+                db, str(write.path), write.result["file_size"], write.result["seconds"]
             )
-        except Exception as e:
-            print(f"WARNING: Erreur lors de la sauvegarde en base de donnees: {e}")
-        
-        return GenerateResponse(
-            message="Image generated successfully",
-            prompt=request.prompt,
-            optimized_prompt=final_prompt,  # Prompt final utilisé
-            parameters={
-                "guidance_scale": final_guidance_scale,
-                "num_steps": final_num_steps,
-                "width": final_width,
-                "height": final_height,
-                "seed": request.seed
-            },
-            score=score,
-            image_path=str(filepath)
+        finally:
+            db.close()
+    
+    def on_failed(result: GeneratedImageResult, write: PendingWrite):
+        if result.image_id is not None:
+            db = SessionLocal()
+            try:
+                ImageRepository.delete(db, result.image_id, delete_file=False)
+            finally:
+                db.close()
+        if job is not None:
+            generation_queue.fail(job, f"Echec de l'ecriture de {write.path}: {write.error}")
+    
+    for result, write in zip(response.images, writes):
+        write.add_done_callback(lambda write, result=result: on_written(result, write))
+        write.add_failure_callback(lambda write, result=result: on_failed(result, write))
+
+async def _wait_for_files(job: Job) -> None:
+    """Attend l'écriture des fichiers d'un job terminé (chemins lisibles, tailles connues)."""
+    if job.status != JobStatus.COMPLETED or job.result is None:
+        return
+    for image in job.result.images:
+        await asyncio.to_thread(image_writer.wait, image.image_path)
+
+def _resolve_priority(request: GenerateRequest, params: dict) -> str:
+    """
+    Classe de priorité du job.
+    
+    - "interactive": au plus JOB_INTERACTIVE_MAX_STEPS steps et une seule
+      image (un humain attend le résultat, ex: brouillon, Gradio)
+    - "batch": tout le reste
+    Sans priorité explicite, la classe découle des paramètres.
+    
+    Raises:
+        ValueError: Classe inconnue, ou "interactive" pour un job trop lourd
+    """
+    light = (
+        params["num_inference_steps"] <= settings.JOB_INTERACTIVE_MAX_STEPS
+        and params["num_images"] == 1
+    )
+    if request.priority is None:
+        return "interactive" if light else "batch"
+    if request.priority not in PRIORITIES:
+        raise ValueError(f"Priorite inconnue: '{request.priority}' (disponibles: {', '.join(PRIORITIES)})")
+    if request.priority == "interactive" and not light:
+        raise ValueError(
+            f"Priorite 'interactive' reservee aux generations d'une image en "
+            f"{settings.JOB_INTERACTIVE_MAX_STEPS} steps maximum"
         )
+    return request.priority
+
+def _request_user(request: GenerateRequest, http_request: Request) -> str:
+    """Utilisateur pour le partage équitable: user_id, sinon l'adresse du client."""
+    if request.user_id:
+        return request.user_id
+    if http_request.client is not None:
+        return f"client:{http_request.client.host}"
+    return ANONYMOUS_USER
+
+def _job_worker_count() -> int:
+    """
+    Nombre de workers de la file de jobs.
+    
+    - Micro-batching: au moins la taille d'un batch, pour que des requêtes
+      concurrentes puissent se regrouper
+    - Pool d'inférence: au moins un job par processus worker, pour les
+      occuper tous (multiplié par la taille de batch si les deux sont actifs)
+    """
+    batch_size = settings.SD_BATCH_MAX_SIZE if settings.SD_BATCH_ENABLED else 1
+    pool_workers = max(1, settings.SD_POOL_WORKERS)
+    return max(settings.JOB_WORKERS, batch_size * pool_workers)
+
+# File de jobs partagée par tous les endpoints de génération
+# Les workers sont démarrés à la première soumission
+generation_queue = JobQueue(
+    handler=_run_generation,
+    num_workers=_job_worker_count(),
+    max_queue_size=settings.JOB_QUEUE_MAX_SIZE,
+    result_ttl=settings.JOB_RESULT_TTL,
+    user_weights=settings.JOB_USER_WEIGHTS,
+    max_queued_per_user=settings.JOB_MAX_QUEUED_PER_USER,
+    interactive_workers=settings.JOB_INTERACTIVE_WORKERS,
+)
+JOBS_QUEUED.set_function(lambda: generation_queue.stats()["queued"])
+JOBS_RUNNING.set_function(lambda: generation_queue.stats()["running"])
+
+def _job_status(job: Job) -> JobStatusResponse:
+    """Construit la réponse de statut d'un job."""
+    return JobStatusResponse(
+        **job.to_dict(),
+        queue_position=generation_queue.position(job.id),
+        result=job.result if job.status == JobStatus.COMPLETED else None,
+    )
+
+@router.post("/generate", response_model=JobSubmitResponse, status_code=202)
+async def generate_image(request: GenerateRequest, http_request: Request, response: Response):
+    """
+    Soumet une génération d'image Stable Diffusion à la file de jobs.
+    
+    Retourne immédiatement un job_id. Le statut se consulte via
+    GET /jobs/{job_id} et l'image via GET /jobs/{job_id}/result.
+    
+    Cache de résultats: avec une seed explicite, si une image identique
+    (mêmes paramètres finaux, même modèle) existe déjà, la réponse est
+    200 avec status "completed" et le résultat (cache_hit=True) inclus,
+    sans passer par la file ni le pipeline.
+    
+    Si use_case et style sont fournis, applique le template approprié.
+    Si use_rl_optimization=True, l'agent RL optimise d'abord le prompt.
+    
+    Un scheduler inconnu (ou "lcm" sans poids LCM) est refusé (400)
+    avant la mise en file (liste: GET /schedulers).
+    
+    Ordonnancement: la file est partagée équitablement entre utilisateurs
+    (user_id, à défaut l'adresse du client); les jobs "interactive" (peu
+    de steps, une image) passent avant les jobs "batch". Au-delà de
+    JOB_MAX_QUEUED_PER_USER jobs en attente pour un utilisateur: 429.
+    
+    Contrôle d'admission (SD_ADMISSION_ENABLED): une génération dont la
+    mémoire crête estimée dépasse le budget est refusée (413); si le
+    travail déjà en file dépasse SD_ADMISSION_MAX_QUEUED_SECONDS, 429
+    avec un en-tête Retry-After.
+    """
+    try:
+        params = _resolve_generation_params(request)
+        sd_generator.check_scheduler(params["scheduler"])
+        priority = _resolve_priority(request, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    user_id = _request_user(request, http_request)
+    cache_keys = _result_cache_keys(params)
+    cached = _cached_response(request, params, cache_keys)
+    if request.use_cache and all(key is not None for key in cache_keys):
+        RESULT_CACHE.labels(result="hit" if cached is not None else "miss").inc()
+    if cached is not None:
+        job = generation_queue.add_completed(request, cached, user_id=user_id, priority=priority)
+        response.status_code = 200
+    else:
+        cost = 0.0
+        if settings.SD_ADMISSION_ENABLED:
+            controller = get_admission_controller()
+            estimate = controller.estimate(params["width"], params["height"],
+                                           params["num_inference_steps"], params["num_images"])
+            try:
+                # Seul le travail servi avant ce job compte (un job interactif
+                # passe devant les jobs batch en file)
+                controller.check(estimate, generation_queue.queued_cost(priority), generation_queue.num_workers)
+            except AdmissionRejected as e:
+                ADMISSION_REJECTIONS.labels(status=e.status_code).inc()
+                headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+                raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+            cost = estimate.seconds
+        try:
+            job = generation_queue.submit(request, cost=cost, user_id=user_id, priority=priority)
+        except UserQueueFullError as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        except QueueFullError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    
+    return JobSubmitResponse(
+        job_id=job.id,
+        status=job.status.value,
+        queue_position=generation_queue.position(job.id),
+        status_url=http_request.url_for("get_job_status", job_id=job.id).path,
+        result_url=http_request.url_for("get_job_result", job_id=job.id).path,
+        events_url=http_request.url_for("stream_job_events", job_id=job.id).path,
+        result=cached,
+    )
+
+@router.get("/jobs")
+async def get_jobs_stats():
+    """
+    Profondeur de la file de génération et compteurs de jobs.
+    
+    Par utilisateur (users): jobs en attente et en cours, poids, attente
+    moyenne et maximale, attente du plus ancien job en file.
+    
+    Avec le contrôle d'admission: occupation du budget mémoire
+    (budget, mémoire réservée, générations en attente, refus).
+    """
+    stats = generation_queue.stats()
+    if settings.SD_ADMISSION_ENABLED:
+        stats["queued_seconds"] = generation_queue.queued_cost()
+        stats["admission"] = get_admission_controller().stats()
+    return stats
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    """Statut, position dans la file et résultat (si terminé) d'un job."""
+    job = generation_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    await _wait_for_files(job)
+    return _job_status(job)
+
+# Intervalle de scrutation de l'état d'un job pour le flux SSE (secondes)
+SSE_POLL_INTERVAL = 0.25
+
+def _sse_event(event: str, data: dict) -> str:
+    """Formate un événement Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@router.delete("/jobs/{job_id}", response_model=JobStatusResponse)
+async def cancel_job(job_id: str):
+    """
+    Annule un job: retiré de la file s'il attend, interrompu au step
+    suivant s'il est en cours (rien n'est sauvegardé). Sans effet sur un
+    job terminé.
+    """
+    job = generation_queue.cancel(job_id, reason="Annule par le client")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_status(job)
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, http_request: Request, cancel_on_disconnect: bool = True):
+    """
+    Flux Server-Sent Events (text/event-stream) d'un job.
+    
+    Événements:
+    - status: changement d'état (queued → running), avec position en file
+    - progress: step, total_steps, progress, elapsed, eta, et "preview"
+      (data URL JPEG basse résolution) quand un nouvel aperçu est disponible
+    - completed: résultat final (GenerateResponse), fin du flux
+    - failed: message d'erreur, fin du flux
+    - cancelled: job annulé, fin du flux
+    
+    Si le client se déconnecte avant la fin, le job est annulé (il n'a
+    plus de destinataire), sauf avec cancel_on_disconnect=false pour un
+    client qui compte se reconnecter.
+    
+    Exemple: curl -N http://localhost:8000/api/v1/jobs/<job_id>/events
+    """
+    job = generation_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        try:
+            async for event in _job_events(job):
+                if await http_request.is_disconnected():
+                    break
+                yield event
+        finally:
+            # Déconnexion (ou flux interrompu par le serveur) avant la fin
+            if cancel_on_disconnect and not job.is_finished:
+                generation_queue.cancel(job.id, reason="Client deconnecte")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _job_events(job: Job):
+    """Événements SSE successifs d'un job, jusqu'à sa fin."""
+    last_status = None
+    last_progress = None
+    last_preview = None
+    while True:
+        if job.status != last_status:
+            last_status = job.status
+            yield _sse_event("status", {
+                "status": job.status.value,
+                "queue_position": generation_queue.position(job.id),
+            })
         
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        # Lecture unique: le job remplace ces références en bloc
+        progress, preview = job.progress, job.preview
+        if progress is not None and progress is not last_progress:
+            last_progress = progress
+            data = dict(progress)
+            if preview is not last_preview:
+                last_preview = preview
+                data["preview"] = preview
+            yield _sse_event("progress", data)
+        
+        if job.status == JobStatus.COMPLETED:
+            # Une écriture en échec fait passer le job en FAILED
+            await _wait_for_files(job)
+        if job.status == JobStatus.COMPLETED:
+            yield _sse_event("completed", job.result.model_dump())
+            return
+        if job.status == JobStatus.FAILED:
+            yield _sse_event("failed", {"error": job.error})
+            return
+        if job.status == JobStatus.CANCELLED:
+            yield _sse_event("cancelled", {"reason": job.error})
+            return
+        
+        await asyncio.sleep(SSE_POLL_INTERVAL)
+
+@router.get("/jobs/{job_id}/result", response_model=GenerateResponse)
+async def get_job_result(job_id: str):
+    """
+    Résultat final d'un job (GenerateResponse).
+    
+    - 200: job terminé avec succès (fichiers écrits sur disque)
+    - 202: job encore en file ou en cours (corps = statut)
+    - 404: job inconnu ou expiré
+    - 409: job annulé
+    - 500: job en échec
+    """
+    job = generation_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == JobStatus.CANCELLED:
+        raise HTTPException(status_code=409, detail=f"Job cancelled: {job.error}")
+    if job.status not in (JobStatus.COMPLETED, JobStatus.FAILED):
+        return JSONResponse(status_code=202, content=_job_status(job).model_dump())
+    # Une écriture en échec fait passer le job en FAILED
+    await _wait_for_files(job)
+    if job.status == JobStatus.FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    return job.result
 
 @router.post("/optimize", response_model=OptimizationResponse)
 async def optimize_prompt(request: OptimizationRequest):
@@ -151,6 +708,61 @@ async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "service": "AI Creative Studio"}
 
+@router.get("/ready")
+async def readiness_check():
+    """
+    Readiness (load balancer): 200 si l'instance peut recevoir du trafic.
+    
+    Avec SD_WARMUP_ENABLED, 503 tant que le préchauffage (chargement,
+    générations de warm-up, score) n'est pas terminé, ou s'il a échoué.
+    Sans warm-up, toujours prête (modèle chargé à la première requête).
+    """
+    body = {"ready": warmup_state.is_ready, "warmup": warmup_state.to_dict(), "model": sd_generator.state}
+    if settings.SD_POOL_WORKERS > 0:
+        from app.models.inference_pool import get_inference_pool
+        body["pool"] = get_inference_pool().stats()
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+def _model_status() -> dict:
+    """État du générateur local, et des workers du pool s'il est activé."""
+    status = sd_generator.get_status()
+    if settings.SD_POOL_WORKERS > 0:
+        # Les pipelines vivent dans les processus workers du pool
+        from app.models.inference_pool import get_inference_pool
+        status["pool"] = get_inference_pool().stats()
+    return status
+
+@router.get("/model/status")
+async def get_model_status():
+    """
+    État du modèle Stable Diffusion: unloaded, loading (avec étape et
+    progression), ready ou failed. Ne déclenche jamais de chargement.
+    """
+    return _model_status()
+
+@router.post("/model/load", status_code=202)
+async def load_model():
+    """
+    Déclenche le chargement du modèle en arrière-plan (warm-up explicite).
+    
+    Sans cet appel, le modèle est chargé par la première génération.
+    Suivre la progression via GET /model/status.
+    """
+    if settings.SD_POOL_WORKERS > 0:
+        # Chaque worker charge son pipeline au démarrage de son processus
+        from app.models.inference_pool import get_inference_pool
+        get_inference_pool().start()
+    elif not sd_generator.is_loaded and sd_generator.state != "loading":
+        threading.Thread(target=_load_model_quietly, name="model-loader", daemon=True).start()
+    return _model_status()
+
+def _load_model_quietly():
+    """Chargement en arrière-plan: l'erreur est exposée par /model/status."""
+    try:
+        sd_generator.load()
+    except Exception:
+        pass
+
 @router.get("/history")
 async def get_history(
     skip: int = 0,
@@ -190,6 +802,131 @@ async def get_image(image_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Fichiers nommés par leur contenu: jamais modifiés, cachables indéfiniment
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """En-tête If-None-Match (liste d'ETags ou "*", comparaison faible)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def _byte_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Plage (début, fin incluse) d'un en-tête Range "bytes=a-b", "bytes=a-"
+    ou "bytes=-n".
+    
+    None si l'en-tête est absent, invalide ou demande plusieurs plages:
+    le fichier est alors servi entier (200), comme le permet la RFC 9110.
+    
+    Raises:
+        ValueError: Plage hors du fichier (416)
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep or not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None
+    if not first:
+        # Suffixe: les n derniers octets
+        if int(last) == 0 or file_size == 0:
+            raise ValueError("empty suffix range")
+        return max(0, file_size - int(last)), file_size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= file_size:
+        raise ValueError("range starts after end of file")
+    return start, min(int(last), file_size - 1) if last else file_size - 1
+
+def _read_range(path: str, start: int, end: int) -> bytes:
+    """Octets start..end (inclus) d'un fichier."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start + 1)
+
+async def _file_response(path: str, http_request: Request) -> Response:
+    """
+    Sert un fichier image du stockage.
+    
+    - Range (une plage d'octets): 206 avec Content-Range, 416 hors du
+      fichier; If-Range différent de l'ETag → fichier entier. Géré ici et
+      non par FileResponse, qui ne le fait qu'à partir de Starlette 0.39
+    - Fichier entier: FileResponse (extension ASGI "pathsend" si le
+      serveur et Starlette la prennent en charge)
+    - Fichier du stockage par contenu: ETag fort = empreinte SHA-256
+      (suivie de la taille pour une miniature), Cache-Control immutable,
+      If-None-Match → 304 sans ouvrir le fichier
+    - Fichier non migré (nom horodaté): ETag de Starlette (date + taille)
+    """
+    # Attend une écriture en cours (fichier lisible, taille définitive)
+    info = await asyncio.to_thread(image_store.stat, path)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Image file not found")
+    headers = {"Accept-Ranges": "bytes"}
+    if info["etag"] is not None:
+        headers.update({"ETag": f'"{info["etag"]}"', "Cache-Control": IMMUTABLE_CACHE_CONTROL})
+        if _etag_matches(http_request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+    
+    # If-Range: plage servie seulement si la version du client est à jour
+    # (comparaison forte; sans ETag du stockage, fichier entier)
+    if_range = http_request.headers.get("if-range")
+    if if_range is None or if_range.strip() == headers.get("ETag"):
+        file_size = info["file_size"]
+        try:
+            byte_range = _byte_range(http_request.headers.get("range"), file_size)
+        except ValueError:
+            return Response(status_code=416, headers=dict(headers, **{"Content-Range": f"bytes */{file_size}"}))
+        if byte_range is not None:
+            start, end = byte_range
+            content = await asyncio.to_thread(_read_range, path, start, end)
+            headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+            return Response(
+                content=content, status_code=206, headers=headers, media_type=mimetypes.guess_type(path)[0]
+            )
+    return FileResponse(path, headers=headers, media_type=mimetypes.guess_type(path)[0])
+
+@router.api_route("/images/{image_id}/file", methods=["GET", "HEAD"])
+async def get_image_file(image_id: int, http_request: Request, db: Session = Depends(get_db)):
+    """
+    Fichier d'une image (PNG, WebP ou JPEG), sans passer par le volume partagé.
+    
+    Cachable par un CDN (ETag fort, immutable). Gère If-None-Match (304),
+    Range / If-Range (206, 416) et HEAD.
+    
+    Exemple: curl -O http://localhost:8000/api/v1/images/42/file
+    """
+    image = ImageRepository.get_by_id(db=db, image_id=image_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return await _file_response(image.image_path, http_request)
+
+@router.api_route("/images/{image_id}/thumbnails/{size}", methods=["GET", "HEAD"])
+async def get_image_thumbnail(image_id: int, size: int, http_request: Request, db: Session = Depends(get_db)):
+    """
+    Miniature WebP d'une image (côté le plus long = size, voir
+    IMAGE_THUMBNAIL_SIZES), pour l'historique et la galerie.
+    
+    Mêmes en-têtes que /images/{id}/file. 404 pour une taille non
+    configurée ou une miniature pas encore écrite (image antérieure:
+    python -m app.utils.image_store --thumbnails).
+    
+    Exemple: <img src="/api/v1/images/42/thumbnails/256">
+    """
+    if size not in image_store.thumbnail_sizes:
+        raise HTTPException(status_code=404, detail=f"Thumbnail size not available: {size}")
+    image = ImageRepository.get_by_id(db=db, image_id=image_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Les miniatures sont confiées au pool une fois l'image écrite
+    await asyncio.to_thread(image_writer.wait, image.image_path)
+    return await _file_response(str(image_store.thumbnail_path(image.image_path, size)), http_request)
+
 @router.get("/search")
 async def search_images(
     query: str,
@@ -241,18 +978,16 @@ async def get_statistics(db: Session = Depends(get_db)):
 
 @router.delete("/images/{image_id}")
 async def delete_image(image_id: int, db: Session = Depends(get_db)):
-    """Supprime une image de la base de données (et son fichier)"""
+    """Supprime une image de la base de données (et son fichier s'il n'est plus partagé)"""
     try:
         image = ImageRepository.get_by_id(db=db, image_id=image_id)
         if not image:
             raise HTTPException(status_code=404, detail="Image not found")
         
-        # Supprimer le fichier
-        image_path = Path(image.image_path)
-        if image_path.exists():
-            image_path.unlink()
+        # Fichier en cours d'écriture: attendre sans bloquer la boucle
+        await asyncio.to_thread(image_writer.wait, image.image_path)
         
-        # Supprimer de la base de données
+        # Supprimer de la base de données (et le fichier s'il n'est plus partagé)
         ImageRepository.delete(db=db, image_id=image_id)
         
         return {"message": "Image deleted successfully", "image_id": image_id}
@@ -285,6 +1020,23 @@ async def get_use_cases():
         }
     }
 
+@router.get("/schedulers")
+async def get_schedulers():
+    """
+    Schedulers (samplers) sélectionnables via le champ "scheduler" de /generate.
+    
+    "lcm" n'est disponible qu'avec des poids distillés LCM; tant que le
+    modèle n'est pas chargé, sa disponibilité est inconnue (None).
+    """
+    lcm_available = sd_generator.lcm_available if sd_generator.is_loaded else None
+    return {
+        "default": get_scheduler_spec(None).name,
+        "schedulers": [
+            spec.to_dict(available=lcm_available if spec.requires_lcm else True)
+            for spec in SCHEDULERS.values()
+        ],
+    }
+
 @router.get("/")
 async def root():
     """Root endpoint avec instructions."""
@@ -292,15 +1044,26 @@ async def root():
         "message": "Welcome to AI Creative Studio API",
         "docs": "/docs",
         "endpoints": {
-            "/generate": "Generate images with Stable Diffusion",
+            "/generate": "Submit an image generation job (Stable Diffusion)",
+            "/jobs": "Generation queue depth and job counters",
+            "/jobs/{job_id}": "Get job status and queue position",
+            "/jobs/{job_id}/events": "Stream job progress and previews (Server-Sent Events)",
+            "DELETE /jobs/{job_id}": "Cancel a queued or running job",
+            "/jobs/{job_id}/result": "Get the result of a finished job",
             "/optimize": "Optimize prompts using RL agent (disabled for now)",
             "/use-cases": "Get available use cases and styles",
+            "/schedulers": "Get available schedulers (samplers) and their default steps",
             "/history": "Get generation history",
             "/images/{id}": "Get image metadata by ID",
+            "/images/{id}/file": "Download an image file (ETag, Range)",
+            "/images/{id}/thumbnails/{size}": "Download a WebP thumbnail of an image",
             "/search": "Search images by prompt",
             "/best": "Get best scored images",
             "/statistics": "Get global statistics",
-            "/health": "Health check"
+            "/model/status": "Stable Diffusion model load state and progress",
+            "/model/load": "Trigger model loading in the background (warm-up)",
+            "/health": "Health check",
+            "/ready": "Readiness: 503 until the startup warm-up is done"
         }
     }
 
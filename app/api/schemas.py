@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
 class GenerateRequest(BaseModel):
     prompt: str
@@ -9,17 +9,41 @@ class GenerateRequest(BaseModel):
     width: Optional[int] = None  # None = auto selon use_case
     height: Optional[int] = None  # None = auto selon use_case
     seed: Optional[int] = None
+    num_images: Optional[int] = None  # Variations du même prompt (None = len(seeds) ou 1)
+    seeds: Optional[List[int]] = None  # Une seed par variation (défaut: seed, seed+1, ...)
     use_rl_optimization: bool = False
     use_case: Optional[str] = None  # "logo", "marketing", "game_assets", "artistic"
     style: Optional[str] = "general"  # Style spécifique du cas d'usage
+    scheduler: Optional[str] = None  # "dpmpp", "euler", "unipc", "lcm"... (None = auto selon use_case)
+    preview_every: Optional[int] = None  # Aperçu tous les k steps (None = SD_PREVIEW_EVERY, 0 = aucun)
+    use_cache: bool = True  # False = régénère même si une image identique existe (seed fixée)
+    user_id: Optional[str] = None  # Partage équitable de la file (None = adresse du client)
+    priority: Optional[str] = None  # "interactive" ou "batch" (None = interactive si peu de steps)
+    image_format: Optional[str] = None  # "png", "webp_lossless", "webp", "jpeg" (None = auto selon use_case)
+    image_quality: Optional[int] = None  # 1-100, formats avec perte (None = IMAGE_*_QUALITY)
+
+class GeneratedImageResult(BaseModel):
+    """Une image d'une génération (une par variation)"""
+    image_path: str
+    image_id: Optional[int] = None  # Ligne de l'historique (None si l'insertion a échoué)
+    file_url: Optional[str] = None  # Fichier servi par l'API (GET /images/{id}/file)
+    thumbnail_urls: Optional[Dict[int, str]] = None  # Miniatures WebP par taille (GET /images/{id}/thumbnails/{size})
+    score: Optional[float] = None
+    seed: Optional[int] = None
+    timings: Optional[Dict[str, float]] = None  # Secondes par étape (voir app/utils/timings.py)
+    image_format: Optional[str] = None  # Format du fichier (voir app/utils/image_writer.py)
+    file_size: Optional[int] = None  # Octets (None tant que l'écriture n'est pas terminée)
 
 class GenerateResponse(BaseModel):
     message: str
     prompt: str
     optimized_prompt: Optional[str] = None
     parameters: Dict
-    score: Optional[float] = None
-    image_path: Optional[str] = None
+    score: Optional[float] = None  # Première image (voir images)
+    image_path: Optional[str] = None  # Première image (voir images)
+    cache_hit: bool = False  # True = image existante réutilisée (même seed et paramètres)
+    images: List[GeneratedImageResult] = []  # Toutes les variations, dans l'ordre des seeds
+    timings: Optional[Dict[str, float]] = None  # Moyenne par image des temps par étape (None si cache)
 
 class OptimizationRequest(BaseModel):
     base_prompt: str
@@ -55,3 +79,29 @@ class StatsResponse(BaseModel):
     average_score: Optional[float]
     rl_agent_trained_steps: Optional[int] = None
 
+
+
+class JobSubmitResponse(BaseModel):
+    """Réponse immédiate de POST /generate: le job est en file d'attente"""
+    job_id: str
+    status: str
+    queue_position: Optional[int] = None
+    status_url: str
+    result_url: str
+    events_url: Optional[str] = None  # Flux SSE de progression
+    result: Optional[GenerateResponse] = None  # Présent si déjà terminé (cache hit)
+
+
+class JobStatusResponse(BaseModel):
+    """Statut d'un job de génération (GET /jobs/{job_id})"""
+    job_id: str
+    status: str  # "queued", "running", "completed", "failed", "cancelled"
+    user_id: Optional[str] = None
+    priority: Optional[str] = None  # "interactive" ou "batch"
+    queue_position: Optional[int] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    progress: Optional[Dict] = None  # step, total_steps, progress, elapsed, eta (pendant l'exécution)
+    result: Optional[GenerateResponse] = None
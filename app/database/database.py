@@ -22,7 +22,8 @@ POURQUOI SQLITE ?
 ✅ Performant: Suffisant pour des milliers d'images
 ⚠️ Limite: Pas adapté pour production multi-utilisateurs intense
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session
 from app.utils.config import settings
 from app.database.models import Base
@@ -95,8 +96,68 @@ def init_db():
     # create_all() génère et exécute les CREATE TABLE
     # C'est la "magie" de l'ORM SQLAlchemy
     Base.metadata.create_all(bind=engine)
+    
+    # create_all() ne modifie pas les tables existantes: on ajoute les
+    # colonnes apparues depuis la création de la base
+    migrate_schema(engine)
     print(f"OK: Base de donnees initialisee : {settings.DATABASE_URL}")
 
+def migrate_schema(bind: Engine) -> None:
+    """
+    Ajoute aux tables existantes les colonnes (et index) définis dans
+    models.py mais absents de la base.
+    
+    POURQUOI ?
+    ----------
+    Base.metadata.create_all() crée les tables manquantes mais ne touche
+    jamais une table existante. Une base créée avant l'ajout d'une colonne
+    (ex: cache_key) provoquerait des erreurs "no such column".
+    
+    Un index devenu non unique dans models.py (ex: image_path, partagé par
+    les images identiques du stockage par contenu) est recréé sans la
+    contrainte d'unicité.
+    
+    LIMITES:
+    --------
+    Migration volontairement minimale (pas d'Alembic):
+    - Uniquement des ajouts de colonnes NULLABLES (ALTER TABLE ADD COLUMN)
+    - Pas de renommage ni de suppression de colonne
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_indexes = {index["name"]: index for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            existing = existing_indexes.get(index.name)
+            if existing is not None and existing["unique"] and not index.unique:
+                with bind.begin() as connection:
+                    connection.execute(text(f'DROP INDEX {index.name}'))
+                index.create(bind=bind)
+                print(f"INFO: Index rendu non unique: {table.name}.{index.name}")
+        
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing_columns]
+        if not missing:
+            continue
+        
+        with bind.begin() as connection:
+            for column in missing:
+                column_type = column.type.compile(dialect=bind.dialect)
+                connection.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                ))
+                print(f"INFO: Colonne ajoutee: {table.name}.{column.name}")
+        
+        # Index des nouvelles colonnes (index=True dans models.py)
+        missing_names = {column.name for column in missing}
+        for index in table.indexes:
+            if any(column.name in missing_names for column in index.columns):
+                index.create(bind=bind, checkfirst=True)
+
 def get_db() -> Session:
     """
     Generator qui fournit une session DB et garantit sa fermeture.
@@ -33,6 +33,8 @@ Exemple:
 from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, timezone
+from app.utils.config import settings
+from app.utils.image_store import image_store
 
 # Base class pour tous les modèles SQLAlchemy
 # Tous nos modèles héritent de Base
@@ -143,11 +145,16 @@ class GeneratedImage(Base):
     # nullable=True: Peut être NULL si erreur de calcul
     score = Column(Float, nullable=True, index=True)
     
-    # Chemin vers le fichier image physique
-    # Ex: "outputs/portfolio/generated_1732190561.png"
-    # unique=True: Chaque image a un chemin unique
+    # Chemin vers le fichier image physique, nommé par son contenu
+    # Ex: "outputs/portfolio/3f/2a/3f2a9c1e....png" (voir app/utils/image_store.py)
+    # Pas unique: des images identiques partagent le même fichier
     # index=True: Recherche rapide par chemin
-    image_path = Column(String(500), nullable=False, unique=True, index=True)
+    image_path = Column(String(500), nullable=False, index=True)
+    
+    # Taille du fichier en octets (voir app/utils/image_writer.py)
+    # Renseignée une fois l'encodage terminé, hors du chemin de la génération
+    # NULL = écriture en cours, échouée ou antérieure à cette colonne
+    file_size = Column(Integer, nullable=True)
     
     # ========================================
     # MÉTADONNÉES ADDITIONNELLES
@@ -158,11 +165,43 @@ class GeneratedImage(Base):
     # Ex: 58.3 secondes sur CPU, 8.2 secondes sur GPU
     generation_time = Column(Float, nullable=True)
     
+    # Temps par étape en secondes (voir app/utils/timings.py)
+    # Part de cette image quand elle a été générée dans un batch
+    # Permet de voir QUELLE étape ralentit d'une version ou d'une machine à l'autre
+    # NULL = image enregistrée avant leur introduction
+    text_encoding_time = Column(Float, nullable=True)   # Encodage CLIP des prompts
+    denoising_time = Column(Float, nullable=True)       # Boucle de débruitage UNet
+    denoising_step_time = Column(Float, nullable=True)  # Moyenne par step
+    vae_decode_time = Column(Float, nullable=True)      # Décodage VAE des latents
+    image_save_time = Column(Float, nullable=True)      # Encodage et écriture du fichier
+    scoring_time = Column(Float, nullable=True)         # Score esthétique
+    # db_write n'est pas stocké: il se mesure autour de l'insertion de la ligne elle-même
+    
     # Indique si l'optimisation RL a été utilisée
     # True: Prompt optimisé par l'agent RL
     # False: Génération directe sans RL
     use_rl_optimization = Column(Boolean, default=False, nullable=False)
     
+    # Empreinte SHA-256 des paramètres qui déterminent entièrement l'image
+    # (prompt final, negative prompt, guidance, steps, taille, seed,
+    # modèle, scheduler, device, dtype) - voir app/utils/result_cache.py
+    # NULL = génération sans seed (non reproductible, jamais réutilisée)
+    # index=True: Recherche instantanée d'une image déjà générée
+    cache_key = Column(String(64), nullable=True, index=True)
+    
+    @property
+    def file_url(self) -> str:
+        """URL du fichier servi par l'API (GET /images/{id}/file)."""
+        return f"{settings.API_PREFIX}/images/{self.id}/file"
+    
+    @property
+    def thumbnail_urls(self) -> dict:
+        """URLs des miniatures par taille (GET /images/{id}/thumbnails/{size})."""
+        return {
+            size: f"{settings.API_PREFIX}/images/{self.id}/thumbnails/{size}"
+            for size in image_store.thumbnail_sizes
+        }
+    
     def to_dict(self):
         """
         Convertit l'objet SQLAlchemy en dictionnaire Python standard.
@@ -200,8 +239,20 @@ class GeneratedImage(Base):
             "seed": self.seed,
             "score": self.score,
             "image_path": self.image_path,
+            "file_url": self.file_url,
+            "thumbnail_urls": self.thumbnail_urls,
+            "file_size": self.file_size,
             "generation_time": self.generation_time,
+            "timings": {
+                "text_encoding": self.text_encoding_time,
+                "denoising": self.denoising_time,
+                "denoising_step": self.denoising_step_time,
+                "vae_decode": self.vae_decode_time,
+                "image_save": self.image_save_time,
+                "scoring": self.scoring_time,
+            },
             "use_rl_optimization": self.use_rl_optimization,
+            "cache_key": self.cache_key,
         }
 
 
@@ -41,9 +41,11 @@ REPOSITORIES DISPONIBLES:
 """
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 from app.database.models import GeneratedImage, UserFeedback
+from app.utils.image_store import image_store
+from app.utils.metrics import track_query
 
 class ImageRepository:
     """
@@ -62,6 +64,7 @@ class ImageRepository:
     """
     
     @staticmethod
+    @track_query("create")
     def create(
         db: Session,
         prompt: str,
@@ -76,6 +79,8 @@ class ImageRepository:
         score: Optional[float] = None,
         generation_time: Optional[float] = None,
         use_rl_optimization: bool = False,
+        cache_key: Optional[str] = None,
+        timings: Optional[Dict[str, float]] = None,
     ) -> GeneratedImage:
         """
         Crée une nouvelle entrée d'image générée dans la base de données.
@@ -108,6 +113,8 @@ class ImageRepository:
             prompt: Prompt original de l'utilisateur
             image_path: Chemin vers le fichier image
             [... tous les autres paramètres de génération ...]
+            timings: Temps par étape (StageTimings.to_dict()), stockés dans
+                     les colonnes <étape>_time
         
         Returns:
             GeneratedImage: L'objet créé avec son ID assigné
@@ -126,7 +133,12 @@ class ImageRepository:
             image_path=image_path,
             generation_time=generation_time,
             use_rl_optimization=use_rl_optimization,
+            cache_key=cache_key,
         )
+        for stage, seconds in (timings or {}).items():
+            column = f"{stage}_time"
+            if hasattr(GeneratedImage, column):
+                setattr(db_image, column, seconds)
         
         # Ajouter à la session (staging area)
         db.add(db_image)
@@ -140,16 +152,56 @@ class ImageRepository:
         return db_image
     
     @staticmethod
+    @track_query("record_file")
+    def record_file(db: Session, image_path: str, file_size: int, image_save_time: float) -> bool:
+        """
+        Complète les images d'un fichier une fois écrit (taille, durée
+        d'encodage): l'écriture se termine après l'insertion de la ligne.
+        Les images identiques partagent le fichier (voir image_store): les
+        lignes déjà complétées gardent la durée de la première écriture.
+        
+        Returns:
+            bool: False si aucune image à compléter n'a ce chemin
+        """
+        updated = (
+            db.query(GeneratedImage)
+            .filter(GeneratedImage.image_path == image_path, GeneratedImage.file_size.is_(None))
+            .update({"file_size": file_size, "image_save_time": image_save_time})
+        )
+        db.commit()
+        return updated > 0
+    
+    @staticmethod
+    @track_query("get_by_id")
     def get_by_id(db: Session, image_id: int) -> Optional[GeneratedImage]:
         """Récupère une image par son ID"""
         return db.query(GeneratedImage).filter(GeneratedImage.id == image_id).first()
     
     @staticmethod
+    @track_query("get_by_path")
     def get_by_path(db: Session, image_path: str) -> Optional[GeneratedImage]:
         """Récupère une image par son chemin"""
         return db.query(GeneratedImage).filter(GeneratedImage.image_path == image_path).first()
     
     @staticmethod
+    @track_query("get_by_cache_key")
+    def get_by_cache_key(db: Session, cache_key: str) -> List[GeneratedImage]:
+        """
+        Récupère les images générées avec exactement les mêmes paramètres
+        (même empreinte), les plus récentes en premier.
+        
+        Plusieurs lignes sont possibles (fichier supprimé puis régénéré):
+        l'appelant choisit la première dont le fichier existe encore.
+        """
+        return (
+            db.query(GeneratedImage)
+            .filter(GeneratedImage.cache_key == cache_key)
+            .order_by(desc(GeneratedImage.created_at))
+            .all()
+        )
+    
+    @staticmethod
+    @track_query("get_all")
     def get_all(
         db: Session,
         skip: int = 0,
@@ -226,6 +278,7 @@ class ImageRepository:
         return query.offset(skip).limit(limit).all()
     
     @staticmethod
+    @track_query("search_by_prompt")
     def search_by_prompt(
         db: Session,
         prompt_search: str,
@@ -258,6 +311,7 @@ class ImageRepository:
         ).order_by(desc(GeneratedImage.created_at)).offset(skip).limit(limit).all()
     
     @staticmethod
+    @track_query("get_best_scored")
     def get_best_scored(
         db: Session,
         limit: int = 10
@@ -278,6 +332,7 @@ class ImageRepository:
         ).order_by(desc(GeneratedImage.score)).limit(limit).all()
     
     @staticmethod
+    @track_query("get_statistics")
     def get_statistics(db: Session) -> dict:
         """
         Calcule des statistiques globales sur toutes les images.
@@ -291,6 +346,7 @@ class ImageRepository:
         - min_score: Pire score obtenu
         - with_rl_optimization: Nombre avec RL
         - without_rl_optimization: Nombre sans RL
+        - average_timings: Temps moyen de chaque étape (secondes par image)
         
         Utilisé dans:
         - Onglet Statistiques de Gradio
@@ -333,6 +389,20 @@ class ImageRepository:
             GeneratedImage.use_rl_optimization == True
         ).scalar()
         
+        # ========================================
+        # TEMPS MOYEN PAR ÉTAPE
+        # ========================================
+        # AVG ignore les NULL (images antérieures aux colonnes de temps)
+        stage_columns = {
+            "text_encoding": GeneratedImage.text_encoding_time,
+            "denoising": GeneratedImage.denoising_time,
+            "denoising_step": GeneratedImage.denoising_step_time,
+            "vae_decode": GeneratedImage.vae_decode_time,
+            "image_save": GeneratedImage.image_save_time,
+            "scoring": GeneratedImage.scoring_time,
+        }
+        averages = db.query(*[func.avg(column) for column in stage_columns.values()]).one()
+        
         # ========================================
         # CONSTRUCTION DU DICTIONNAIRE
         # ========================================
@@ -346,15 +416,30 @@ class ImageRepository:
             "min_score": min_score,
             "with_rl_optimization": with_rl or 0,
             "without_rl_optimization": (total or 0) - (with_rl or 0),
+            "average_timings": {
+                stage: round(value, 4) if value is not None else None
+                for stage, value in zip(stage_columns, averages)
+            },
         }
     
     @staticmethod
-    def delete(db: Session, image_id: int) -> bool:
-        """Supprime une image de la base de données"""
+    @track_query("delete")
+    def delete(db: Session, image_id: int, delete_file: bool = True) -> bool:
+        """
+        Supprime une image de la base de données, et son fichier quand plus
+        aucune image ne le partage (stockage par contenu, voir image_store).
+        """
         db_image = db.query(GeneratedImage).filter(GeneratedImage.id == image_id).first()
         if db_image:
+            image_path = db_image.image_path
             db.delete(db_image)
             db.commit()
+            if delete_file:
+                # Revérifié juste avant la suppression: une génération
+                # concurrente a pu réutiliser le fichier entre-temps
+                image_store.delete(image_path, referenced=lambda: db.query(GeneratedImage.id).filter(
+                    GeneratedImage.image_path == image_path
+                ).first() is not None)
             return True
         return False
 
@@ -4,12 +4,18 @@ Interface web interactive pour génération d'images avec Stable Diffusion et op
 """
 import gradio as gr
 from PIL import Image
+import queue
+import threading
 import time
 from pathlib import Path
-from app.models.stable_diffusion import sd_generator
+from app.models.stable_diffusion import get_generator
+from app.models.schedulers import SCHEDULERS, get_scheduler_spec
+from app.utils.config import settings
+from app.utils.cancellation import CancellationToken
+from app.utils.timings import image_timings
 from app.models.aesthetic_scorer import aesthetic_scorer
 from app.models.rl_agent import get_rl_optimizer
-from app.utils.helpers import get_output_path
+from app.utils.image_store import image_store
 from app.utils.prompt_templates import apply_prompt_template, get_available_use_cases, get_available_styles
 from app.database.database import SessionLocal, init_db
 from app.database.repository import ImageRepository
@@ -34,12 +40,32 @@ def temperature_to_params(temperature: float):
     
     return guidance_scale, num_steps
 
+def _record_file(write):
+    """Complète l'image en base une fois son fichier écrit (taille, durée d'écriture)."""
+    db = SessionLocal()
+    try:
+        ImageRepository.record_file(db, str(write.path), write.result["file_size"], write.result["seconds"])
+    finally:
+        db.close()
+
+def _drop_unwritten(image_id, write):
+    """Supprime l'entrée de l'historique d'une image dont l'écriture a échoué (fichier absent)."""
+    print(f"WARNING: Echec de l'ecriture de {write.path}, image retiree de l'historique: {write.error}")
+    if image_id is None:
+        return
+    db = SessionLocal()
+    try:
+        ImageRepository.delete(db, image_id, delete_file=False)
+    finally:
+        db.close()
+
 def generate_image(
     prompt: str,
     use_case: str = None,
     style: str = "general",
     temperature: float = 0.5,  # Réduit de 0.7 à 0.5 pour meilleur équilibre vitesse/qualité
-    use_rl_optimization: bool = False
+    use_rl_optimization: bool = False,
+    scheduler: str = "auto"
 ):
     """
     Génère une image avec Stable Diffusion (interface simplifiée).
@@ -50,13 +76,16 @@ def generate_image(
         style: Style spécifique du cas d'usage
         temperature: Qualité de l'image (0.0 = rapide, 1.0 = meilleure qualité)
         use_rl_optimization: Utiliser l'optimisation RL (optionnel, désactivé pour le moment)
+        scheduler: Sampler du registre ("auto" = celui du template)
     
-    Returns:
-        tuple: (image, info_text)
+    Yields:
+        tuple: (image, info_text) - aperçus basse résolution et progression
+               pendant le débruitage, puis l'image finale
     """
     try:
         if not prompt or not prompt.strip():
-            return None, "ERREUR: Veuillez entrer un prompt pour generer une image."
+            yield None, "ERREUR: Veuillez entrer un prompt pour generer une image."
+            return
         
         # Appliquer le template selon use_case et style
         template_prompt, template_negative_prompt, template_params = apply_prompt_template(
@@ -86,6 +115,16 @@ def generate_image(
             final_prompt = template_prompt
             template_info = ""
         
+        # Sampler: steps et CFG ci-dessus sont réglés pour celui du template;
+        # un autre sampler prend les valeurs recommandées par le registre
+        template_scheduler = get_scheduler_spec(template_params.get("scheduler"))
+        scheduler_spec = template_scheduler
+        if scheduler and scheduler != "auto":
+            scheduler_spec = get_scheduler_spec(scheduler)
+        if scheduler_spec.name != template_scheduler.name:
+            num_steps = scheduler_spec.default_steps
+            guidance_scale = scheduler_spec.guidance_scale or guidance_scale
+        
         seed_value = None  # Toujours aléatoire pour plus de variété
         
         # Optimisation RL désactivée pour le moment
@@ -108,53 +147,112 @@ def generate_image(
         #     except Exception as e:
         #         optimization_info = f"⚠️ Optimisation RL non disponible ({str(e)[:50]}...)\n💡 Génération sans optimisation RL"
         
-        # Génération de l'image
+        # Génération de l'image dans un thread: la progression remonte
+        # par une file et est affichée au fil des steps
+        # (hors de generation_queue: Gradio tourne dans son propre processus,
+        # avec son propre modèle, et n'attend jamais derrière les jobs de l'API)
+        # Le token est annulé si l'utilisateur clique sur Stop ou quitte la
+        # page: le débruitage s'arrête au step suivant, rien n'est sauvegardé
         start_time = time.time()
-        image = sd_generator.generate(
-            prompt=final_prompt,
-            negative_prompt=negative_prompt,
-            guidance_scale=guidance_scale,
-            num_inference_steps=num_steps,
-            width=width,
-            height=height,
-            seed=seed_value
-        )
+        updates = queue.Queue()
+        outcome = {}
+        cancel_token = CancellationToken()
+        
+        def run_generation():
+            try:
+                outcome["image"] = get_generator().generate(
+                    prompt=final_prompt,
+                    negative_prompt=negative_prompt,
+                    guidance_scale=guidance_scale,
+                    num_inference_steps=num_steps,
+                    width=width,
+                    height=height,
+                    seed=seed_value,
+                    step_callback=updates.put,
+                    preview_every=settings.SD_PREVIEW_EVERY,
+                    cancel_token=cancel_token,
+                    scheduler=scheduler_spec.name
+                )
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                updates.put(None)  # Fin de la génération
+        
+        threading.Thread(target=run_generation, daemon=True).start()
+        
+        preview = None
+        try:
+            while True:
+                progress = updates.get()
+                if progress is None:
+                    break
+                if progress.preview is not None:
+                    # Aperçu 1/8 de résolution, agrandi à la taille finale
+                    preview = progress.preview.resize((width, height), Image.BILINEAR)
+                eta = f"{progress.eta:.0f}s" if progress.eta is not None else "..."
+                yield preview, f"**⏳ Step {progress.step}/{progress.total_steps}** - {progress.elapsed:.0f}s écoulées, reste ~{eta}"
+        except GeneratorExit:
+            # Événement annulé par Gradio (bouton Stop, page fermée)
+            cancel_token.cancel("Generation arretee depuis l'interface")
+            raise
+        
+        if "error" in outcome:
+            raise outcome["error"]
+        image = outcome["image"]
         generation_time = time.time() - start_time
         
-        # Sauvegarder l'image
-        output_dir = get_output_path("portfolio")
-        timestamp = int(time.time())
-        filename = f"generated_{timestamp}.png"
-        filepath = output_dir / filename
-        image.save(str(filepath))
+        # Mêmes temps par étape que l'API (voir app/utils/timings.py)
+        timings = image_timings(image)
+        
+        # Sauvegarder l'image (nommée par son contenu): encodage en
+        # arrière-plan, pendant le scoring (format du template, sinon IMAGE_FORMAT)
+        write = image_store.put(image, template_params.get("image_format") if template_info else None)
+        filepath = write.path
+        image_format = write.image_format
         
         # Calculer le score esthétique
-        score = aesthetic_scorer.score(image)
+        with timings.measure("scoring"):
+            score = aesthetic_scorer.score(image)
         
         # Sauvegarder dans la base de données
         db = SessionLocal()
+        db_image = None
         try:
-            ImageRepository.create(
-                db=db,
-                prompt=prompt,  # Prompt original de l'utilisateur
-                image_path=str(filepath),
-                negative_prompt=negative_prompt if negative_prompt else None,
-                optimized_prompt=final_prompt,  # Prompt final utilisé
-                guidance_scale=guidance_scale,
-                num_inference_steps=num_steps,
-                width=width,
-                height=height,
-                seed=seed_value,
-                score=score,
-                generation_time=generation_time,
-                use_rl_optimization=False,  # Désactivé pour le moment
-            )
+            with timings.measure("db_write"):
+                db_image = ImageRepository.create(
+                    db=db,
+                    prompt=prompt,  # Prompt original de l'utilisateur
+                    image_path=str(filepath),
+                    negative_prompt=negative_prompt if negative_prompt else None,
+                    optimized_prompt=final_prompt,  # Prompt final utilisé
+                    guidance_scale=guidance_scale,
+                    num_inference_steps=num_steps,
+                    width=width,
+                    height=height,
+                    seed=seed_value,
+                    score=score,
+                    generation_time=generation_time,
+                    use_rl_optimization=False,  # Désactivé pour le moment
+                    timings=timings.to_dict(),
+                )
         except Exception as e:
             print(f"WARNING: Erreur lors de la sauvegarde en base de donnees: {e}")
         finally:
             db.close()
+            image_store.release(filepath)
+        write.add_done_callback(_record_file)
+        image_id = db_image.id if db_image is not None else None
+        write.add_failure_callback(lambda write: _drop_unwritten(image_id, write))
+        # Encodage recouvert par le scoring et l'insertion: l'attente est
+        # courte, et le message ci-dessous dit si le fichier est bien écrit
+        write.wait()
+        if write.error is not None:
+            saved_info = f"⚠️ **Image non sauvegardée** : {write.error}"
+        else:
+            saved_info = f"💾 **Image sauvegardée automatiquement** ({image_format.upper()})"
         
         # Info textuelle simplifiée
+        stages = timings.to_dict()
         quality_label = "Rapide" if temperature < 0.4 else "Équilibrée" if temperature < 0.7 else "Haute qualité"
         
         info_text = f"""
@@ -163,20 +261,21 @@ def generate_image(
 **📝 Prompt original :** {prompt}
 {template_info}
 **🌡️ Qualité :** {quality_label} (Température: {temperature:.1f})
-**⏱️ Temps :** {generation_time:.1f} secondes
+**🧮 Sampler :** {scheduler_spec.label} ({num_steps} steps)
+**⏱️ Temps :** {generation_time:.1f} secondes (débruitage {stages.get("denoising", 0):.1f}s, décodage {stages.get("vae_decode", 0):.1f}s, score {stages.get("scoring", 0):.1f}s)
 **⭐ Score esthétique :** {score:.2f}/10
 **📐 Dimensions :** {width}x{height}
 
 {optimization_info}
 
-💾 **Image sauvegardée automatiquement**
+{saved_info}
 """
         
-        return image, info_text
+        yield image, info_text
         
     except Exception as e:
         error_text = f"❌ Erreur lors de la génération : {str(e)}"
-        return None, error_text
+        yield None, error_text
 
 def optimize_prompt_only(prompt: str, n_iterations: int = 10):
     """
@@ -271,6 +370,15 @@ with gr.Blocks(title="AI Creative Studio", theme=gr.themes.Soft()) as demo:
                         info="0.0 = Rapide (30s, 20 steps) | 0.5 = Équilibré (1min, 35 steps) | 1.0 = Meilleure qualité (2min, 50 steps)"
                     )
                     
+                    scheduler_dropdown = gr.Dropdown(
+                        label="🧮 Sampler",
+                        choices=["auto"] + list(SCHEDULERS),
+                        value="auto",
+                        interactive=True,
+                        allow_custom_value=False,
+                        info="auto = sampler du template | unipc = brouillon rapide (15 steps) | lcm = 6 steps (poids LCM requis)"
+                    )
+                    
                     use_rl_opt = gr.Checkbox(
                         label="✨ Optimisation automatique du prompt (RL) - Désactivé pour le moment",
                         value=False,
@@ -279,6 +387,7 @@ with gr.Blocks(title="AI Creative Studio", theme=gr.themes.Soft()) as demo:
                     )
                     
                     generate_btn = gr.Button("🎨 Générer", variant="primary", size="lg")
+                    stop_btn = gr.Button("⏹️ Arrêter", variant="stop")
                 
                 with gr.Column(scale=1):
                     image_output = gr.Image(
@@ -349,8 +458,17 @@ with gr.Blocks(title="AI Creative Studio", theme=gr.themes.Soft()) as demo:
                     history_btn = gr.Button("📊 Charger l'historique", variant="primary")
                 
                 with gr.Column():
+                    history_gallery = gr.Gallery(label="Miniatures", columns=5, height="auto")
                     history_output = gr.Markdown(label="Historique")
             
+            def history_thumbnail(image_path):
+                """Plus grande miniature de l'image (image complète si absente)"""
+                for size in reversed(image_store.thumbnail_sizes):
+                    thumbnail = image_store.thumbnail_path(image_path, size)
+                    if thumbnail.is_file():
+                        return str(thumbnail)
+                return image_path if Path(image_path).is_file() else None
+            
             def load_history(limit, order_by, order_desc):
                 """Charge l'historique depuis la base de données"""
                 db = SessionLocal()
@@ -364,7 +482,17 @@ with gr.Blocks(title="AI Creative Studio", theme=gr.themes.Soft()) as demo:
                     )
                     
                     if not images:
-                        return "**Aucune image dans l'historique pour le moment.**"
+                        return "**Aucune image dans l'historique pour le moment.**", []
+                    
+                    def score_label(img):
+                        # Score NULL (ex: scorer indisponible à la génération)
+                        return f"{img.score:.2f}/10" if img.score is not None else "n/a"
+                    
+                    gallery = []
+                    for img in images:
+                        thumbnail = history_thumbnail(img.image_path)
+                        if thumbnail is not None:
+                            gallery.append((thumbnail, f"#{img.id} - {score_label(img)}"))
                     
                     history_text = f"**📊 Historique ({len(images)} images)**\n\n"
                     history_text += "---\n\n"
@@ -373,7 +501,7 @@ with gr.Blocks(title="AI Creative Studio", theme=gr.themes.Soft()) as demo:
                         history_text += f"""
 **Image #{img.id}** (Créée le {img.created_at.strftime('%Y-%m-%d %H:%M:%S')})
 - **Prompt** : {img.prompt[:100]}{'...' if len(img.prompt) > 100 else ''}
-- **Score** : {img.score:.2f}/10
+- **Score** : {score_label(img)}
 - **Dimensions** : {img.width}x{img.height}
 - **Steps** : {img.num_inference_steps}
 - **Guidance** : {img.guidance_scale}
@@ -382,16 +510,16 @@ with gr.Blocks(title="AI Creative Studio", theme=gr.themes.Soft()) as demo:
 
 ---
 """
-                    return history_text
+                    return history_text, gallery
                 except Exception as e:
-                    return f"ERREUR: Erreur lors du chargement de l'historique : {str(e)}"
+                    return f"ERREUR: Erreur lors du chargement de l'historique : {str(e)}", []
                 finally:
                     db.close()
             
             history_btn.click(
                 fn=load_history,
                 inputs=[history_limit, history_order, history_order_desc],
-                outputs=[history_output]
+                outputs=[history_output, history_gallery]
             )
             
             # Statistiques
@@ -478,18 +606,22 @@ with gr.Blocks(title="AI Creative Studio", theme=gr.themes.Soft()) as demo:
         outputs=[style_dropdown]
     )
     
-    generate_btn.click(
+    generate_event = generate_btn.click(
         fn=generate_image,
         inputs=[
             prompt_input,
             use_case_dropdown,
             style_dropdown,
             temperature_slider,
-            use_rl_opt
+            use_rl_opt,
+            scheduler_dropdown
         ],
         outputs=[image_output, info_output]
     )
     
+    # Stop: annule l'événement en cours, ce qui interrompt le débruitage
+    stop_btn.click(fn=None, cancels=[generate_event])
+    
     optimize_btn.click(
         fn=optimize_prompt_only,
         inputs=[optimize_prompt_input, optimize_iterations],
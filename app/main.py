@@ -1,8 +1,12 @@
-from fastapi import FastAPI
+import time
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import router
+from app.api.routes import router, generation_queue
 from app.utils.config import settings
 from app.database.database import init_db
+from app.models.warmup import warmup_state
+from app.utils.image_writer import image_writer
+from app.utils.metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, HTTP_REQUESTS, REGISTRY
 
 # Créer l'application FastAPI
 app = FastAPI(
@@ -21,7 +25,31 @@ app.add_middleware(
 )
 
 # Inclure les routes
-app.include_router(router, prefix="/api/v1", tags=["generation"])
+app.include_router(router, prefix=settings.API_PREFIX, tags=["generation"])
+
+# Métriques Prometheus: débit et latence de chaque route, plus les
+# compteurs alimentés par le générateur, le scorer et la base
+if settings.METRICS_ENABLED:
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        """Compte et chronomètre chaque requête, par route (pas par URL: cardinalité bornée)."""
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            if path != "/metrics":
+                HTTP_REQUESTS.labels(method=request.method, route=path, status=status).inc()
+                HTTP_REQUEST_SECONDS.labels(method=request.method, route=path).observe(time.perf_counter() - start)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Métriques du processus au format texte Prometheus."""
+        return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
 
 # Event handlers
 @app.on_event("startup")
@@ -32,10 +60,20 @@ async def startup_event():
     print(f"{settings.API_TITLE} v{settings.API_VERSION} starting...")
     print(f"Listening on {settings.API_HOST}:{settings.API_PORT}")
     print(f"Docs available at http://{settings.API_HOST}:{settings.API_PORT}/docs")
+    # Préchauffage en arrière-plan: /api/v1/ready répond 503 jusqu'à la fin
+    if settings.SD_WARMUP_ENABLED:
+        warmup_state.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Actions à l'arrêt de l'API."""
+    # Laisser les workers terminer leur job en cours
+    generation_queue.stop(timeout=5)
+    # Fichiers encore en cours d'encodage
+    image_writer.flush(timeout=10)
+    if settings.SD_POOL_WORKERS > 0:
+        from app.models.inference_pool import get_inference_pool
+        get_inference_pool().stop(timeout=5)
     print("👋 Shutting down AI Creative Studio...")
 
 if __name__ == "__main__":
@@ -0,0 +1,669 @@
+"""
+Contrôle d'admission des générations selon un budget mémoire.
+
+PROBLÈME:
+---------
+GenerateRequest accepte n'importe quelle taille d'image. La mémoire crête
+d'une génération croît avec le nombre de pixels latents l = (W/8) x (H/8):
+- linéairement pour les activations du UNet et le décodage VAE
+- au CARRÉ pour les matrices d'attention (l x l)
+
+    512x512   → l = 4096   → ~1.3 Go (float32, CPU)
+    1024x1024 → l = 16384  → ~9 Go
+
+Une seule requête 1024x1024 sur une machine de 8 Go fait swapper le worker,
+ou le fait tuer par l'OOM killer avec toutes les requêtes en file.
+
+SOLUTION:
+---------
+1. Un modèle de coût (calibrable sur la machine) estime la mémoire crête
+   et la durée de chaque génération:
+       mémoire = base + batch x (a x l + b x l²)           (x taille du dtype)
+       durée   = batch x (d x l + steps x (c x l + e x l²))
+2. À la soumission (API):
+   - 413 si la génération ne tiendra JAMAIS dans le budget
+   - 429 (+ Retry-After) si le travail déjà en file dépasse le plafond
+   - sinon le job est mis en file
+3. À l'exécution, chaque génération RÉSERVE sa mémoire crête: tant que le
+   budget est occupé par d'autres générations, elle attend son tour (FIFO,
+   une grosse requête n'est jamais doublée indéfiniment par des petites)
+
+Le débit reste prévisible sous charge mixte: on n'exécute jamais plus de
+générations simultanées que la mémoire ne le permet.
+
+Calibration (mesure la mémoire et la durée réelles sur CETTE machine):
+    python -m app.models.admission --output models/admission_model.json
+    # puis dans .env:
+    SD_ADMISSION_MODEL=models/admission_model.json
+"""
+import argparse
+import ctypes
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from itertools import count
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+import numpy as np
+import torch
+from PIL import Image
+from app.utils.config import settings
+from app.models.highres import attention_max_elements
+from app.models.progress import GenerationProgress
+from app.utils.cancellation import CancellationToken, GenerationCancelled
+
+# Octets par élément selon le dtype (les coefficients sont en float32)
+DTYPE_BYTES = {"float32": 4, "float16": 2, "bfloat16": 2}
+
+# Part de la mémoire totale utilisable en mode auto (le reste: OS, API, DB)
+AUTO_BUDGET_FRACTION = 0.8
+
+# Paramètres d'un pipeline SD 1.5 (UNet ~860M, encodeur texte ~123M,
+# VAE ~84M): poids estimés des workers du pool, qui chargent chacun le
+# modèle dans leur propre processus
+SD_WEIGHT_PARAMS = 1_067_000_000
+
+
+def pool_weights_bytes(workers: int, dtype: str) -> int:
+    """Poids estimés des workers du pool d'inférence (une copie chacun)."""
+    return workers * SD_WEIGHT_PARAMS * DTYPE_BYTES.get(dtype, 4)
+
+
+class AdmissionRejected(Exception):
+    """
+    Génération refusée par le contrôle d'admission.
+
+    Args:
+        message: Explication lisible
+        status_code: 413 (trop grosse pour le budget) ou 429 (surcharge)
+        retry_after: Secondes avant de réessayer (429 uniquement)
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CostEstimate:
+    """Mémoire crête (octets) et durée (secondes) estimées d'une génération."""
+
+    def __init__(self, peak_bytes: int, seconds: float, width: int, height: int,
+                 num_inference_steps: int, batch_size: int):
+        self.peak_bytes = peak_bytes
+        self.seconds = seconds
+        self.width = width
+        self.height = height
+        self.num_inference_steps = num_inference_steps
+        self.batch_size = batch_size
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Sérialisation JSON."""
+        return {
+            "peak_mb": self.peak_bytes / 2**20,
+            "seconds": self.seconds,
+            "width": self.width,
+            "height": self.height,
+            "num_inference_steps": self.num_inference_steps,
+            "batch_size": self.batch_size,
+        }
+
+
+class CostModel:
+    """
+    Modèle de coût d'une génération, en fonction des pixels latents.
+
+    Coefficients (float32, par image, guidance CFG incluse):
+        base_bytes: Mémoire fixe par génération (embeddings, scheduler...)
+        pixel_bytes: Octets par pixel latent (activations UNet, décodage VAE)
+        attention_bytes: Octets par pixel latent au carré (matrices d'attention)
+        decode_seconds: Secondes par pixel latent hors steps (décodage VAE)
+        step_seconds: Secondes par pixel latent et par step
+        step_attention_seconds: Secondes par pixel latent au carré et par step
+
+    Les valeurs par défaut correspondent à SD 1.5 en float32 sur un CPU
+    de bureau (~1.7s/step en 512x512); calibrer pour d'autres machines.
+
+    attention_cap: Taille max d'un bloc d'attention (éléments) quand la
+    self-attention est découpée (app/models/highres.py): le terme mémoire
+    quadratique est plafonné, pas la durée (même nombre d'opérations).
+    """
+
+    # SD 1.5, float32, CPU 8 cœurs, attention slicing
+    DEFAULTS = {
+        "base_bytes": 256 * 2**20,
+        "pixel_bytes": 160 * 2**10,
+        "attention_bytes": 24.0,
+        "decode_seconds": 1.2e-3,
+        "step_seconds": 2.9e-4,
+        "step_attention_seconds": 3.0e-8,
+    }
+
+    # Sur GPU, les durées sont ~10x plus courtes
+    CUDA_SPEEDUP = 10.0
+
+    def __init__(self, coefficients: Optional[Dict[str, float]] = None,
+                 dtype: str = "float32", source: str = "default",
+                 attention_cap: Optional[int] = None):
+        self.coefficients = dict(self.DEFAULTS)
+        self.coefficients.update(coefficients or {})
+        self.dtype = dtype
+        self.source = source
+        self.attention_cap = attention_cap
+
+    def attention_elements(self, pixels):
+        """Éléments de la plus grande matrice d'attention (plafonnés si découpage)."""
+        if self.attention_cap is None:
+            return pixels ** 2
+        return np.minimum(pixels ** 2, self.attention_cap)
+
+    @classmethod
+    def default(cls, device: str = "cpu", dtype: str = "float32") -> "CostModel":
+        """Coefficients par défaut, ajustés au device."""
+        coefficients = dict(cls.DEFAULTS)
+        if device == "cuda":
+            for name in ("decode_seconds", "step_seconds", "step_attention_seconds"):
+                coefficients[name] /= cls.CUDA_SPEEDUP
+        return cls(coefficients, dtype=dtype, source="default")
+
+    @classmethod
+    def load(cls, path: Union[str, Path], dtype: str = "float32") -> "CostModel":
+        """Charge un modèle calibré (voir calibrate())."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        model = cls(data["coefficients"], dtype=dtype, source=str(path))
+        # Coefficients mesurés dans le dtype de la calibration: ramenés en float32
+        scale = 4 / DTYPE_BYTES.get(data.get("dtype", "float32"), 4)
+        for name in ("base_bytes", "pixel_bytes", "attention_bytes"):
+            model.coefficients[name] *= scale
+        return model
+
+    def save(self, path: Union[str, Path]) -> None:
+        """Écrit les coefficients (float32) dans un fichier JSON."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"coefficients": self.coefficients, "dtype": "float32",
+                       "created_at": time.time()}, f, indent=2)
+
+    @staticmethod
+    def latent_pixels(width: int, height: int) -> int:
+        """Pixels latents (le VAE réduit chaque dimension d'un facteur 8)."""
+        return (width // 8) * (height // 8)
+
+    def estimate(self, width: int, height: int, num_inference_steps: int,
+                 batch_size: int = 1) -> CostEstimate:
+        """Estime la mémoire crête et la durée d'une génération."""
+        c = self.coefficients
+        pixels = self.latent_pixels(width, height)
+        element_scale = DTYPE_BYTES.get(self.dtype, 4) / 4
+        peak = c["base_bytes"] + batch_size * (
+            c["pixel_bytes"] * pixels + c["attention_bytes"] * self.attention_elements(pixels)
+        )
+        seconds = batch_size * (
+            c["decode_seconds"] * pixels
+            + num_inference_steps * (c["step_seconds"] * pixels + c["step_attention_seconds"] * pixels ** 2)
+        )
+        return CostEstimate(int(peak * element_scale), seconds, width, height,
+                            num_inference_steps, batch_size)
+
+    @classmethod
+    def fit(cls, samples: List[Dict[str, float]], dtype: str = "float32",
+            attention_cap: Optional[int] = None) -> "CostModel":
+        """
+        Ajuste les coefficients sur des mesures (moindres carrés).
+
+        Args:
+            samples: Mesures {"width", "height", "steps", "batch_size",
+                     "peak_bytes", "seconds"}
+            dtype: dtype des mesures (coefficients ramenés en float32)
+            attention_cap: Découpage de l'attention actif pendant les mesures
+
+        Returns:
+            CostModel calibré (coefficients négatifs ramenés à 0)
+        """
+        pixels = np.array([cls.latent_pixels(s["width"], s["height"]) for s in samples], dtype=np.float64)
+        batch = np.array([s["batch_size"] for s in samples], dtype=np.float64)
+        steps = np.array([s["steps"] for s in samples], dtype=np.float64)
+        scale = 4 / DTYPE_BYTES.get(dtype, 4)
+
+        model = cls(dtype=dtype, source="calibration", attention_cap=attention_cap)
+        memory_features = np.stack(
+            [np.ones_like(pixels), batch * pixels, batch * model.attention_elements(pixels)], axis=1
+        )
+        peak = np.array([s["peak_bytes"] for s in samples], dtype=np.float64) * scale
+        base, per_pixel, attention = np.linalg.lstsq(memory_features, peak, rcond=None)[0]
+
+        time_features = np.stack([batch * pixels, batch * steps * pixels, batch * steps * pixels ** 2], axis=1)
+        seconds = np.array([s["seconds"] for s in samples], dtype=np.float64)
+        decode, per_step, per_step_attention = np.linalg.lstsq(time_features, seconds, rcond=None)[0]
+
+        coefficients = {
+            "base_bytes": base,
+            "pixel_bytes": per_pixel,
+            "attention_bytes": attention,
+            "decode_seconds": decode,
+            "step_seconds": per_step,
+            "step_attention_seconds": per_step_attention,
+        }
+        model.coefficients = {name: max(0.0, float(value)) for name, value in coefficients.items()}
+        return model
+
+
+def total_memory_bytes(device: str = "cpu") -> Optional[int]:
+    """Mémoire totale du device (RAM ou VRAM), None si inconnue."""
+    if device == "cuda" and torch.cuda.is_available():
+        return torch.cuda.get_device_properties(0).total_memory
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import os
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class AdmissionController:
+    """
+    Budget mémoire partagé par toutes les générations du processus.
+
+    Args:
+        model: Modèle de coût
+        budget_bytes: Budget fixe (None = auto, voir budget_bytes)
+        max_queued_seconds: Travail en file max avant 429 (None = illimité)
+        device: Device des générations (budget auto: RAM ou VRAM)
+        weights_bytes: Retourne la taille des poids déjà chargés (budget auto)
+    """
+
+    def __init__(
+        self,
+        model: CostModel,
+        budget_bytes: Optional[int] = None,
+        max_queued_seconds: Optional[float] = None,
+        device: str = "cpu",
+        weights_bytes: Callable[[], int] = lambda: 0,
+    ):
+        self.model = model
+        self._budget_bytes = budget_bytes
+        self.max_queued_seconds = max_queued_seconds
+        self.device = device
+        self._weights_bytes = weights_bytes
+
+        self._cond = threading.Condition()
+        self._tickets = count()
+        self._waiting: List[int] = []
+        self.in_use_bytes = 0
+        self.running = 0
+
+        # Statistiques
+        self.admitted = 0
+        self.rejected_too_large = 0
+        self.rejected_overloaded = 0
+        self.total_wait = 0.0
+
+    @property
+    def budget_bytes(self) -> int:
+        """
+        Budget mémoire des générations.
+
+        Auto: 80% de la mémoire totale moins les poids du modèle chargé
+        (recalculé: le budget se réduit une fois le modèle chargé), ou
+        moins les poids estimés des N workers avec le pool d'inférence.
+        """
+        if self._budget_bytes is not None:
+            return self._budget_bytes
+        total = total_memory_bytes(self.device) or 0
+        return max(0, int(total * AUTO_BUDGET_FRACTION) - self._weights_bytes())
+
+    def estimate(self, width: int, height: int, num_inference_steps: int,
+                 batch_size: int = 1) -> CostEstimate:
+        """Estimation du modèle de coût."""
+        return self.model.estimate(width, height, num_inference_steps, batch_size)
+
+    def _check_fits(self, estimate: CostEstimate, budget: int) -> None:
+        """Lève 413 si la génération ne tiendra jamais dans le budget."""
+        if estimate.peak_bytes > budget:
+            self.rejected_too_large += 1
+            raise AdmissionRejected(
+                f"Generation {estimate.width}x{estimate.height} x{estimate.batch_size} trop grosse: "
+                f"~{estimate.peak_bytes / 2**20:.0f} Mo estimes pour un budget de {budget / 2**20:.0f} Mo "
+                f"(reduire la resolution ou le batch)",
+                status_code=413,
+            )
+
+    def check(self, estimate: CostEstimate, queued_seconds: float = 0.0, workers: int = 1) -> None:
+        """
+        Décision d'admission à la soumission (avant la mise en file).
+
+        Args:
+            estimate: Coût de la génération soumise
+            queued_seconds: Durée estimée des jobs déjà en file
+            workers: Jobs exécutés en parallèle (pour le Retry-After)
+
+        Raises:
+            AdmissionRejected: 413 (jamais dans le budget) ou 429 (file surchargée)
+        """
+        with self._cond:
+            self._check_fits(estimate, self.budget_bytes)
+            if (self.max_queued_seconds is not None
+                    and queued_seconds + estimate.seconds > self.max_queued_seconds):
+                self.rejected_overloaded += 1
+                raise AdmissionRejected(
+                    f"Service surcharge: ~{queued_seconds:.0f}s de generations deja en file "
+                    f"(max {self.max_queued_seconds:.0f}s)",
+                    status_code=429,
+                    retry_after=max(1, math.ceil(queued_seconds / max(1, workers))),
+                )
+
+    @contextmanager
+    def reserve(self, estimate: CostEstimate,
+                cancel_token: Optional[CancellationToken] = None) -> Iterator[None]:
+        """
+        Réserve la mémoire crête pendant la génération (bloquant, FIFO).
+
+        Raises:
+            AdmissionRejected: 413 si la génération dépasse le budget à elle seule
+            GenerationCancelled: Si le token est annulé pendant l'attente
+        """
+        ticket = next(self._tickets)
+        started = time.monotonic()
+        with self._cond:
+            self._waiting.append(ticket)
+            if cancel_token is not None:
+                cancel_token.add_callback(self._wake)
+            try:
+                while True:
+                    budget = self.budget_bytes
+                    self._check_fits(estimate, budget)
+                    if cancel_token is not None and cancel_token.is_cancelled:
+                        raise GenerationCancelled(cancel_token.reason or "cancelled")
+                    if self._waiting[0] == ticket and self.in_use_bytes + estimate.peak_bytes <= budget:
+                        break
+                    # Timeout: le budget auto peut évoluer (chargement du modèle)
+                    self._cond.wait(1.0)
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+            self.in_use_bytes += estimate.peak_bytes
+            self.running += 1
+            self.admitted += 1
+            self.total_wait += time.monotonic() - started
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use_bytes -= estimate.peak_bytes
+                self.running -= 1
+                self._cond.notify_all()
+
+    def _wake(self) -> None:
+        """Réveille les générations en attente (annulation)."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Occupation du budget, pour le monitoring."""
+        with self._cond:
+            budget = self.budget_bytes
+            return {
+                "budget_mb": budget / 2**20,
+                "in_use_mb": self.in_use_bytes / 2**20,
+                "usage": self.in_use_bytes / budget if budget else None,
+                "running": self.running,
+                "waiting": len(self._waiting),
+                "admitted": self.admitted,
+                "rejected_too_large": self.rejected_too_large,
+                "rejected_overloaded": self.rejected_overloaded,
+                "average_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+                "max_queued_seconds": self.max_queued_seconds,
+                "cost_model": self.model.source,
+            }
+
+
+class AdmissionGenerator:
+    """
+    Front-end de contrôle d'admission devant un générateur.
+
+    Expose les mêmes méthodes generate() / generate_batch(): chaque appel
+    réserve la mémoire crête estimée avant d'exécuter la génération.
+
+    Args:
+        generator: Générateur sous-jacent (batching, pool ou direct)
+        controller: Budget partagé
+    """
+
+    def __init__(self, generator, controller: AdmissionController):
+        self.generator = generator
+        self.controller = controller
+
+    def generate(
+        self,
+        prompt: str,
+        negative_prompt: Optional[str] = None,
+        guidance_scale: float = 7.5,
+        num_inference_steps: int = 50,
+        width: int = 512,
+        height: int = 512,
+        seed: Optional[int] = None,
+        step_callback: Optional[Callable[[GenerationProgress], None]] = None,
+        preview_every: int = 0,
+        cancel_token: Optional[CancellationToken] = None,
+        scheduler: Optional[str] = None
+    ) -> Image.Image:
+        """Mêmes arguments et même retour que StableDiffusionGenerator.generate()."""
+        estimate = self.controller.estimate(width, height, num_inference_steps)
+        with self.controller.reserve(estimate, cancel_token):
+            return self.generator.generate(
+                prompt=prompt,
+                negative_prompt=negative_prompt,
+                guidance_scale=guidance_scale,
+                num_inference_steps=num_inference_steps,
+                width=width,
+                height=height,
+                seed=seed,
+                step_callback=step_callback,
+                preview_every=preview_every,
+                cancel_token=cancel_token,
+                scheduler=scheduler
+            )
+
+    def generate_batch(self, prompts: List[str], num_inference_steps: int = 50,
+                       width: int = 512, height: int = 512, **kwargs) -> List[Image.Image]:
+        """Mêmes arguments et même retour que StableDiffusionGenerator.generate_batch()."""
+        estimate = self.controller.estimate(width, height, num_inference_steps, len(prompts))
+        cancel_tokens = kwargs.get("cancel_tokens") or []
+        # Attente annulable seulement si toutes les images partagent le même
+        # token (une requête, éventuellement à plusieurs variations)
+        cancel_token = None
+        if len(cancel_tokens) == len(prompts) and all(t is cancel_tokens[0] for t in cancel_tokens):
+            cancel_token = cancel_tokens[0]
+        with self.controller.reserve(estimate, cancel_token):
+            return self.generator.generate_batch(
+                prompts=prompts,
+                num_inference_steps=num_inference_steps,
+                width=width,
+                height=height,
+                **kwargs
+            )
+
+
+# Instances globales (créées à la première utilisation)
+_admission_controller: Optional[AdmissionController] = None
+_admission_generator: Optional[AdmissionGenerator] = None
+_admission_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Retourne le budget global (modèle de coût calibré si configuré)."""
+    global _admission_controller
+    with _admission_lock:
+        if _admission_controller is None:
+            from app.models.stable_diffusion import sd_generator
+            dtype = str(sd_generator.dtype).replace("torch.", "")
+            if settings.SD_ADMISSION_MODEL and Path(settings.SD_ADMISSION_MODEL).is_file():
+                model = CostModel.load(settings.SD_ADMISSION_MODEL, dtype=dtype)
+            else:
+                if settings.SD_ADMISSION_MODEL:
+                    print(f"WARNING: Modele de cout {settings.SD_ADMISSION_MODEL} introuvable, coefficients par defaut")
+                model = CostModel.default(sd_generator.device, dtype)
+            # Attention découpée en blocs: mémoire crête plafonnée (haute résolution)
+            model.attention_cap = attention_max_elements(sd_generator.dtype)
+            budget = settings.SD_MEMORY_BUDGET_MB
+            weights_bytes = sd_generator.weights_bytes
+            if settings.SD_POOL_WORKERS > 0 and budget is None:
+                # Le processus principal ne charge jamais le modèle (poids = 0):
+                # chaque worker en charge une copie
+                pool_bytes = pool_weights_bytes(settings.SD_POOL_WORKERS, dtype)
+                weights_bytes = lambda: pool_bytes
+                print(f"INFO: Budget memoire auto: {settings.SD_POOL_WORKERS} worker(s) x poids estimes "
+                      f"({pool_bytes / 2**30:.1f} Go), fixer SD_MEMORY_BUDGET_MB pour un budget exact")
+            _admission_controller = AdmissionController(
+                model=model,
+                budget_bytes=int(budget * 2**20) if budget is not None else None,
+                max_queued_seconds=settings.SD_ADMISSION_MAX_QUEUED_SECONDS,
+                device=sd_generator.device,
+                weights_bytes=weights_bytes,
+            )
+        return _admission_controller
+
+
+def get_admission_generator() -> AdmissionGenerator:
+    """Retourne le front-end d'admission global (devant batching ou moteur direct)."""
+    global _admission_generator
+    controller = get_admission_controller()
+    with _admission_lock:
+        if _admission_generator is None:
+            from app.models.stable_diffusion import get_base_generator
+            if settings.SD_BATCH_ENABLED:
+                from app.models.batching import get_batching_generator
+                inner = get_batching_generator()
+            else:
+                inner = get_base_generator()
+            _admission_generator = AdmissionGenerator(inner, controller)
+        return _admission_generator
+
+
+# ========================================
+# CALIBRATION
+# ========================================
+
+def _release_freed_memory() -> None:
+    """Rend au système la mémoire libérée mais gardée par malloc (Linux)."""
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _rss_bytes() -> int:
+    """Mémoire résidente du processus (Linux)."""
+    with open("/proc/self/statm", "r", encoding="utf-8") as f:
+        return int(f.read().split()[1]) * 4096
+
+
+def measure_peak(fn: Callable[[], Any], device: str = "cpu", interval: float = 0.002) -> Dict[str, float]:
+    """
+    Exécute fn() et mesure sa durée et sa mémoire crête additionnelle.
+
+    CPU: RSS échantillonné toutes les `interval` secondes par un thread.
+    GPU: compteurs d'allocation de PyTorch.
+    """
+    if device == "cuda":
+        torch.cuda.synchronize()
+        baseline = torch.cuda.memory_allocated()
+        torch.cuda.reset_peak_memory_stats()
+        started = time.perf_counter()
+        fn()
+        torch.cuda.synchronize()
+        return {"seconds": time.perf_counter() - started,
+                "peak_bytes": torch.cuda.max_memory_allocated() - baseline}
+
+    _release_freed_memory()
+    baseline = _rss_bytes()
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], _rss_bytes())
+            done.wait(interval)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        fn()
+    finally:
+        seconds = time.perf_counter() - started
+        done.set()
+        sampler.join()
+    return {"seconds": seconds, "peak_bytes": max(0, peak[0] - baseline)}
+
+
+def calibrate(generator, sizes: List[int], batch_sizes: List[int], steps: List[int]) -> CostModel:
+    """
+    Mesure des générations réelles et ajuste le modèle de coût.
+
+    Args:
+        generator: StableDiffusionGenerator chargé
+        sizes: Côtés d'image mesurés (ex: 256 384 512)
+        batch_sizes: Tailles de batch mesurées
+        steps: Nombres de steps (au moins deux valeurs: sépare steps et décodage)
+    """
+    # Chauffe: le premier appel alloue des caches qui faussent la mesure
+    generator.generate_batch(["calibration"], num_inference_steps=min(steps),
+                             width=min(sizes), height=min(sizes))
+    samples = []
+    # Tailles croissantes: la mémoire gardée par l'allocateur ne masque pas la crête suivante
+    for size in sorted(sizes):
+        for batch_size in sorted(batch_sizes):
+            for n_steps in steps:
+                measure = measure_peak(lambda: generator.generate_batch(
+                    ["calibration"] * batch_size, num_inference_steps=n_steps,
+                    width=size, height=size,
+                ), device=generator.device)
+                samples.append({"width": size, "height": size, "batch_size": batch_size,
+                                "steps": n_steps, **measure})
+                print(f"INFO: {size}x{size} x{batch_size}, {n_steps} steps: "
+                      f"{measure['peak_bytes'] / 2**20:.0f} Mo, {measure['seconds']:.1f}s")
+    return CostModel.fit(samples, dtype=str(generator.dtype).replace("torch.", ""),
+                         attention_cap=attention_max_elements(generator.dtype))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Calibrer le modèle de coût du contrôle d'admission sur cette machine"
+    )
+    parser.add_argument("--output", type=str, default="models/admission_model.json",
+                        help="Fichier JSON du modèle calibré (défaut: models/admission_model.json)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 384, 512],
+                        help="Côtés d'image mesurés (défaut: 256 384 512)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2],
+                        help="Tailles de batch mesurées (défaut: 1 2)")
+    parser.add_argument("--steps", type=int, nargs="+", default=[2, 4],
+                        help="Nombres de steps mesurés (défaut: 2 4)")
+    args = parser.parse_args()
+
+    from app.models.stable_diffusion import StableDiffusionGenerator
+
+    generator = StableDiffusionGenerator()
+    print(f"Chargement de {generator.model_id}...")
+    generator.load()
+
+    model = calibrate(generator, args.sizes, args.batch_sizes, args.steps)
+    model.save(args.output)
+    for size in (512, 768, 1024):
+        estimate = model.estimate(size, size, 30)
+        print(f"INFO: {size}x{size}, 30 steps: ~{estimate.peak_bytes / 2**20:.0f} Mo, ~{estimate.seconds:.0f}s")
+    print(f"OK: Modele de cout ecrit dans {args.output}")
+    print(f"INFO: Ajoutez SD_ADMISSION_MODEL={args.output} dans .env pour l'utiliser")
+
+
+if __name__ == "__main__":
+    main()
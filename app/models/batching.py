@@ -0,0 +1,246 @@
+"""
+Micro-batching dynamique des requêtes de génération.
+
+PRINCIPE:
+---------
+Plusieurs requêtes concurrentes avec les mêmes paramètres "structurels"
+(width, height, num_inference_steps, guidance_scale, scheduler) peuvent partager
+une seule passe du UNet par step: le coût fixe de chaque step est
+amorti sur tout le batch.
+
+    requête A (512x512, 35 steps, cfg 7.0) ─┐
+    requête B (512x512, 35 steps, cfg 7.0) ─┼─► 1 appel pipeline (batch=3)
+    requête C (512x512, 35 steps, cfg 7.0) ─┘        │
+                                                     ├─► image A
+                                                     ├─► image B
+                                                     └─► image C
+
+Les templates de prompt_templates.py produisent un petit nombre de
+combinaisons de paramètres fixes: les batches se remplissent souvent.
+
+FONCTIONNEMENT:
+---------------
+- La première requête d'un groupe devient "leader": elle attend au plus
+  window_ms (ou que le batch soit plein), puis exécute le batch
+- Les requêtes suivantes compatibles rejoignent le groupe et attendent
+  leur image
+- Chaque image garde son propre prompt, negative prompt et seed
+- Une requête annulée avant l'exécution est retirée du batch; annulée
+  pendant l'exécution, l'appelant d'une requête suiveuse est libéré
+  immédiatement, mais le leader exécute le batch sur son propre thread
+  et n'est libéré qu'à la fin du batch (le batch s'arrête seulement si
+  toutes ses requêtes sont annulées). Le leader occupe ainsi son worker
+  tant que le modèle calcule: la file de jobs ne lance pas une
+  génération de plus en parallèle
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from PIL import Image
+from app.utils.config import settings
+from app.models.progress import GenerationProgress
+from app.utils.cancellation import CancellationToken, GenerationCancelled
+
+
+class _PendingRequest:
+    """Une requête en attente dans un groupe de batching."""
+
+    def __init__(
+        self,
+        prompt: str,
+        negative_prompt: Optional[str],
+        seed: Optional[int],
+        step_callback: Optional[Callable[[GenerationProgress], None]] = None,
+        preview_every: int = 0,
+        cancel_token: Optional[CancellationToken] = None,
+    ):
+        self.prompt = prompt
+        self.negative_prompt = negative_prompt
+        self.seed = seed
+        self.step_callback = step_callback
+        self.preview_every = preview_every
+        self.cancel_token = cancel_token
+        self.image: Optional[Image.Image] = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class BatchingGenerator:
+    """
+    Front-end de micro-batching devant un StableDiffusionGenerator.
+
+    Expose la même méthode generate() que le générateur direct: les
+    appelants (API, Gradio) n'ont pas à savoir que leur requête est batchée.
+
+    Args:
+        generator: Générateur sous-jacent (doit exposer generate_batch())
+        max_batch_size: Taille max d'un batch
+        window_ms: Durée max d'attente pour remplir un batch (millisecondes)
+    """
+
+    def __init__(self, generator, max_batch_size: int = 4, window_ms: float = 50.0):
+        self.generator = generator
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000.0
+
+        # Groupes ouverts, indexés par paramètres structurels
+        self._groups: Dict[Tuple, List[_PendingRequest]] = {}
+        self._cond = threading.Condition()
+
+        # Statistiques (taille moyenne des batches = efficacité du batching)
+        self.batches_run = 0
+        self.requests_served = 0
+
+    def generate(
+        self,
+        prompt: str,
+        negative_prompt: Optional[str] = None,
+        guidance_scale: float = 7.5,
+        num_inference_steps: int = 50,
+        width: int = 512,
+        height: int = 512,
+        seed: Optional[int] = None,
+        step_callback: Optional[Callable[[GenerationProgress], None]] = None,
+        preview_every: int = 0,
+        cancel_token: Optional[CancellationToken] = None,
+        scheduler: Optional[str] = None
+    ) -> Image.Image:
+        """
+        Génère une image, éventuellement dans un batch partagé.
+
+        Mêmes arguments et même retour que StableDiffusionGenerator.generate().
+        Bloque jusqu'à ce que l'image soit disponible.
+        """
+        key = (width, height, num_inference_steps, guidance_scale, scheduler)
+        pending = _PendingRequest(
+            prompt, negative_prompt, seed, step_callback, preview_every, cancel_token
+        )
+        if cancel_token is not None:
+            # Annulation: un suiveur n'attend pas la fin du batch
+            # (le leader, qui l'exécute, est libéré à la fin du batch)
+            cancel_token.add_callback(pending.done.set)
+
+        with self._cond:
+            group = self._groups.get(key)
+            is_leader = group is None
+            if is_leader:
+                group = [pending]
+                self._groups[key] = group
+            else:
+                group.append(pending)
+                if len(group) >= self.max_batch_size:
+                    # Batch plein: le groupe est fermé, on réveille le leader
+                    del self._groups[key]
+                    self._cond.notify_all()
+
+        if is_leader:
+            batch = self._collect(key, group)
+            self._run_batch(batch, key)
+
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        if cancel_token is not None and cancel_token.is_cancelled:
+            raise GenerationCancelled(cancel_token.reason or "cancelled")
+        return pending.image
+
+    def generate_batch(self, prompts: List[str], **kwargs) -> List[Image.Image]:
+        """
+        Exécute directement un batch déjà constitué (ex: variations d'un prompt).
+
+        Mêmes arguments et même retour que StableDiffusionGenerator.generate_batch():
+        la requête remplit déjà un batch, elle n'attend pas d'autres requêtes.
+        """
+        try:
+            return self.generator.generate_batch(prompts=prompts, **kwargs)
+        finally:
+            with self._cond:
+                self.batches_run += 1
+                self.requests_served += 1
+
+    def _collect(self, key: Tuple, group: List[_PendingRequest]) -> List[_PendingRequest]:
+        """
+        Attend que le batch soit plein ou que la fenêtre expire,
+        puis ferme le groupe (les requêtes suivantes ouvriront un nouveau groupe).
+        """
+        deadline = time.monotonic() + self.window
+        with self._cond:
+            while self._groups.get(key) is group:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    del self._groups[key]
+                    break
+                self._cond.wait(remaining)
+            return list(group)
+
+    def _run_batch(self, batch: List[_PendingRequest], key: Tuple) -> None:
+        """Exécute un batch en un seul appel et distribue les images."""
+        width, height, num_inference_steps, guidance_scale, scheduler = key
+        # Les requêtes annulées pendant la fenêtre de collecte sont retirées
+        cancelled = [p for p in batch if p.cancel_token is not None and p.cancel_token.is_cancelled]
+        for pending in cancelled:
+            pending.error = GenerationCancelled(pending.cancel_token.reason or "cancelled")
+            pending.done.set()
+        batch = [p for p in batch if p not in cancelled]
+        if not batch:
+            return
+
+        # Un seul rythme d'aperçus par batch: le plus fréquent demandé
+        preview_every = min((p.preview_every for p in batch if p.preview_every > 0), default=0)
+        try:
+            images = self.generator.generate_batch(
+                prompts=[p.prompt for p in batch],
+                negative_prompts=[p.negative_prompt for p in batch],
+                seeds=[p.seed for p in batch],
+                guidance_scale=guidance_scale,
+                num_inference_steps=num_inference_steps,
+                width=width,
+                height=height,
+                step_callbacks=[p.step_callback for p in batch],
+                preview_every=preview_every,
+                cancel_tokens=[p.cancel_token for p in batch],
+                scheduler=scheduler
+            )
+            for pending, image in zip(batch, images):
+                pending.image = image
+        except BaseException as e:
+            for pending in batch:
+                pending.error = e
+        finally:
+            with self._cond:
+                self.batches_run += 1
+                self.requests_served += len(batch)
+            for pending in batch:
+                pending.done.set()
+
+    def stats(self) -> Dict[str, float]:
+        """Statistiques de batching (taille moyenne des batches)."""
+        with self._cond:
+            return {
+                "batches_run": self.batches_run,
+                "requests_served": self.requests_served,
+                "average_batch_size": (
+                    self.requests_served / self.batches_run if self.batches_run else 0.0
+                ),
+                "max_batch_size": self.max_batch_size,
+                "window_ms": self.window * 1000.0,
+            }
+
+
+# Instance globale (créée à la première utilisation)
+_batching_generator: Optional[BatchingGenerator] = None
+_batching_lock = threading.Lock()
+
+
+def get_batching_generator() -> BatchingGenerator:
+    """Retourne l'instance globale du front-end de batching."""
+    global _batching_generator
+    with _batching_lock:
+        if _batching_generator is None:
+            from app.models.stable_diffusion import get_base_generator
+            _batching_generator = BatchingGenerator(
+                generator=get_base_generator(),
+                max_batch_size=settings.SD_BATCH_MAX_SIZE,
+                window_ms=settings.SD_BATCH_WINDOW_MS,
+            )
+        return _batching_generator
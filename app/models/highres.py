@@ -0,0 +1,138 @@
+"""
+Génération haute résolution à mémoire bornée.
+
+PROBLÈME:
+---------
+Les formats bannière et marketing (768x512, 1024x576, 1536x512...) dépassent
+512x512. Deux étapes ont alors une mémoire crête qui explose:
+
+1. Self-attention du UNet: matrice (l x l) par tête, l = pixels latents
+       512x512   → l = 4096   → 64 Mo par tête (float32)
+       1024x1024 → l = 16384  → 1 Go par tête
+2. Décodage VAE: tout le latent est décodé en une fois, avec des
+   activations à 128-512 canaux en PLEINE résolution
+
+SOLUTION:
+---------
+1. Attention par blocs de requêtes (ChunkedAttnProcessor): au-delà de
+   SD_ATTENTION_MAX_MB, les requêtes sont traitées par blocs, chacun
+   contre toutes les clés. Résultat identique (chaque requête est
+   indépendante), mémoire de la matrice d'attention plafonnée.
+2. Décodage VAE par tuiles (decode_latents): au-delà de
+   SD_VAE_TILING_PIXELS, le latent est découpé en tuiles qui se
+   chevauchent, décodées une à une, puis raccordées par fondu linéaire
+   sur la zone de recouvrement (pas de couture visible). Les images
+   d'un batch sont décodées l'une après l'autre.
+
+Les images 512x512 ne sont pas concernées (mêmes calculs qu'avant).
+La mémoire crête plafonnée est reprise par le modèle de coût du contrôle
+d'admission: plus de générations haute résolution tiennent en parallèle.
+"""
+from typing import List, Optional
+import torch
+from diffusers import StableDiffusionPipeline
+from PIL import Image
+from app.utils.config import settings
+
+
+def attention_max_elements(dtype: torch.dtype = torch.float32) -> Optional[int]:
+    """Éléments max d'un bloc d'attention (None = pas de découpage)."""
+    if settings.SD_ATTENTION_MAX_MB is None:
+        return None
+    element_size = torch.tensor([], dtype=dtype).element_size()
+    return max(1, int(settings.SD_ATTENTION_MAX_MB * 2**20 / element_size))
+
+
+def use_tiled_decode(width: int, height: int) -> bool:
+    """True si l'image est décodée par tuiles (SD_VAE_TILING_PIXELS)."""
+    threshold = settings.SD_VAE_TILING_PIXELS
+    return threshold is not None and width * height > threshold
+
+
+class ChunkedAttnProcessor:
+    """
+    Enveloppe un processeur d'attention diffusers et découpe les requêtes
+    en blocs quand la matrice d'attention dépasserait max_elements.
+
+    Le processeur d'origine (slicing, SDPA...) calcule chaque bloc; seuls
+    les appels sans masque sur des séquences 3D sans normalisation ni
+    connexion résiduelle internes sont découpés (self-attention du UNet).
+
+    Args:
+        processor: Processeur d'origine
+        max_elements: Taille max (requêtes x clés) d'un bloc
+    """
+
+    def __init__(self, processor, max_elements: int):
+        self.processor = processor
+        self.max_elements = max_elements
+
+    def _chunk_size(self, attn, hidden_states: torch.Tensor, context: torch.Tensor,
+                    attention_mask: Optional[torch.Tensor]) -> Optional[int]:
+        """Requêtes par bloc (None = appel direct)."""
+        if (
+            hidden_states.ndim != 3
+            or attention_mask is not None
+            or attn.group_norm is not None
+            or attn.spatial_norm is not None
+            or attn.residual_connection
+            or attn.norm_cross is not None
+        ):
+            return None
+        queries, keys = hidden_states.shape[1], context.shape[1]
+        if queries * keys <= self.max_elements:
+            return None
+        return max(1, self.max_elements // keys)
+
+    def __call__(self, attn, hidden_states: torch.Tensor,
+                 encoder_hidden_states: Optional[torch.Tensor] = None,
+                 attention_mask: Optional[torch.Tensor] = None, *args, **kwargs) -> torch.Tensor:
+        # Self-attention: les clés viennent de TOUTE la séquence, pas du bloc
+        context = hidden_states if encoder_hidden_states is None else encoder_hidden_states
+        chunk = self._chunk_size(attn, hidden_states, context, attention_mask)
+        if chunk is None:
+            return self.processor(attn, hidden_states, *args, encoder_hidden_states=encoder_hidden_states,
+                                  attention_mask=attention_mask, **kwargs)
+        return torch.cat([
+            self.processor(attn, hidden_states[:, start:start + chunk], *args,
+                           encoder_hidden_states=context, **kwargs)
+            for start in range(0, hidden_states.shape[1], chunk)
+        ], dim=1)
+
+
+def bound_attention_memory(pipe: StableDiffusionPipeline, max_elements: Optional[int]) -> bool:
+    """
+    Installe le découpage des requêtes sur les processeurs actuels du UNet.
+
+    À appeler APRÈS le choix des processeurs (slicing, SDPA); idempotent.
+
+    Returns:
+        True si le découpage est actif
+    """
+    if max_elements is None:
+        return False
+    processors = {
+        name: ChunkedAttnProcessor(
+            processor.processor if isinstance(processor, ChunkedAttnProcessor) else processor,
+            max_elements,
+        )
+        for name, processor in pipe.unet.attn_processors.items()
+    }
+    pipe.unet.set_attn_processor(processors)
+    return True
+
+
+def decode_latents(pipe: StableDiffusionPipeline, latents: torch.Tensor) -> List[Image.Image]:
+    """
+    Décode des latents en images PIL, une image et une tuile à la fois.
+
+    Équivalent au décodage final du pipeline (output_type="pil"), avec
+    AutoencoderKL.tiled_decode: tuiles de vae.tile_sample_min_size pixels,
+    recouvrement de 25% fondu linéairement entre tuiles voisines.
+    """
+    vae = pipe.vae
+    decoded = [
+        vae.tiled_decode(latent.unsqueeze(0) / vae.config.scaling_factor, return_dict=False)[0]
+        for latent in latents
+    ]
+    return pipe.image_processor.postprocess(torch.cat(decoded), output_type="pil")
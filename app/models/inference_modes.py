@@ -0,0 +1,108 @@
+"""
+Modes d'inférence du pipeline Stable Diffusion.
+
+POURQUOI ?
+----------
+Sur CPU, le mode historique active enable_attention_slicing(1): l'attention
+est calculée tête par tête. La mémoire crête baisse, mais chaque step
+lance des dizaines de petits noyaux au lieu d'un seul gros.
+
+MODES (SD_INFERENCE_MODE):
+--------------------------
+- "default":   attention slicing (mémoire minimale, comportement historique)
+- "optimized": pour les CPU modernes
+    1. Format mémoire channels_last (NHWC) pour le UNet et le VAE:
+       les convolutions oneDNN évitent les conversions de layout
+    2. Attention scaled_dot_product_attention (noyau fusionné PyTorch)
+       à la place du slicing
+    3. torch.compile du UNet et du décodeur VAE (SD_TORCH_COMPILE),
+       avec un cache persistant sur disque (SD_COMPILE_CACHE_DIR): un
+       redémarrage ne recompile pas, il relit les noyaux générés
+    4. Autocast bfloat16 (SD_BF16_AUTOCAST) si le CPU a des instructions
+       bfloat16 natives (AVX512-BF16 / AMX); les poids restent en float32
+
+Le premier appel à une résolution donnée déclenche la compilation (long);
+le préchauffage et les benchmarks l'absorbent.
+
+Comparaison avec le mode historique:
+    python -m benchmarks.bench_generation --modes default optimized
+"""
+import os
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, Union
+import torch
+import torch._dynamo
+from diffusers import StableDiffusionPipeline
+from diffusers.models.attention_processor import AttnProcessor2_0
+
+INFERENCE_MODES = ("default", "optimized")
+
+
+def cpu_supports_bf16() -> bool:
+    """True si le CPU calcule nativement en bfloat16 (AVX512-BF16 ou AMX)."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def enable_compile_cache(directory: Union[str, Path]) -> Path:
+    """
+    Active le cache persistant de torch.compile dans `directory`.
+
+    Inductor y écrit les graphes FX compilés et le code C++ généré; un
+    processus suivant (redémarrage, worker du pool) les réutilise au lieu
+    de recompiler. Doit être appelé avant la première compilation.
+    """
+    directory = Path(directory).resolve()
+    directory.mkdir(parents=True, exist_ok=True)
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = str(directory)
+    try:
+        import torch._inductor.config as inductor_config
+        inductor_config.fx_graph_cache = True
+    except (ImportError, AttributeError):
+        print("WARNING: Cache de compilation Inductor indisponible avec cette version de PyTorch")
+    return directory
+
+
+def apply_optimized_mode(pipe: StableDiffusionPipeline, compile: bool = True) -> Dict[str, bool]:
+    """
+    Applique le mode "optimized" au pipeline (en place).
+
+    Args:
+        pipe: Pipeline chargé
+        compile: Compiler le UNet et le décodeur VAE avec torch.compile
+
+    Returns:
+        dict: Optimisations effectivement appliquées
+    """
+    # NHWC: format natif des convolutions oneDNN (CPU) et des Tensor Cores
+    pipe.unet.to(memory_format=torch.channels_last)
+    pipe.vae.to(memory_format=torch.channels_last)
+
+    # Attention fusionnée (remplace aussi un éventuel attention slicing)
+    pipe.unet.set_attn_processor(AttnProcessor2_0())
+    pipe.vae.set_attn_processor(AttnProcessor2_0())
+
+    compiled = False
+    if compile:
+        try:
+            # Compilation paresseuse (au premier appel): en cas d'échec,
+            # exécution non compilée plutôt qu'une génération en erreur
+            torch._dynamo.config.suppress_errors = True
+            # Module.compile(): compile en place, le type du module ne change
+            # pas (config, save_pretrained et vues par scheduler intacts)
+            pipe.unet.compile()
+            pipe.vae.decoder.compile()
+            compiled = True
+        except Exception as e:
+            print(f"WARNING: torch.compile indisponible, execution non compilee: {e}")
+    return {"channels_last": True, "sdpa": True, "compiled": compiled}
+
+
+def autocast_context(bf16: bool):
+    """Autocast bfloat16 sur CPU si demandé, sinon contexte neutre."""
+    if bf16:
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return nullcontext()
@@ -0,0 +1,426 @@
+"""
+Pool multi-processus d'inférence CPU avec partitionnement des cœurs.
+
+PROBLÈME:
+---------
+Un seul StableDiffusionGenerator dans un seul processus laisse torch
+utiliser TOUS les cœurs pour UNE image à la fois. Or le gain des threads
+intra-op plafonne bien avant le nombre de cœurs (synchronisations,
+bande passante mémoire): sur 32 cœurs, 4 images en parallèle sur
+8 cœurs chacune produisent bien plus d'images/minute qu'une image
+sur 32 cœurs.
+
+SOLUTION:
+---------
+    Processus principal (API / Gradio)
+        │  generate()  → attend un worker libre
+        ▼
+    ┌──────────────┬──────────────┬──────────────┐
+    │  worker 0    │  worker 1    │  worker 2    │   (processus séparés)
+    │  cœurs 0-7   │  cœurs 8-15  │  cœurs 16-23 │   sched_setaffinity
+    │  8 threads   │  8 threads   │  8 threads   │   torch.set_num_threads
+    │  pipeline    │  pipeline    │  pipeline    │   un pipeline chacun
+    └──────────────┴──────────────┴──────────────┘
+
+- Chaque worker a son propre pipeline et un ensemble DISJOINT de cœurs
+- Les requêtes sont envoyées au premier worker libre
+- Avec un snapshot (SD_SNAPSHOT_DIR), les poids memory-mappés sont
+  partagés par tous les workers via le page cache
+- Les callbacks de progression restent dans le processus principal: le
+  worker envoie chaque GenerationProgress par la file de résultats
+- L'annulation traverse les processus via une valeur partagée par worker
+  (identifiant de la tâche annulée), vérifiée entre deux steps
+
+Le pool expose generate() et generate_batch() comme StableDiffusionGenerator:
+il se substitue au générateur direct (voir get_generator()).
+"""
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from PIL import Image
+from app.models.progress import all_cancelled
+from app.utils.cancellation import CancellationToken, GenerationCancelled
+from app.utils.config import settings
+from app.utils.metrics import track_generation
+
+
+def partition_cores(num_workers: int, threads_per_worker: Optional[int] = None) -> List[List[int]]:
+    """
+    Répartit les cœurs disponibles en ensembles disjoints, un par worker.
+
+    Args:
+        num_workers: Nombre de workers
+        threads_per_worker: Cœurs par worker (None = répartition équitable)
+
+    Returns:
+        Liste de listes d'identifiants de cœurs
+
+    Exemple (8 cœurs):
+        >>> partition_cores(2)
+        [[0, 1, 2, 3], [4, 5, 6, 7]]
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+
+    per_worker = threads_per_worker or max(1, len(cores) // num_workers)
+    if per_worker * num_workers > len(cores):
+        print(f"WARNING: {num_workers} workers x {per_worker} threads > {len(cores)} coeurs, partage des coeurs")
+
+    partitions = []
+    for i in range(num_workers):
+        start = (i * per_worker) % len(cores)
+        partitions.append([cores[(start + j) % len(cores)] for j in range(per_worker)])
+    return partitions
+
+
+class _TaskCancelFlag:
+    """
+    Équivalent d'un Event pour CancellationToken, côté worker.
+
+    "Annulé" = la valeur partagée contient l'identifiant de CETTE tâche:
+    une annulation tardive ne peut pas toucher la tâche suivante.
+    """
+
+    def __init__(self, cancelled_task, task_id: int):
+        self._cancelled_task = cancelled_task
+        self._task_id = task_id
+
+    def is_set(self) -> bool:
+        return self._cancelled_task.value == self._task_id
+
+    def set(self) -> None:
+        self._cancelled_task.value = self._task_id
+
+
+def _worker_main(worker_id: int, cores: List[int], tasks, results, cancelled_task) -> None:
+    """
+    Point d'entrée d'un processus worker.
+
+    1. Épingle le processus sur ses cœurs et règle torch en conséquence
+    2. Charge son propre pipeline (et le préchauffe si SD_WARMUP_ENABLED)
+    3. Exécute les tâches reçues jusqu'au signal d'arrêt (None)
+    """
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    import torch
+    torch.set_num_threads(len(cores))
+
+    from app.models.stable_diffusion import StableDiffusionGenerator
+    generator = StableDiffusionGenerator()
+    try:
+        generator.load()
+        if settings.SD_WARMUP_ENABLED:
+            # Préchauffé avant de se déclarer prêt: aucune tâche sur un worker froid
+            from app.models.warmup import parse_sizes, warm_up_generator
+            try:
+                warm_up_generator(generator, parse_sizes(settings.SD_WARMUP_SIZES), settings.SD_WARMUP_STEPS)
+            except Exception as e:
+                print(f"WARNING: Warm-up du worker {worker_id} en echec: {e}")
+        results.put(("ready", worker_id, None))
+    except Exception as e:
+        results.put(("load_error", worker_id, str(e)))
+        return
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, method, kwargs, progress_mask = task
+        if progress_mask:
+            # Un callback par image suivie: relaie la progression au parent
+            callbacks = [
+                (lambda progress, index=index: results.put(("progress", task_id, (index, progress))))
+                if tracked else None
+                for index, tracked in enumerate(progress_mask)
+            ]
+            if method == "generate":
+                kwargs["step_callback"] = callbacks[0]
+            else:
+                kwargs["step_callbacks"] = callbacks
+        # Un seul token pour toute la tâche: le parent ne l'annule que
+        # lorsque toutes les images de la tâche sont abandonnées
+        token = CancellationToken(event=_TaskCancelFlag(cancelled_task, task_id))
+        if method == "generate":
+            kwargs["cancel_token"] = token
+        else:
+            kwargs["cancel_tokens"] = [token] * len(kwargs["prompts"])
+        try:
+            output = getattr(generator, method)(**kwargs)
+            results.put(("result", task_id, output))
+        except GenerationCancelled as e:
+            results.put(("cancelled", task_id, str(e)))
+        except Exception as e:
+            results.put(("error", task_id, f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """État d'un worker côté processus principal."""
+
+    def __init__(self, worker_id: int, cores: List[int], context):
+        self.id = worker_id
+        self.cores = cores
+        self.tasks = context.Queue()
+        # Identifiant de la tâche à annuler (lu par le worker entre deux steps)
+        self.cancelled_task = context.Value("q", -1)
+        self.process = None
+        self.state = "starting"  # starting → ready (ou failed)
+        self.error: Optional[str] = None
+        self.tasks_done = 0
+
+
+class InferencePool:
+    """
+    Pool de N processus workers, chacun avec son pipeline et ses cœurs.
+
+    Args:
+        num_workers: Nombre de processus
+        threads_per_worker: Cœurs/threads par worker (None = équitable)
+
+    Les processus sont démarrés à la première utilisation (ou via start()).
+    """
+
+    def __init__(self, num_workers: int, threads_per_worker: Optional[int] = None):
+        self.num_workers = max(1, num_workers)
+        self.threads_per_worker = threads_per_worker
+        # "spawn": processus neufs, sans état torch/threads hérité du parent
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._workers: List[_Worker] = []
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._task_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._reader: Optional[threading.Thread] = None
+
+    # ========================================
+    # CYCLE DE VIE
+    # ========================================
+
+    def start(self) -> None:
+        """Démarre les processus workers (idempotent)."""
+        with self._lock:
+            if self._workers:
+                return
+            partitions = partition_cores(self.num_workers, self.threads_per_worker)
+            for worker_id, cores in enumerate(partitions):
+                worker = _Worker(worker_id, cores, self._context)
+                self._workers.append(worker)
+                self._spawn(worker)
+
+            self._reader = threading.Thread(
+                target=self._read_results, name="inference-pool-reader", daemon=True
+            )
+            self._reader.start()
+            print(f"OK: Pool d'inference demarre ({self.num_workers} workers, coeurs: {partitions})")
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Attend que tous les workers soient prêts (chargés et préchauffés).
+
+        Returns:
+            True si tous sont prêts, False si l'un a échoué ou au timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            states = [w.state for w in self._workers]
+            if states and all(state == "ready" for state in states):
+                return True
+            if "failed" in states or (deadline is not None and time.monotonic() > deadline):
+                return False
+            time.sleep(0.2)
+
+    def _spawn(self, worker: _Worker) -> None:
+        """Lance (ou relance) le processus d'un worker."""
+        worker.state = "starting"
+        worker.error = None
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(worker.id, worker.cores, worker.tasks, self._results, worker.cancelled_task),
+            name=f"sd-worker-{worker.id}",
+            daemon=True,
+        )
+        worker.process.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Arrête les workers après leur tâche en cours."""
+        with self._lock:
+            workers = list(self._workers)
+            self._workers = []
+        for worker in workers:
+            worker.tasks.put(None)
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def _read_results(self) -> None:
+        """Thread du processus principal: distribue les messages des workers."""
+        while True:
+            kind, key, payload = self._results.get()
+            if kind in ("ready", "load_error"):
+                workers = self._workers
+                if key >= len(workers):
+                    continue  # message tardif d'un pool arrêté
+                worker = workers[key]
+            if kind == "ready":
+                worker.state = "ready"
+                self._idle.put(worker)
+            elif kind == "load_error":
+                worker.state = "failed"
+                worker.error = payload
+                print(f"WARNING: Worker {key} n'a pas pu charger le modele: {payload}")
+            elif kind == "progress":
+                with self._lock:
+                    pending = self._pending.get(key)
+                if pending is not None:
+                    index, progress = payload
+                    try:
+                        pending["callbacks"][index](progress)
+                    except Exception as e:
+                        print(f"WARNING: Callback de progression en echec: {e}")
+            else:
+                with self._lock:
+                    pending = self._pending.pop(key, None)
+                if pending is not None:
+                    pending["kind"] = kind
+                    pending["payload"] = payload
+                    pending["done"].set()
+
+    # ========================================
+    # DISPATCH DES TÂCHES
+    # ========================================
+
+    def _acquire_worker(self, cancel_tokens: Optional[List[Optional[CancellationToken]]] = None) -> _Worker:
+        """Attend un worker libre (en détectant les workers tous en échec)."""
+        while True:
+            if all_cancelled(cancel_tokens):
+                raise GenerationCancelled("Generation annulee avant le debut")
+            try:
+                return self._idle.get(timeout=1.0)
+            except queue.Empty:
+                if self._workers and all(
+                    w.state == "failed" or not w.process.is_alive() for w in self._workers
+                ):
+                    raise RuntimeError(
+                        f"Aucun worker d'inference disponible: {self._workers[0].error}"
+                    )
+
+    def _call(
+        self,
+        method: str,
+        callbacks: Optional[List[Optional[Callable]]] = None,
+        cancel_tokens: Optional[List[Optional[CancellationToken]]] = None,
+        **kwargs
+    ) -> Any:
+        """
+        Exécute generator.<method>(**kwargs) sur un worker libre.
+
+        Les callbacks et tokens (non picklables) restent ici: seul un masque
+        des images suivies est envoyé au worker, et l'annulation passe par
+        la valeur partagée du worker.
+        """
+        self.start()
+        worker = self._acquire_worker(cancel_tokens)
+        task_id = next(self._task_ids)
+        pending = {"done": threading.Event(), "callbacks": callbacks or []}
+        with self._lock:
+            self._pending[task_id] = pending
+
+        def cancel_if_abandoned():
+            if all_cancelled(cancel_tokens):
+                worker.cancelled_task.value = task_id
+
+        for token in cancel_tokens or []:
+            if token is not None:
+                token.add_callback(cancel_if_abandoned)
+
+        progress_mask = [callback is not None for callback in callbacks] if callbacks else None
+        worker.tasks.put((task_id, method, kwargs, progress_mask))
+        try:
+            # Attente du résultat en surveillant que le worker est vivant
+            while not pending["done"].wait(timeout=1.0):
+                if not worker.process.is_alive():
+                    with self._lock:
+                        self._pending.pop(task_id, None)
+                    print(f"WARNING: Worker {worker.id} arrete (code {worker.process.exitcode}), redemarrage")
+                    self._spawn(worker)
+                    raise RuntimeError(f"Le worker d'inference {worker.id} s'est arrete pendant la generation")
+        finally:
+            if worker.process.is_alive() and worker.state == "ready":
+                worker.tasks_done += 1
+                self._idle.put(worker)
+
+        if pending["kind"] == "cancelled":
+            raise GenerationCancelled(pending["payload"])
+        if pending["kind"] == "error":
+            raise RuntimeError(pending["payload"])
+        return pending["payload"]
+
+    @track_generation
+    def generate(
+        self,
+        step_callback: Optional[Callable] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        **kwargs
+    ) -> Image.Image:
+        """Même interface que StableDiffusionGenerator.generate()."""
+        return self._call(
+            "generate",
+            callbacks=[step_callback] if step_callback else None,
+            cancel_tokens=[cancel_token] if cancel_token else None,
+            **kwargs
+        )
+
+    @track_generation
+    def generate_batch(
+        self,
+        step_callbacks: Optional[List[Optional[Callable]]] = None,
+        cancel_tokens: Optional[List[Optional[CancellationToken]]] = None,
+        **kwargs
+    ) -> List[Image.Image]:
+        """Même interface que StableDiffusionGenerator.generate_batch()."""
+        return self._call(
+            "generate_batch", callbacks=step_callbacks, cancel_tokens=cancel_tokens, **kwargs
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """État des workers (cœurs, PID, tâches traitées) pour le monitoring."""
+        return {
+            "workers": [
+                {
+                    "id": w.id,
+                    "pid": w.process.pid if w.process else None,
+                    "alive": bool(w.process and w.process.is_alive()),
+                    "state": w.state,
+                    "cores": w.cores,
+                    "tasks_done": w.tasks_done,
+                    "error": w.error,
+                }
+                for w in self._workers
+            ],
+            "idle": self._idle.qsize(),
+        }
+
+
+# Instance globale (créée à la première utilisation)
+_inference_pool: Optional[InferencePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_inference_pool() -> InferencePool:
+    """Retourne l'instance globale du pool d'inférence."""
+    global _inference_pool
+    with _pool_lock:
+        if _inference_pool is None:
+            _inference_pool = InferencePool(
+                num_workers=settings.SD_POOL_WORKERS,
+                threads_per_worker=settings.SD_POOL_THREADS_PER_WORKER,
+            )
+        return _inference_pool
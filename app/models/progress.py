@@ -0,0 +1,162 @@
+"""
+Progression step par step et aperçus basse résolution des générations.
+
+POURQUOI ?
+----------
+Une génération dure de 30s à 2min sur CPU. Sans retour intermédiaire,
+le client ne voit rien avant l'image finale. Le pipeline diffusers appelle
+un callback à la fin de chaque step de débruitage: on y publie
+- la progression (step i / N, temps écoulé, temps restant estimé)
+- tous les k steps, un aperçu calculé depuis les latents courants
+
+APERÇU "LATENT → RGB":
+----------------------
+Décoder les latents avec le VAE coûte presque autant qu'un step.
+On utilise à la place une projection LINÉAIRE des 4 canaux latents
+vers RGB (approximation connue pour SD 1.5): quelques microsecondes,
+image à 1/8 de la résolution finale (64x64 pour 512x512). Suffisant
+pour juger la composition et abandonner tôt si elle ne convient pas.
+"""
+import base64
+import io
+import time
+from typing import Any, Callable, Dict, List, Optional
+import torch
+from PIL import Image
+from app.utils.cancellation import CancellationToken, GenerationCancelled
+
+# Projection linéaire approchée des 4 canaux latents SD 1.5 vers RGB
+LATENT_RGB_FACTORS = [
+    [0.298, 0.207, 0.208],
+    [0.187, 0.286, 0.173],
+    [-0.158, 0.189, 0.264],
+    [-0.184, -0.271, -0.473],
+]
+
+
+class GenerationProgress:
+    """
+    État d'une génération à la fin d'un step de débruitage.
+
+    Args:
+        step: Steps terminés (1 à total_steps)
+        total_steps: Nombre total de steps
+        started_at: Début du débruitage (time.time())
+        preview: Aperçu basse résolution (None si pas calculé à ce step)
+    """
+
+    def __init__(self, step: int, total_steps: int, started_at: float,
+                 preview: Optional[Image.Image] = None):
+        self.step = step
+        self.total_steps = total_steps
+        self.elapsed = time.time() - started_at
+        self.preview = preview
+
+    @property
+    def fraction(self) -> float:
+        """Progression entre 0 et 1."""
+        return self.step / self.total_steps if self.total_steps else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Temps restant estimé (secondes), d'après la durée moyenne d'un step."""
+        if self.step <= 0:
+            return None
+        return self.elapsed / self.step * (self.total_steps - self.step)
+
+    def to_dict(self, include_preview: bool = True) -> Dict[str, Any]:
+        """Sérialisation JSON (aperçu en data URL JPEG)."""
+        data = {
+            "step": self.step,
+            "total_steps": self.total_steps,
+            "progress": self.fraction,
+            "elapsed": self.elapsed,
+            "eta": self.eta,
+        }
+        if include_preview:
+            data["preview"] = preview_to_data_url(self.preview) if self.preview is not None else None
+        return data
+
+
+def latents_to_preview(latents: torch.Tensor) -> Image.Image:
+    """
+    Aperçu RGB approché d'UN latent [4, h, w] (sans passer par le VAE).
+
+    Returns:
+        PIL.Image: Image h x w (1/8 de la résolution finale)
+    """
+    factors = torch.tensor(LATENT_RGB_FACTORS, dtype=torch.float32, device=latents.device)
+    rgb = torch.einsum("chw,cr->hwr", latents.float(), factors)
+    rgb = ((rgb + 1.0) / 2.0).clamp(0, 1).mul(255).round().to(torch.uint8)
+    return Image.fromarray(rgb.cpu().numpy())
+
+
+def preview_to_data_url(preview: Image.Image) -> str:
+    """Encode un aperçu en data URL JPEG (quelques Ko)."""
+    buffer = io.BytesIO()
+    preview.save(buffer, format="JPEG", quality=80)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def all_cancelled(cancel_tokens: Optional[List[Optional[CancellationToken]]]) -> bool:
+    """
+    True si TOUTES les images du batch sont annulées.
+
+    Une image sans token (None) n'est jamais annulée: tant qu'une image
+    du batch reste attendue, le batch continue.
+    """
+    return bool(cancel_tokens) and all(
+        token is not None and token.is_cancelled for token in cancel_tokens
+    )
+
+
+def make_step_end_callback(
+    step_callbacks: Optional[List[Optional[Callable[[GenerationProgress], None]]]],
+    total_steps: int,
+    preview_every: int = 0,
+    cancel_tokens: Optional[List[Optional[CancellationToken]]] = None,
+    step_times: Optional[List[float]] = None,
+) -> Callable:
+    """
+    Construit le callback_on_step_end passé au pipeline diffusers.
+
+    Args:
+        step_callbacks: Un callback par image du batch (None = pas de suivi)
+        total_steps: num_inference_steps de la génération
+        preview_every: Calcule un aperçu tous les k steps (0 = jamais);
+                       le dernier step en a toujours un si k > 0
+        cancel_tokens: Un token par image; quand toutes les images sont
+                       annulées, lève GenerationCancelled entre deux steps
+        step_times: Reçoit time.perf_counter() à la fin de chaque step
+                    (mesure du débruitage, voir app/utils/timings.py)
+
+    Une exception levée par un callback interrompt la génération
+    (elle remonte jusqu'à l'appelant du pipeline).
+    """
+    started_at = time.time()
+    step_callbacks = step_callbacks or []
+
+    def on_step_end(pipe, step_index: int, timestep, callback_kwargs: Dict) -> Dict:
+        if step_times is not None:
+            step_times.append(time.perf_counter())
+
+        # Annulation vérifiée entre deux steps: au plus un step UNet perdu
+        if all_cancelled(cancel_tokens):
+            raise GenerationCancelled(f"Generation annulee au step {step_index + 1}/{total_steps}")
+
+        step = step_index + 1
+        latents = callback_kwargs.get("latents")
+        with_preview = (
+            preview_every > 0 and latents is not None
+            and (step % preview_every == 0 or step == total_steps)
+        )
+        for index, callback in enumerate(step_callbacks):
+            if callback is None:
+                continue
+            if cancel_tokens and cancel_tokens[index] is not None and cancel_tokens[index].is_cancelled:
+                continue  # Image annulée dans un batch qui continue
+            preview = latents_to_preview(latents[index]) if with_preview else None
+            callback(GenerationProgress(step, total_steps, started_at, preview))
+        return callback_kwargs
+
+    return on_step_end
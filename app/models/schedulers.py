@@ -0,0 +1,155 @@
+"""
+Registre des schedulers (samplers) sélectionnables par requête.
+
+POURQUOI ?
+----------
+Le scheduler décide comment le bruit est retiré à chaque step. Il ne
+contient AUCUN poids: changer de scheduler réutilise le UNet, le VAE et
+le text encoder déjà chargés. Chaque entrée du registre fixe la classe
+diffusers, ses réglages, et un nombre de steps adapté:
+
+    nom            sampler                     steps   usage
+    dpmpp          DPM-Solver++ 2M             25      défaut, bon compromis
+    dpmpp_karras   DPM-Solver++ 2M Karras      20      plus net en peu de steps
+    euler          Euler                       30      stable, prévisible
+    euler_a        Euler ancestral             30      plus de variété
+    unipc          UniPC                       15      brouillons rapides
+    lcm            LCM (Latent Consistency)    6       quasi temps réel *
+
+* LCM ne fonctionne qu'avec des poids distillés LCM (modèle LCM ou
+  LoRA LCM fusionnée, voir SD_LCM_LORA): il n'est proposé que si le
+  générateur les a détectés.
+
+Tous les schedulers sont construits depuis la configuration du scheduler
+d'origine du modèle (betas, nombre de timesteps d'entraînement...).
+
+Exemple:
+    >>> scheduler = build_scheduler("unipc", pipe.scheduler.config)
+"""
+from typing import Any, Dict, List, Optional
+from diffusers import (
+    DPMSolverMultistepScheduler,
+    EulerAncestralDiscreteScheduler,
+    EulerDiscreteScheduler,
+    LCMScheduler,
+    UniPCMultistepScheduler,
+)
+
+# Scheduler utilisé quand ni la requête ni le template n'en choisissent
+DEFAULT_SCHEDULER = "dpmpp"
+
+
+class SchedulerSpec:
+    """
+    Entrée du registre.
+
+    Args:
+        name: Identifiant utilisé dans les requêtes
+        label: Nom lisible
+        scheduler_class: Classe diffusers
+        default_steps: Nombre de steps recommandé
+        guidance_scale: CFG recommandé (None = celui de la requête ou du template)
+        config_overrides: Réglages appliqués à la configuration d'origine
+        requires_lcm: True si le scheduler exige des poids distillés LCM
+    """
+
+    def __init__(
+        self,
+        name: str,
+        label: str,
+        scheduler_class,
+        default_steps: int,
+        guidance_scale: Optional[float] = None,
+        config_overrides: Optional[Dict[str, Any]] = None,
+        requires_lcm: bool = False,
+    ):
+        self.name = name
+        self.label = label
+        self.scheduler_class = scheduler_class
+        self.default_steps = default_steps
+        self.guidance_scale = guidance_scale
+        self.config_overrides = config_overrides or {}
+        self.requires_lcm = requires_lcm
+
+    def to_dict(self, available: bool = True) -> Dict[str, Any]:
+        """Description JSON (GET /schedulers)."""
+        return {
+            "name": self.name,
+            "label": self.label,
+            "default_steps": self.default_steps,
+            "guidance_scale": self.guidance_scale,
+            "requires_lcm": self.requires_lcm,
+            "available": available,
+        }
+
+
+SCHEDULERS: Dict[str, SchedulerSpec] = {
+    spec.name: spec for spec in [
+        SchedulerSpec(
+            "dpmpp", "DPM-Solver++ 2M", DPMSolverMultistepScheduler, 25,
+            config_overrides={"algorithm_type": "dpmsolver++"},
+        ),
+        SchedulerSpec(
+            "dpmpp_karras", "DPM-Solver++ 2M Karras", DPMSolverMultistepScheduler, 20,
+            config_overrides={"algorithm_type": "dpmsolver++", "use_karras_sigmas": True},
+        ),
+        SchedulerSpec("euler", "Euler", EulerDiscreteScheduler, 30),
+        SchedulerSpec("euler_a", "Euler ancestral", EulerAncestralDiscreteScheduler, 30),
+        SchedulerSpec("unipc", "UniPC", UniPCMultistepScheduler, 15),
+        SchedulerSpec(
+            "lcm", "LCM (Latent Consistency)", LCMScheduler, 6,
+            guidance_scale=1.5,  # Les modèles LCM ignorent presque le CFG au-delà de 2
+            requires_lcm=True,
+        ),
+    ]
+}
+
+
+def get_scheduler_spec(name: Optional[str]) -> SchedulerSpec:
+    """
+    Entrée du registre (None = DEFAULT_SCHEDULER).
+
+    Raises:
+        ValueError: Nom inconnu
+    """
+    name = (name or DEFAULT_SCHEDULER).lower()
+    if name not in SCHEDULERS:
+        raise ValueError(
+            f"Scheduler inconnu: {name} (disponibles: {', '.join(SCHEDULERS)})"
+        )
+    return SCHEDULERS[name]
+
+
+def available_schedulers(lcm_available: bool = False) -> List[str]:
+    """Noms utilisables avec les poids chargés."""
+    return [
+        name for name, spec in SCHEDULERS.items()
+        if lcm_available or not spec.requires_lcm
+    ]
+
+
+def build_scheduler(name: Optional[str], base_config: Dict[str, Any]):
+    """
+    Construit une NOUVELLE instance de scheduler.
+
+    Un scheduler garde l'état de la boucle de débruitage (timesteps, step
+    courant): chaque génération doit avoir sa propre instance.
+
+    Args:
+        name: Nom du registre (None = DEFAULT_SCHEDULER)
+        base_config: Configuration du scheduler d'origine du modèle
+
+    Returns:
+        Instance de la classe diffusers du registre
+    """
+    spec = get_scheduler_spec(name)
+    config = dict(base_config)
+    config.update(spec.config_overrides)
+
+    # Fix de compatibilité pour DreamShaper-8
+    # Certains modèles ont final_sigmas_type="zero" incompatible avec algorithm_type="deis"
+    if config.get("final_sigmas_type") == "zero" and config.get("algorithm_type") == "deis":
+        # Correction: utiliser "sigma_min" au lieu de "zero"
+        config["final_sigmas_type"] = "sigma_min"
+
+    return spec.scheduler_class.from_config(config)
@@ -0,0 +1,237 @@
+"""
+Snapshots du pipeline Stable Diffusion pour un démarrage à froid rapide.
+
+PROBLÈME:
+---------
+StableDiffusionPipeline.from_pretrained() résout le cache Hugging Face,
+construit les modules puis COPIE les poids dans de nouveaux tenseurs
+(et les convertit au dtype demandé). Chaque redémarrage de worker repaie
+ce coût, et chaque processus garde sa propre copie des ~4GB de poids.
+
+SOLUTION:
+---------
+1. Écrire une fois le pipeline entièrement configuré (dtype final,
+   scheduler DPM-Solver++ appliqué) dans un dossier local de fichiers
+   safetensors (CLI ci-dessous)
+2. Au démarrage, construire les modules "à vide" (meta device) puis leur
+   assigner directement les tenseurs memory-mappés des fichiers:
+   aucune copie, les pages sont lues à la demande depuis le page cache
+
+Avantages:
+- Redémarrage en quelques secondes (pas de copie ni de conversion)
+- Plusieurs processus sur la même machine partagent les mêmes pages
+  physiques (mapping privé en copy-on-write des mêmes fichiers)
+
+STRUCTURE D'UN SNAPSHOT:
+------------------------
+    models/sd_snapshot/
+    ├── snapshot.json           # Manifeste (modèle source, dtype, scheduler)
+    ├── model_index.json
+    ├── unet/                   # config.json + *.safetensors
+    ├── vae/
+    ├── text_encoder/
+    ├── tokenizer/
+    └── scheduler/              # scheduler_config.json (DPM-Solver++)
+
+Usage:
+    python -m app.models.snapshot --output models/sd_snapshot
+    # puis dans .env:
+    SD_SNAPSHOT_DIR=models/sd_snapshot
+"""
+import argparse
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+import torch
+import diffusers
+from diffusers import AutoencoderKL, StableDiffusionPipeline, UNet2DConditionModel
+from safetensors.torch import load_file
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+
+# Nom du manifeste: sa présence indique un snapshot complet
+MANIFEST_NAME = "snapshot.json"
+
+
+def read_manifest(snapshot_dir: Union[str, Path]) -> Optional[Dict]:
+    """Lit le manifeste d'un snapshot (None si absent ou incomplet)."""
+    manifest_path = Path(snapshot_dir) / MANIFEST_NAME
+    if not manifest_path.is_file():
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def snapshot_mismatch(manifest: Optional[Dict], model_id: str, dtype: str) -> Optional[str]:
+    """
+    Raison pour laquelle un snapshot ne peut pas servir ce modèle.
+
+    Un snapshot d'un autre modèle (SD_SNAPSHOT_DIR resté d'une ancienne
+    configuration) servirait ses images sous l'identité de SD_MODEL_ID,
+    y compris dans le cache de résultats.
+
+    Returns:
+        str: Raison du refus, None si le snapshot est utilisable
+    """
+    if manifest is None:
+        return "snapshot introuvable"
+    if manifest.get("model_id") != model_id:
+        return f"snapshot de {manifest.get('model_id')} (attendu {model_id})"
+    if manifest.get("dtype") != dtype:
+        return f"snapshot en {manifest.get('dtype')} (attendu {dtype})"
+    return None
+
+
+def save_snapshot(
+    pipe: StableDiffusionPipeline,
+    output_dir: Union[str, Path],
+    model_id: str,
+    lcm: bool = False,
+) -> Path:
+    """
+    Écrit le pipeline configuré dans un dossier de fichiers safetensors.
+
+    L'écriture se fait dans un dossier temporaire renommé à la fin:
+    un snapshot interrompu n'est jamais pris pour un snapshot valide.
+
+    Args:
+        pipe: Pipeline chargé (dtype final, scheduler configuré)
+        output_dir: Dossier de destination (remplacé s'il existe)
+        model_id: Identifiant du modèle source (traçabilité)
+        lcm: True si les poids sont distillés LCM (scheduler "lcm" utilisable)
+
+    Returns:
+        Path: Dossier du snapshot
+    """
+    output_dir = Path(output_dir)
+    tmp_dir = output_dir.with_name(output_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+
+    # safe_serialization=True: poids en .safetensors (memory-mappables)
+    pipe.save_pretrained(str(tmp_dir), safe_serialization=True)
+
+    manifest = {
+        "model_id": model_id,
+        "dtype": str(pipe.unet.dtype).replace("torch.", ""),
+        "scheduler": type(pipe.scheduler).__name__,
+        "lcm": lcm,
+        "diffusers_version": diffusers.__version__,
+        "created_at": time.time(),
+    }
+    with open(tmp_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    tmp_dir.rename(output_dir)
+    return output_dir
+
+
+def _load_weights(module: torch.nn.Module, folder: Path) -> torch.nn.Module:
+    """
+    Assigne au module les tenseurs memory-mappés des fichiers safetensors.
+
+    assign=True remplace les paramètres "meta" par les tenseurs du fichier
+    eux-mêmes (pas de copie): le module lit directement le mapping mémoire.
+    """
+    state_dict = {}
+    files = sorted(folder.glob("*.safetensors"))
+    if not files:
+        raise FileNotFoundError(f"Aucun fichier safetensors dans {folder}")
+    for weights_file in files:
+        state_dict.update(load_file(str(weights_file), device="cpu"))
+    module.load_state_dict(state_dict, strict=True, assign=True)
+    return module.eval()
+
+
+def load_snapshot(
+    snapshot_dir: Union[str, Path],
+    device: str = "cpu",
+) -> StableDiffusionPipeline:
+    """
+    Charge un snapshot sans copier les poids (memory-mapping).
+
+    Les modules sont instanciés sur le meta device (aucune allocation),
+    puis reçoivent les tenseurs mappés. Sur GPU, .to(device) copie
+    évidemment les poids vers la VRAM.
+
+    Args:
+        snapshot_dir: Dossier écrit par save_snapshot()
+        device: "cpu" ou "cuda"
+
+    Returns:
+        StableDiffusionPipeline: Pipeline prêt (scheduler déjà configuré)
+    """
+    from accelerate import init_empty_weights
+
+    snapshot_dir = Path(snapshot_dir)
+    if read_manifest(snapshot_dir) is None:
+        raise FileNotFoundError(f"Snapshot invalide (pas de {MANIFEST_NAME}): {snapshot_dir}")
+
+    with init_empty_weights():
+        unet = UNet2DConditionModel.from_config(
+            UNet2DConditionModel.load_config(str(snapshot_dir / "unet"))
+        )
+        vae = AutoencoderKL.from_config(
+            AutoencoderKL.load_config(str(snapshot_dir / "vae"))
+        )
+        text_encoder = CLIPTextModel(
+            CLIPTextConfig.from_pretrained(str(snapshot_dir / "text_encoder"))
+        )
+
+    unet = _load_weights(unet, snapshot_dir / "unet")
+    vae = _load_weights(vae, snapshot_dir / "vae")
+    text_encoder = _load_weights(text_encoder, snapshot_dir / "text_encoder")
+
+    tokenizer = CLIPTokenizer.from_pretrained(str(snapshot_dir / "tokenizer"))
+
+    # Le scheduler est recréé avec la classe enregistrée (DPM-Solver++)
+    scheduler_config_path = snapshot_dir / "scheduler" / "scheduler_config.json"
+    with open(scheduler_config_path, "r", encoding="utf-8") as f:
+        scheduler_class = getattr(diffusers, json.load(f)["_class_name"])
+    scheduler = scheduler_class.from_pretrained(str(snapshot_dir), subfolder="scheduler")
+
+    pipe = StableDiffusionPipeline(
+        vae=vae,
+        text_encoder=text_encoder,
+        tokenizer=tokenizer,
+        unet=unet,
+        scheduler=scheduler,
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False,
+    )
+    return pipe.to(device)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Créer un snapshot local du pipeline Stable Diffusion configuré"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="models/sd_snapshot",
+        help="Dossier de destination du snapshot (défaut: models/sd_snapshot)"
+    )
+    args = parser.parse_args()
+
+    from app.models.stable_diffusion import StableDiffusionGenerator
+
+    # Mode default: poids contigus (safetensors refuse channels_last), non compilés
+    generator = StableDiffusionGenerator(inference_mode="default")
+    print(f"Chargement de {generator.model_id}...")
+    generator.load()
+
+    print(f"Ecriture du snapshot dans {args.output}...")
+    output_dir = save_snapshot(generator.pipe, args.output, model_id=generator.model_id,
+                               lcm=generator.lcm_available)
+    manifest = read_manifest(output_dir)
+    print(f"OK: Snapshot cree ({manifest['dtype']}, scheduler {manifest['scheduler']})")
+    print(f"INFO: Ajoutez SD_SNAPSHOT_DIR={output_dir} dans .env pour l'utiliser")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,33 @@
 Générateur d'images avec Stable Diffusion (DreamShaper-8).
 
 Ce module gère:
-- Chargement du modèle Stable Diffusion
-- Configuration du scheduler pour génération optimisée
-- Optimisations mémoire (CPU/GPU)
+- Chargement paresseux du modèle Stable Diffusion (au premier usage)
+- Choix du scheduler par requête (registre app/models/schedulers.py)
+- Optimisations mémoire (CPU/GPU), haute résolution à mémoire bornée
+- Cache des embeddings CLIP (prompts et negative prompts récurrents)
 - Génération d'images à partir de prompts textuels
 """
+import threading
+import time
 import torch
-from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
+from diffusers import StableDiffusionPipeline
 from PIL import Image
-from typing import Optional
+from typing import Callable, List, Optional
 from app.utils.config import settings
+from app.models.progress import GenerationProgress, all_cancelled, make_step_end_callback
+from app.utils.cancellation import CancellationToken, GenerationCancelled
+from app.utils.timings import StageTimings, attach_timings
+from app.utils.metrics import (
+    MODEL_LOADED, MODEL_LOAD_SECONDS, TEXT_EMBEDDING_CACHE_HITS, TEXT_EMBEDDING_CACHE_MISSES, track_generation
+)
+from app.models.text_embedding_cache import TextEmbeddingCache
+from app.models.snapshot import load_snapshot, read_manifest, snapshot_mismatch
+from app.models.tiny_pipeline import TINY_MODEL_ID, build_tiny_pipeline
+from app.models.schedulers import available_schedulers, build_scheduler, get_scheduler_spec
+from app.models.highres import attention_max_elements, bound_attention_memory, decode_latents, use_tiled_decode
+from app.models.inference_modes import (
+    INFERENCE_MODES, apply_optimized_mode, autocast_context, cpu_supports_bf16, enable_compile_cache
+)
 
 class StableDiffusionGenerator:
     """
@@ -19,21 +36,36 @@ class StableDiffusionGenerator:
     
     Architecture:
     - Modèle: DreamShaper-8 (variante optimisée de SD 1.5)
-    - Scheduler: DPM-Solver++ (plus rapide que DDIM)
+    - Scheduler: DPM-Solver++ par défaut, au choix par requête (Euler, UniPC, LCM...)
     - Device: GPU (CUDA) ou CPU selon configuration
     
     Optimisations appliquées:
-    - Attention slicing: Réduit l'usage mémoire
+    - Attention slicing: Réduit l'usage mémoire (mode "default")
+    - Mode "optimized": channels_last, attention SDPA, torch.compile et
+      autocast bfloat16 (voir app/models/inference_modes.py)
     - Mixed precision (float16/float32): Accélère le calcul
-    - Scheduler optimisé: DPM-Solver pour génération en 20-50 steps
+    - Scheduler optimisé: DPM-Solver pour génération en 20-50 steps,
+      UniPC/LCM pour des brouillons en 4-15 steps
+    - Cache LRU des embeddings CLIP: évite de ré-encoder les textes récurrents
     """
-    def __init__(self):
+    # Étapes du chargement, dans l'ordre (pour le suivi de progression)
+    LOAD_STAGES = ["weights", "scheduler", "memory_optimizations"]
+    
+    def __init__(self, inference_mode: Optional[str] = None):
         """
-        Initialise le générateur Stable Diffusion.
+        Initialise le générateur Stable Diffusion SANS charger le modèle.
+        
+        Args:
+            inference_mode: "default" ou "optimized" (None = SD_INFERENCE_MODE)
+        
+        Le chargement (~4GB) est paresseux: il a lieu au premier appel de
+        generate() / generate_batch() ou explicitement via load().
+        Importer ce module (API, Gradio, tests, RL) reste donc instantané.
         
-        Processus d'initialisation:
-        1. Configuration du device (GPU/CPU) et du dtype (float16/float32)
-        2. Téléchargement/chargement du modèle DreamShaper-8 depuis Hugging Face
+        Processus de chargement (voir load()):
+        1. Résolution du device (GPU/CPU) et du dtype FINAL (float16/float32)
+        2. Chargement depuis le snapshot local (SD_SNAPSHOT_DIR, memory-mappé)
+           ou téléchargement/chargement du modèle DreamShaper-8 (une seule fois)
         3. Configuration du scheduler optimisé (DPM-Solver++)
         4. Application des optimisations mémoire
         
@@ -41,95 +73,375 @@ class StableDiffusionGenerator:
         Hugging Face et mis en cache localement.
         """
         # Configuration du device et du type de précision
+        # Le dtype est résolu AVANT le chargement: pas de double from_pretrained
         self.device = settings.SD_DEVICE
-        self.dtype = torch.float16 if settings.SD_DTYPE == "float16" else torch.float32
+        self.dtype = self._resolve_dtype(settings.SD_DTYPE, self.device)
+        self.inference_mode = self._resolve_inference_mode(inference_mode or settings.SD_INFERENCE_MODE)
+        
+        # Modèle chargé: DreamShaper-8, ou le pipeline miniature (benchmarks, CI)
+        self.model_id = TINY_MODEL_ID if settings.SD_TINY_PIPELINE else settings.SD_MODEL_ID
+        
+        # Cache des sorties du text encoder, clé = texte exact
+        self.text_embedding_cache = TextEmbeddingCache(
+            max_bytes=int(settings.SD_TEXT_EMBED_CACHE_MB * 1024 * 1024)
+        )
+        
+        # État du chargement: "unloaded" → "loading" → "ready" (ou "failed")
+        self._pipe = None
+        self._load_lock = threading.Lock()
+        self.state = "unloaded"
+        self.load_stage: Optional[str] = None
+        self.load_error: Optional[str] = None
+        self.load_started_at: Optional[float] = None
+        self.load_time: Optional[float] = None
+        self.load_source: Optional[str] = None  # "snapshot", "hub", "tiny" ou "injected"
+        
+        # Configuration du scheduler d'origine: base de tous les schedulers
+        # du registre (construits à chaque génération, sans recharger le UNet)
+        self.scheduler_config: Optional[dict] = None
+        # True si les poids sont distillés LCM (modèle LCM ou LoRA LCM fusionnée)
+        self.lcm_available = False
+        
+        # Mode "optimized": UNet/VAE compilés, génération en autocast bfloat16
+        self.compiled = False
+        # Self-attention du UNet découpée en blocs au-delà de SD_ATTENTION_MAX_MB
+        self.attention_chunking = False
+        self.bf16_autocast = self._bf16_configured()
+    
+    @staticmethod
+    def _resolve_dtype(dtype_name: str, device: str) -> torch.dtype:
+        """
+        Détermine le dtype final selon la configuration et le device.
+        
+        CPU mode : float32 forcé pour compatibilité et stabilité
+        (float16 est lent et instable sur CPU).
+        """
+        if dtype_name == "float16" and device != "cuda":
+            print("WARNING: float16 sur CPU non recommande, passage a float32 pour compatibilite")
+            return torch.float32
+        return torch.float16 if dtype_name == "float16" else torch.float32
+    
+    @staticmethod
+    def _resolve_inference_mode(mode: str) -> str:
+        """Valide le mode d'inférence ("default" si inconnu)."""
+        if mode not in INFERENCE_MODES:
+            print(f"WARNING: Mode d'inference inconnu '{mode}', passage au mode default")
+            return "default"
+        return mode
+    
+    def _bf16_configured(self) -> bool:
+        """True si la génération tourne en autocast bfloat16 (connu avant le chargement)."""
+        return (
+            self.inference_mode == "optimized"
+            and settings.SD_BF16_AUTOCAST
+            and self.device == "cpu"
+            and self.dtype == torch.float32
+            and cpu_supports_bf16()
+        )
+    
+    @property
+    def pipe(self) -> StableDiffusionPipeline:
+        """Pipeline diffusers, chargé à la première utilisation."""
+        if self._pipe is None:
+            self.load()
+        return self._pipe
+    
+    @property
+    def is_loaded(self) -> bool:
+        """True si le pipeline est chargé et prêt."""
+        return self._pipe is not None
+    
+    def load(self) -> None:
+        """
+        Charge le pipeline (idempotent, thread-safe).
+        
+        Appelé automatiquement à la première génération, ou explicitement
+        au démarrage pour "préchauffer" le service. Les appels concurrents
+        attendent la fin du premier chargement.
+        
+        Raises:
+            Exception: Erreur de chargement (state passe à "failed",
+                       un appel ultérieur retentera le chargement)
+        """
+        with self._load_lock:
+            if self._pipe is not None:
+                return
+            
+            self.state = "loading"
+            self.load_error = None
+            self.load_started_at = time.time()
+            try:
+                self._pipe = self._load_pipeline()
+            except Exception as e:
+                self.state = "failed"
+                self.load_error = str(e)
+                self.load_stage = None
+                print(f"WARNING: Echec du chargement du modele {self.model_id}: {e}")
+                raise
+            
+            self.load_time = time.time() - self.load_started_at
+            self.load_stage = None
+            self.state = "ready"
+            MODEL_LOAD_SECONDS.set(self.load_time)
+            print(f"OK: Modele {self.model_id} charge en {self.load_time:.1f}s ({self.device}, {self.dtype})")
+    
+    def use_pipeline(self, pipe: StableDiffusionPipeline, model_id: str = TINY_MODEL_ID,
+                     source: str = "injected") -> None:
+        """
+        Remplace le pipeline par un pipeline déjà construit (benchmarks, tests).
+        
+        Le cache des embeddings est vidé: il dépend du text encoder.
+        
+        Args:
+            pipe: Pipeline diffusers prêt à l'emploi (ex: build_tiny_pipeline())
+            model_id: Identifiant affiché dans le statut et l'empreinte du cache
+            source: Valeur de load_source
+        """
+        with self._load_lock:
+            self._apply_memory_optimizations(pipe)
+            self.scheduler_config = dict(pipe.scheduler.config)
+            self.lcm_available = type(pipe.scheduler).__name__ == "LCMScheduler"
+            self._pipe = pipe
+            self.model_id = model_id
+            self.text_embedding_cache.clear()
+            self.state = "ready"
+            self.load_stage = None
+            self.load_error = None
+            self.load_source = source
+    
+    def _load_pipeline(self) -> StableDiffusionPipeline:
+        """Construit et configure le pipeline (une seule passe)."""
+        self.load_stage = "weights"
+        
+        # ========================================
+        # PIPELINE MINIATURE (BENCHMARKS, CI)
+        # ========================================
+        # Construit localement, aucun téléchargement
+        if settings.SD_TINY_PIPELINE:
+            pipe = build_tiny_pipeline(dtype=self.dtype).to(self.device)
+            self.load_source = "tiny"
+            self.scheduler_config = dict(pipe.scheduler.config)
+            self.lcm_available = False
+            self.load_stage = "memory_optimizations"
+            self._apply_memory_optimizations(pipe)
+            return pipe
+        
+        # ========================================
+        # SNAPSHOT LOCAL (DÉMARRAGE RAPIDE)
+        # ========================================
+        # Si un snapshot compatible existe, les poids sont memory-mappés
+        # sans copie et le scheduler est déjà configuré
+        snapshot_dir = settings.SD_SNAPSHOT_DIR
+        if snapshot_dir:
+            manifest = read_manifest(snapshot_dir)
+            mismatch = snapshot_mismatch(
+                manifest, settings.SD_MODEL_ID, str(self.dtype).replace("torch.", "")
+            )
+            if mismatch is not None:
+                print(f"WARNING: {snapshot_dir}: {mismatch}, chargement depuis Hugging Face")
+            else:
+                pipe = load_snapshot(snapshot_dir, device=self.device)
+                self.load_source = "snapshot"
+                self.scheduler_config = dict(pipe.scheduler.config)
+                self.lcm_available = bool(manifest.get("lcm", False))
+                self.load_stage = "memory_optimizations"
+                self._apply_memory_optimizations(pipe)
+                return pipe
         
         # ========================================
         # CHARGEMENT DU MODÈLE STABLE DIFFUSION
         # ========================================
         # Télécharge depuis Hugging Face Hub au premier lancement
         # Modèle utilisé: DreamShaper-8 (spécialisé art créatif)
-        self.pipe = StableDiffusionPipeline.from_pretrained(
+        self.load_source = "hub"
+        pipe = StableDiffusionPipeline.from_pretrained(
             settings.SD_MODEL_ID,
-            dtype=self.dtype,              # Précision (float16 pour GPU, float32 pour CPU)
+            dtype=self.dtype,              # Précision finale (float16 GPU, float32 CPU)
             safety_checker=None,           # Désactivé pour plus de liberté créative
             requires_safety_checker=False  # Ne pas exiger de vérificateur de contenu
         ).to(self.device)
         
+        # Configuration d'origine: base de tous les schedulers du registre
+        # Un modèle distillé LCM est livré avec un LCMScheduler
+        self.scheduler_config = dict(pipe.scheduler.config)
+        self.lcm_available = type(pipe.scheduler).__name__ == "LCMScheduler"
+        
+        # LoRA LCM (optionnel): 4-8 steps avec le scheduler "lcm"
+        # Nécessite peft; fusionnée dans le UNet (aucun surcoût par step)
+        if settings.SD_LCM_LORA:
+            try:
+                pipe.load_lora_weights(settings.SD_LCM_LORA)
+                pipe.fuse_lora()
+                pipe.unload_lora_weights()
+                self.lcm_available = True
+                print(f"OK: LoRA LCM {settings.SD_LCM_LORA} fusionnee (scheduler 'lcm' disponible)")
+            except Exception as e:
+                print(f"WARNING: LoRA LCM {settings.SD_LCM_LORA} non chargee (peft installe ?): {e}")
+        
         # ========================================
         # CONFIGURATION DU SCHEDULER OPTIMISÉ
         # ========================================
         # Le scheduler contrôle le processus de débruitage (denoising)
         # DPM-Solver++: Plus rapide que DDIM, même qualité en moins de steps
         # Avantage: Génération en 20-50 steps vs 50-80 steps avec DDIM
+        # Chaque génération reconstruit ensuite SON scheduler (voir _pipeline_for);
+        # celui-ci est le scheduler par défaut enregistré dans les snapshots
+        self.load_stage = "scheduler"
         try:
-            scheduler_config = self.pipe.scheduler.config.copy()
-            
-            # Fix de compatibilité pour DreamShaper-8
-            # Certains modèles ont final_sigmas_type="zero" incompatible avec algorithm_type="deis"
-            if hasattr(scheduler_config, 'final_sigmas_type'):
-                if scheduler_config.get('final_sigmas_type') == 'zero' and \
-                   scheduler_config.get('algorithm_type') == 'deis':
-                    # Correction: utiliser "sigma_min" au lieu de "zero"
-                    scheduler_config['final_sigmas_type'] = 'sigma_min'
-            
-            # Appliquer le nouveau scheduler optimisé
-            self.pipe.scheduler = DPMSolverMultistepScheduler.from_config(
-                scheduler_config
-            )
+            pipe.scheduler = build_scheduler(None, self.scheduler_config)
         except Exception as e:
             # Fallback: Utiliser le scheduler par défaut du modèle si erreur
             # Cela n'affecte pas la qualité, juste la vitesse
             print(f"WARNING: Impossible de configurer DPM-Solver, utilisation du scheduler par defaut: {e}")
             print("INFO: Le modele utilisera son scheduler par defaut (generalement aussi efficace)")
         
-        # ========================================
-        # OPTIMISATIONS MÉMOIRE
-        # ========================================
-        # Ces optimisations permettent de:
-        # - Réduire l'usage mémoire VRAM/RAM
-        # - Éviter les OutOfMemory errors
-        # - Permettre génération sur hardware limité
+        self.load_stage = "memory_optimizations"
+        self._apply_memory_optimizations(pipe)
+        return pipe
+    
+    def _apply_memory_optimizations(self, pipe: StableDiffusionPipeline) -> None:
+        """
+        Optimisations d'exécution (non sauvegardées dans les poids).
         
-        if self.device == "cuda":
+        Ces optimisations permettent de:
+        - Réduire l'usage mémoire VRAM/RAM
+        - Éviter les OutOfMemory errors
+        - Permettre génération sur hardware limité
+        
+        Mode "optimized": remplacées par channels_last + attention SDPA
+        (+ torch.compile), plus rapides à mémoire quasi égale
+        
+        Dans les deux modes, la self-attention des grandes images est
+        ensuite découpée en blocs (voir app/models/highres.py)
+        """
+        if self.inference_mode == "optimized":
+            if settings.SD_TORCH_COMPILE:
+                enable_compile_cache(settings.SD_COMPILE_CACHE_DIR)
+            applied = apply_optimized_mode(pipe, compile=settings.SD_TORCH_COMPILE)
+            self.compiled = applied["compiled"]
+        elif self.device == "cuda":
             # GPU: Attention slicing pour réduire usage VRAM
             # Divise les calculs d'attention en chunks plus petits
-            self.pipe.enable_attention_slicing()
+            pipe.enable_attention_slicing()
             
             # xFormers (optionnel, si installé): Encore plus d'optimisation
             # Réduit VRAM de 30-40% supplémentaires
-            # self.pipe.enable_xformers_memory_efficient_attention()
+            # pipe.enable_xformers_memory_efficient_attention()
         else:
             # CPU: Attention slicing critique pour performance acceptable
             # Sans cela, génération prend 10-20 minutes
             # Avec: ~1-2 minutes
-            self.pipe.enable_attention_slicing(1)
-            # CPU mode : utiliser float32 pour compatibilité et stabilité
-            if self.dtype == torch.float16:
-                print("WARNING: float16 sur CPU non recommande, passage a float32 pour compatibilite")
-                self.dtype = torch.float32
-                # Recharger avec float32
-                self.pipe = StableDiffusionPipeline.from_pretrained(
-                    settings.SD_MODEL_ID,
-                    dtype=torch.float32,  # Utiliser dtype au lieu de torch_dtype (déprécié)
-                    safety_checker=None,
-                    requires_safety_checker=False
-                ).to(self.device)
-                
-                # Configurer le scheduler (gérer les configurations différentes)
-                try:
-                    scheduler_config = self.pipe.scheduler.config.copy()
-                    if hasattr(scheduler_config, 'final_sigmas_type'):
-                        if scheduler_config.get('final_sigmas_type') == 'zero' and \
-                           scheduler_config.get('algorithm_type') == 'deis':
-                            scheduler_config['final_sigmas_type'] = 'sigma_min'
-                    self.pipe.scheduler = DPMSolverMultistepScheduler.from_config(
-                        scheduler_config
-                    )
-                except Exception as e:
-                    print(f"WARNING: Scheduler par defaut utilise: {e}")
-                
-                self.pipe.enable_attention_slicing(1)
+            pipe.enable_attention_slicing(1)
+        
+        # Haute résolution: matrice d'attention plafonnée (512x512 inchangé)
+        self.attention_chunking = bound_attention_memory(pipe, attention_max_elements(self.dtype))
+    
+    def weights_bytes(self) -> int:
+        """Taille des poids chargés en mémoire (0 si le modèle n'est pas chargé)."""
+        pipe = self._pipe
+        if pipe is None:
+            return 0
+        return sum(
+            p.numel() * p.element_size()
+            for module in pipe.components.values() if isinstance(module, torch.nn.Module)
+            for p in module.parameters()
+        )
+    
+    def cache_identity(self) -> dict:
+        """
+        Ce qui, en plus des paramètres de la requête (dont le scheduler),
+        détermine l'image (empreinte du cache de résultats, voir
+        app/utils/result_cache.py).
+        
+        Ne charge pas le modèle: tout est connu dès la configuration.
+        """
+        identity = {
+            "model_id": self.model_id,
+            "device": self.device,
+            "dtype": str(self.dtype).replace("torch.", ""),
+        }
+        # Calcul en bfloat16: images légèrement différentes du float32
+        if self.bf16_autocast:
+            identity["autocast"] = "bfloat16"
+        return identity
+    
+    def get_status(self) -> dict:
+        """
+        État du modèle pour le monitoring (/model/status).
+        
+        Exemple pendant le chargement:
+            {"state": "loading", "stage": "from_pretrained", "progress": 0.0, ...}
+        """
+        if self.state == "ready":
+            progress = 1.0
+        elif self.state == "loading" and self.load_stage in self.LOAD_STAGES:
+            progress = self.LOAD_STAGES.index(self.load_stage) / len(self.LOAD_STAGES)
+        else:
+            progress = 0.0
+        
+        elapsed = None
+        if self.state == "loading" and self.load_started_at is not None:
+            elapsed = time.time() - self.load_started_at
+        
+        return {
+            "model_id": self.model_id,
+            "state": self.state,
+            "stage": self.load_stage,
+            "progress": progress,
+            "elapsed": elapsed,
+            "load_time": self.load_time,
+            "source": self.load_source,
+            "error": self.load_error,
+            "device": self.device,
+            "dtype": str(self.dtype).replace("torch.", ""),
+            "inference_mode": self.inference_mode,
+            "compiled": self.compiled,
+            "bf16_autocast": self.bf16_autocast,
+            "attention_chunking": self.attention_chunking,
+            "vae_tiling_pixels": settings.SD_VAE_TILING_PIXELS,
+            "text_embedding_cache": self.text_embedding_cache.stats(),
+            "default_scheduler": get_scheduler_spec(None).name,
+            "schedulers": available_schedulers(self.lcm_available),
+        }
+    
+    def check_scheduler(self, name: Optional[str]):
+        """
+        Vérifie qu'un scheduler est utilisable (avant de mettre un job en file).
+        
+        Tant que le modèle n'est pas chargé, la présence de poids LCM est
+        inconnue: "lcm" est accepté et vérifié à la génération.
+        
+        Returns:
+            SchedulerSpec: Entrée du registre
+        
+        Raises:
+            ValueError: Scheduler inconnu, ou "lcm" sans poids distillés LCM
+        """
+        spec = get_scheduler_spec(name)
+        if spec.requires_lcm and self.is_loaded and not self.lcm_available:
+            raise ValueError(
+                f"Le scheduler '{spec.name}' exige des poids LCM (modele LCM ou SD_LCM_LORA)"
+            )
+        return spec
+    
+    def _pipeline_for(self, scheduler: Optional[str]) -> StableDiffusionPipeline:
+        """
+        Vue du pipeline avec une instance de scheduler propre à la génération.
+        
+        Les modules (UNet, VAE, text encoder) sont partagés avec le pipeline
+        chargé: rien n'est rechargé ni copié (moins d'une milliseconde).
+        Deux générations concurrentes ne partagent jamais l'état de leur
+        scheduler (timesteps, step courant).
+        
+        Raises:
+            ValueError: voir check_scheduler()
+        """
+        pipe = self.pipe
+        spec = self.check_scheduler(scheduler)
+        components = dict(pipe.components, scheduler=build_scheduler(spec.name, self.scheduler_config))
+        view = type(pipe)(**components, requires_safety_checker=False)
+        view.set_progress_bar_config(**getattr(pipe, "_progress_bar_config", {}))
+        return view
     
     def generate(
         self,
@@ -139,13 +451,17 @@ class StableDiffusionGenerator:
         num_inference_steps: int = 50,
         width: int = 512,
         height: int = 512,
-        seed: Optional[int] = None
+        seed: Optional[int] = None,
+        step_callback: Optional[Callable[[GenerationProgress], None]] = None,
+        preview_every: int = 0,
+        cancel_token: Optional[CancellationToken] = None,
+        scheduler: Optional[str] = None
     ) -> Image.Image:
         """
         Génère une image à partir d'un prompt textuel avec Stable Diffusion.
         
         Processus de génération:
-        1. Encodage du prompt en embeddings via CLIP
+        1. Encodage du prompt en embeddings via CLIP (cache LRU)
         2. Génération de bruit gaussien initial
         3. Débruitage itératif guidé par le prompt (num_inference_steps fois)
         4. Décodage du latent en image RGB finale
@@ -174,41 +490,247 @@ class StableDiffusionGenerator:
                           
             seed: Graine aléatoire pour reproductibilité (optionnel)
                  Même seed + même prompt = même image
+            
+            step_callback: Appelé à la fin de chaque step avec un
+                          GenerationProgress (step, temps écoulé, ETA, aperçu)
+                          Une exception levée par le callback interrompt la génération
+            
+            preview_every: Joint un aperçu basse résolution tous les k steps
+                          (0 = jamais; voir app/models/progress.py)
+            
+            cancel_token: Vérifié entre deux steps: une fois annulé, la
+                         génération s'arrête au step suivant
+            
+            scheduler: Sampler du registre (app/models/schedulers.py)
+                      - None: DPM-Solver++ (DEFAULT_SCHEDULER)
+                      - "unipc": brouillons en ~15 steps
+                      - "lcm": 4-8 steps, si les poids LCM sont présents
         
         Returns:
             PIL.Image: Image générée (format RGB)
         
+        Raises:
+            GenerationCancelled: Si cancel_token a été annulé
+        
         Temps de génération estimés (DreamShaper-8, 35 steps):
         - GPU (RTX 3060): ~8 secondes
         - CPU (i7-10700K): ~1 minute
         """
+        return self.generate_batch(
+            prompts=[prompt],
+            negative_prompts=[negative_prompt],
+            seeds=[seed],
+            guidance_scale=guidance_scale,
+            num_inference_steps=num_inference_steps,
+            width=width,
+            height=height,
+            step_callbacks=[step_callback],
+            preview_every=preview_every,
+            cancel_tokens=[cancel_token],
+            scheduler=scheduler
+        )[0]
+    
+    @track_generation
+    def generate_batch(
+        self,
+        prompts: List[str],
+        negative_prompts: Optional[List[Optional[str]]] = None,
+        seeds: Optional[List[Optional[int]]] = None,
+        guidance_scale: float = 7.5,
+        num_inference_steps: int = 50,
+        width: int = 512,
+        height: int = 512,
+        step_callbacks: Optional[List[Optional[Callable[[GenerationProgress], None]]]] = None,
+        preview_every: int = 0,
+        cancel_tokens: Optional[List[Optional[CancellationToken]]] = None,
+        scheduler: Optional[str] = None
+    ) -> List[Image.Image]:
+        """
+        Génère plusieurs images en un seul appel du pipeline (batch).
+        
+        Toutes les images partagent guidance_scale, steps et dimensions,
+        mais chacune a son propre prompt, negative prompt et seed.
+        Le UNet traite tout le batch en une seule passe par step, ce qui
+        amortit le coût fixe de chaque step sur plusieurs images.
+        
+        Args:
+            prompts: Un prompt par image
+            negative_prompts: Un negative prompt par image (None = aucun)
+            seeds: Une seed par image (None = aléatoire)
+            guidance_scale, num_inference_steps, width, height: voir generate()
+            step_callbacks: Un callback de progression par image (None = aucun),
+                           chacun reçoit l'aperçu de SON image
+            preview_every: voir generate()
+            cancel_tokens: Un token par image (None = non annulable); le batch
+                          s'arrête quand TOUTES ses images sont annulées
+            scheduler: voir generate() (le même pour tout le batch)
+        
+        Returns:
+            List[PIL.Image]: Images générées, dans l'ordre des prompts, avec
+                             leurs temps par étape dans image.info["timings"]
+        """
+        if all_cancelled(cancel_tokens):
+            raise GenerationCancelled("Generation annulee avant le debut")
+        
+        # Scheduler neuf pour cette génération, modules partagés
+        pipe = self._pipeline_for(scheduler)
+        
+        batch_size = len(prompts)
+        negative_prompts = negative_prompts or [None] * batch_size
+        seeds = seeds or [None] * batch_size
+        
         # ========================================
-        # CONFIGURATION DU GÉNÉRATEUR ALÉATOIRE
+        # CONFIGURATION DES GÉNÉRATEURS ALÉATOIRES
         # ========================================
-        # Si un seed est fourni, on peut reproduire exactement la même image
-        # Utile pour: tests, comparaisons, debugging
-        generator = None
-        if seed is not None:
-            generator = torch.Generator(device=self.device).manual_seed(seed)
+        # Un générateur par image: chaque image du batch reste reproductible
+        # avec sa propre seed (même résultat qu'en génération individuelle)
+        # Sans seed: graine aléatoire différente à chaque fois
+        generators = []
+        for seed in seeds:
+            generator = torch.Generator(device=self.device)
+            if seed is not None:
+                generator.manual_seed(seed)
+            else:
+                generator.seed()
+            generators.append(generator)
         
         # ========================================
-        # GÉNÉRATION DE L'IMAGE
+        # SUIVI DE PROGRESSION, ANNULATION ET TEMPS PAR STEP
+        # ========================================
+        # Le pipeline appelle on_step_end après chaque step avec les latents
+        # courants: progression + aperçu sans décodage VAE, vérification
+        # des tokens d'annulation et horodatage de la fin du step (la fin
+        # du dernier step sépare le débruitage du décodage VAE)
+        step_times = []
+        progress_kwargs = {
+            "callback_on_step_end": make_step_end_callback(
+                step_callbacks, num_inference_steps, preview_every, cancel_tokens, step_times
+            ),
+            "callback_on_step_end_tensor_inputs": ["latents"],
+        }
+        timings = StageTimings()
+        
+        # ========================================
+        # GÉNÉRATION DES IMAGES
         # ========================================
         # inference_mode: Désactive le calcul des gradients pour économiser mémoire
         # Plus rapide que eval() et utilise moins de VRAM/RAM
-        with torch.inference_mode():
-            image = self.pipe(
-                prompt=prompt,                          # Prompt principal
-                negative_prompt=negative_prompt,        # Ce qu'on veut éviter
+        # Mode "optimized": autocast bfloat16 si le CPU le supporte
+        with torch.inference_mode(), autocast_context(self.bf16_autocast):
+            # Embeddings CLIP depuis le cache (le pipeline n'encode plus rien)
+            # Negative prompt absent = chaîne vide (même comportement que None
+            # dans diffusers)
+            # Chaque texte distinct est encodé une seule fois: les variations
+            # d'un même prompt partagent son encodage
+            negative_prompts = [negative or "" for negative in negative_prompts]
+            with timings.measure("text_encoding"):
+                embeddings = {text: self.encode_text(text) for text in set(prompts) | set(negative_prompts)}
+                prompt_embeds = torch.cat([embeddings[p] for p in prompts])
+                negative_prompt_embeds = torch.cat([embeddings[n] for n in negative_prompts])
+            
+            # Grandes images: le pipeline s'arrête aux latents, décodés
+            # ensuite par tuiles (mémoire du VAE bornée)
+            tiled = use_tiled_decode(width, height)
+            denoising_start = time.perf_counter()
+            images = pipe(
+                prompt_embeds=prompt_embeds,                   # Un embedding par image
+                negative_prompt_embeds=negative_prompt_embeds, # Ce qu'on veut éviter
                 num_inference_steps=num_inference_steps, # Nombre de steps de débruitage
-                guidance_scale=guidance_scale,          # Force du guidage CFG
-                width=width,                            # Largeur cible
-                height=height,                          # Hauteur cible
-                generator=generator                     # Générateur aléatoire (seed)
-            ).images[0]  # Récupère la première (et seule) image générée
+                guidance_scale=guidance_scale,           # Force du guidage CFG
+                width=width,                             # Largeur cible
+                height=height,                           # Hauteur cible
+                generator=generators,                    # Un générateur par image (seeds)
+                output_type="latent" if tiled else "pil",
+                **progress_kwargs                        # Callback de progression
+            ).images
+            if tiled:
+                images = decode_latents(pipe, images)
+            end = time.perf_counter()
+        
+        # Temps par image (batch partagé), joints à chaque image
+        denoising_end = step_times[-1] if step_times else denoising_start
+        timings.add("denoising", denoising_end - denoising_start)
+        timings.add("denoising_step", (denoising_end - denoising_start) / max(1, len(step_times)))
+        timings.add("vae_decode", end - denoising_end)
+        per_image = timings.per_image(batch_size)
+        for image in images:
+            attach_timings(image, per_image)
+        
+        return images
+    
+    def encode_text(self, text: str) -> torch.Tensor:
+        """
+        Encode un texte avec le text encoder CLIP, via le cache LRU.
+        
+        Le même chemin d'encodage sert aux prompts et aux negative prompts:
+        pour SD 1.5, les deux sont tokenizés à 77 tokens (padding + troncature),
+        le résultat est donc identique à l'encodage interne du pipeline.
+        
+        Args:
+            text: Texte exact à encoder
         
-        return image
+        Returns:
+            torch.Tensor: Embeddings [1, 77, hidden_size]
+        """
+        def compute(t: str) -> torch.Tensor:
+            with torch.inference_mode():
+                prompt_embeds, _ = self.pipe.encode_prompt(
+                    t,
+                    device=self.device,
+                    num_images_per_prompt=1,
+                    do_classifier_free_guidance=False
+                )
+            return prompt_embeds
+        
+        return self.text_embedding_cache.get_or_compute(text, compute)
 
-# Instance globale
+# Instance globale (légère: le modèle est chargé à la première génération)
 sd_generator = StableDiffusionGenerator()
 
+def _model_loaded() -> float:
+    """1 si le modèle qui sert les générations est chargé (métrique sd_model_loaded)."""
+    if settings.SD_POOL_WORKERS > 0:
+        from app.models.inference_pool import get_inference_pool
+        workers = get_inference_pool().stats()["workers"]
+        return float(any(worker["state"] == "ready" for worker in workers))
+    return float(sd_generator.is_loaded)
+
+MODEL_LOADED.set_function(_model_loaded)
+TEXT_EMBEDDING_CACHE_HITS.set_function(lambda: sd_generator.text_embedding_cache.hits)
+TEXT_EMBEDDING_CACHE_MISSES.set_function(lambda: sd_generator.text_embedding_cache.misses)
+
+def get_base_generator():
+    """
+    Retourne le moteur qui exécute réellement le pipeline.
+    
+    - SD_POOL_WORKERS=0: le générateur du processus courant (sd_generator)
+    - SD_POOL_WORKERS>0: le pool de processus workers (un pipeline et un
+      ensemble de cœurs par worker)
+    
+    Les deux exposent generate() et generate_batch().
+    """
+    if settings.SD_POOL_WORKERS > 0:
+        from app.models.inference_pool import get_inference_pool
+        return get_inference_pool()
+    return sd_generator
+
+
+def get_generator():
+    """
+    Retourne le générateur à utiliser par l'API et l'interface Gradio.
+    
+    - SD_BATCH_ENABLED=False: le moteur direct (voir get_base_generator)
+    - SD_BATCH_ENABLED=True: le front-end de micro-batching, qui regroupe
+      les requêtes concurrentes compatibles en un seul appel du moteur
+    - SD_ADMISSION_ENABLED=True: le contrôle d'admission devant l'un des
+      deux, qui réserve la mémoire crête estimée de chaque génération
+    
+    Tous exposent la même méthode generate().
+    """
+    if settings.SD_ADMISSION_ENABLED:
+        from app.models.admission import get_admission_generator
+        return get_admission_generator()
+    if settings.SD_BATCH_ENABLED:
+        from app.models.batching import get_batching_generator
+        return get_batching_generator()
+    return get_base_generator()
@@ -0,0 +1,114 @@
+"""
+Cache LRU des embeddings du text encoder (CLIP).
+
+POURQUOI ?
+----------
+Chaque génération encode le prompt ET le negative prompt avec CLIP.
+Or ces textes se répètent énormément:
+- Les negative prompts viennent d'une poignée de chaînes fixes
+  (voir apply_prompt_template)
+- Un épisode RL (training/rl_env.py) régénère 10 fois des prompts
+  quasi identiques
+
+Le cache associe le texte exact à sa sortie du text encoder
+(tenseur [1, 77, 768] pour SD 1.5, ~236 KB en float32) et la réutilise:
+une passe complète du text encoder est évitée à chaque hit.
+
+POLITIQUE:
+----------
+- Clé: texte exact (aucune normalisation: "a cat" != "a cat ")
+- Éviction LRU (Least Recently Used) quand le budget mémoire est dépassé
+- Budget exprimé en octets (somme des tailles des tenseurs stockés)
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+import torch
+
+
+class TextEmbeddingCache:
+    """
+    Cache LRU borné en mémoire, thread-safe.
+
+    Args:
+        max_bytes: Budget mémoire total des tenseurs en cache
+                   (0 = cache désactivé, chaque appel recalcule)
+
+    Exemple:
+        >>> cache = TextEmbeddingCache(max_bytes=64 * 1024 * 1024)
+        >>> embeds = cache.get_or_compute("a cat", encode_fn)
+        >>> cache.stats()["hits"]
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _tensor_bytes(tensor: torch.Tensor) -> int:
+        """Taille mémoire d'un tenseur en octets."""
+        return tensor.numel() * tensor.element_size()
+
+    def get(self, text: str) -> Optional[torch.Tensor]:
+        """Retourne l'embedding en cache (et le marque récent), sinon None."""
+        with self._lock:
+            tensor = self._entries.get(text)
+            if tensor is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(text)
+            self.hits += 1
+            return tensor
+
+    def put(self, text: str, tensor: torch.Tensor) -> None:
+        """Stocke un embedding, en évinçant les plus anciens si nécessaire."""
+        size = self._tensor_bytes(tensor)
+        if size > self.max_bytes:
+            # Trop gros pour le budget (ou cache désactivé): on ne stocke pas
+            return
+        with self._lock:
+            previous = self._entries.pop(text, None)
+            if previous is not None:
+                self._bytes -= self._tensor_bytes(previous)
+            self._entries[text] = tensor
+            self._bytes += size
+            # Éviction LRU: les entrées les moins récemment utilisées d'abord
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._tensor_bytes(evicted)
+
+    def get_or_compute(self, text: str, compute: Callable[[str], torch.Tensor]) -> torch.Tensor:
+        """
+        Retourne l'embedding du texte, en le calculant au besoin.
+
+        Note: deux appels concurrents sur un même texte absent peuvent
+        le calculer deux fois (résultat identique, pas de verrou long).
+        """
+        tensor = self.get(text)
+        if tensor is None:
+            tensor = compute(text)
+            self.put(text, tensor)
+        return tensor
+
+    def clear(self) -> None:
+        """Vide le cache (ex: après changement du text encoder)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Compteurs hits/misses et occupation mémoire."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,136 @@
+"""
+Pipeline Stable Diffusion miniature, initialisé aléatoirement, construit localement.
+
+POURQUOI ?
+----------
+DreamShaper-8 pèse ~4GB et se télécharge depuis Hugging Face: impossible
+en CI, sans réseau ou pour mesurer rapidement le coût du chemin de
+génération. Ce pipeline a la MÊME architecture (UNet conditionné, VAE,
+text encoder CLIP, tokenizer, DPM-Solver++) avec ~65 000
+paramètres:
+- construit en ~1s, sans réseau ni fichier de poids
+- même facteur d'échelle du VAE (1/8): les tailles d'image et de latents
+  sont celles du vrai modèle (512x512 → latents 4x64x64)
+- déterministe: seed de construction fixe, mêmes poids à chaque appel
+
+Les images produites sont du bruit coloré: ce pipeline sert aux
+benchmarks (benchmarks/bench_generation.py) et aux tests, pas à l'art.
+
+Usage:
+    # Dans .env (API, Gradio, workers du pool):
+    SD_TINY_PIPELINE=True
+
+    # Ou explicitement:
+    >>> sd_generator.use_pipeline(build_tiny_pipeline(), source="tiny")
+"""
+import json
+import tempfile
+from pathlib import Path
+import torch
+from diffusers import (
+    AutoencoderKL,
+    DPMSolverMultistepScheduler,
+    StableDiffusionPipeline,
+    UNet2DConditionModel,
+)
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+
+# Identifiant du modèle dans les statuts et l'empreinte du cache de résultats
+TINY_MODEL_ID = "tiny-random-sd"
+
+# Dimension des embeddings du text encoder (cross_attention_dim du UNet)
+TINY_HIDDEN_SIZE = 16
+
+
+def _build_tokenizer(directory: Path) -> CLIPTokenizer:
+    """
+    Tokenizer CLIP caractère par caractère (aucune fusion BPE).
+
+    Le vocabulaire couvre les minuscules, chiffres et la ponctuation
+    courante des prompts; le reste est remplacé par <|endoftext|>.
+    """
+    vocab = {"<|startoftext|>": 0, "<|endoftext|>": 1}
+    symbols = [chr(c) for c in range(ord("a"), ord("z") + 1)]
+    symbols += [str(d) for d in range(10)] + list(",.:;!?'()-")
+    for symbol in symbols:
+        vocab.setdefault(symbol, len(vocab))
+        vocab.setdefault(symbol + "</w>", len(vocab))
+
+    vocab_file = directory / "vocab.json"
+    merges_file = directory / "merges.txt"
+    vocab_file.write_text(json.dumps(vocab), encoding="utf-8")
+    merges_file.write_text("#version: 0.2\n", encoding="utf-8")
+    return CLIPTokenizer(str(vocab_file), str(merges_file), model_max_length=77)
+
+
+def build_tiny_pipeline(seed: int = 0, dtype: torch.dtype = torch.float32) -> StableDiffusionPipeline:
+    """
+    Construit le pipeline miniature (poids aléatoires, seed fixe).
+
+    Args:
+        seed: Seed d'initialisation des poids
+        dtype: Précision des poids
+
+    Returns:
+        StableDiffusionPipeline: Sur CPU, sans safety checker
+    """
+    torch.manual_seed(seed)
+
+    # UNet: 2 niveaux (les latents doivent être pairs: images multiples de 16)
+    unet = UNet2DConditionModel(
+        sample_size=8,
+        in_channels=4,
+        out_channels=4,
+        layers_per_block=1,
+        block_out_channels=(8, 16),
+        down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+        up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"),
+        cross_attention_dim=TINY_HIDDEN_SIZE,
+        attention_head_dim=2,
+        norm_num_groups=4,
+    )
+
+    # VAE: 4 niveaux → facteur d'échelle 8, comme SD 1.5
+    vae = AutoencoderKL(
+        in_channels=3,
+        out_channels=3,
+        latent_channels=4,
+        block_out_channels=(4, 4, 4, 4),
+        down_block_types=("DownEncoderBlock2D",) * 4,
+        up_block_types=("UpDecoderBlock2D",) * 4,
+        norm_num_groups=2,
+        sample_size=64,
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        tokenizer = _build_tokenizer(Path(directory))
+
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        vocab_size=len(tokenizer.get_vocab()),
+        hidden_size=TINY_HIDDEN_SIZE,
+        intermediate_size=32,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        max_position_embeddings=77,
+        bos_token_id=0,
+        eos_token_id=1,
+        pad_token_id=1,
+    ))
+
+    pipe = StableDiffusionPipeline(
+        vae=vae,
+        text_encoder=text_encoder,
+        tokenizer=tokenizer,
+        unet=unet,
+        scheduler=DPMSolverMultistepScheduler(
+            beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear",
+            steps_offset=1,  # Mêmes réglages que le scheduler de SD 1.5
+        ),
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False,
+    )
+    pipe.set_progress_bar_config(disable=True)
+    if dtype != torch.float32:
+        pipe = pipe.to(dtype=dtype)
+    return pipe
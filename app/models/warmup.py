@@ -0,0 +1,161 @@
+"""
+Préchauffage du service au démarrage (warm-up).
+
+PROBLÈME:
+---------
+La première génération après le démarrage est bien plus lente que les
+suivantes: chargement du modèle, croissance de l'allocateur, choix des
+noyaux oneDNN/cuDNN, initialisations paresseuses des modules (et
+compilation en mode "optimized"). C'est la requête d'un vrai utilisateur
+qui paie ce surcoût.
+
+SOLUTION:
+---------
+Avec SD_WARMUP_ENABLED, le service exécute avant de se déclarer prêt:
+1. Le chargement du modèle
+2. Une petite génération (SD_WARMUP_STEPS steps) par taille de
+   SD_WARMUP_SIZES (ex: "512x512,768x512")
+3. Un passage du scorer esthétique
+
+GET /api/v1/ready répond 503 tant que le préchauffage n'est pas terminé:
+le load balancer n'envoie aucune requête à une instance froide.
+Avec le pool d'inférence, chaque worker se préchauffe avant de se
+déclarer prêt.
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from PIL import Image
+from app.utils.config import settings
+
+WARMUP_PROMPT = "warm-up"
+
+
+def parse_sizes(spec: str) -> List[Tuple[int, int]]:
+    """
+    Tailles de préchauffage depuis "512x512,768x512".
+
+    Raises:
+        ValueError: Format invalide
+    """
+    sizes = []
+    for item in spec.split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        try:
+            width, height = (int(value) for value in item.split("x"))
+        except ValueError:
+            raise ValueError(f"Taille de warm-up invalide: '{item}' (attendu: LARGEURxHAUTEUR)")
+        sizes.append((width, height))
+    return sizes
+
+
+def warm_up_generator(generator, sizes: List[Tuple[int, int]], steps: int) -> List[Dict[str, Any]]:
+    """
+    Charge le générateur et exécute une génération par taille.
+
+    Args:
+        generator: StableDiffusionGenerator (processus courant ou worker du pool)
+        sizes: Tailles (largeur, hauteur) typiques du trafic
+        steps: Steps de débruitage par génération (peu suffisent)
+
+    Returns:
+        list: Durée de chaque étape {"stage", "width", "height", "seconds"}
+    """
+    runs = []
+    start = time.perf_counter()
+    generator.load()
+    runs.append({"stage": "load", "seconds": time.perf_counter() - start})
+    for width, height in sizes:
+        start = time.perf_counter()
+        generator.generate(WARMUP_PROMPT, num_inference_steps=steps, width=width, height=height, seed=0)
+        runs.append({"stage": "generate", "width": width, "height": height,
+                     "seconds": time.perf_counter() - start})
+    return runs
+
+
+class WarmupState:
+    """
+    État du préchauffage, lu par l'endpoint de readiness.
+
+    disabled (pas de warm-up: prêt d'emblée) | pending → running → ready (ou failed)
+    """
+
+    def __init__(self, enabled: bool):
+        self.state = "pending" if enabled else "disabled"
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.runs: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_ready(self) -> bool:
+        """True si le service peut recevoir du trafic."""
+        return self.state in ("disabled", "ready")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Sérialisation JSON (GET /ready)."""
+        return {
+            "state": self.state,
+            "error": self.error,
+            "duration": self.duration,
+            "runs": list(self.runs),
+        }
+
+    def run(self) -> bool:
+        """
+        Exécute le préchauffage (bloquant, une seule fois).
+
+        Returns:
+            True si le service est prêt
+        """
+        with self._lock:
+            if self.state != "pending":
+                return self.is_ready
+            self.state = "running"
+            self.started_at = time.time()
+        try:
+            sizes = parse_sizes(settings.SD_WARMUP_SIZES)
+            print(f"INFO: Warm-up ({settings.SD_WARMUP_STEPS} steps, tailles {sizes})...")
+            if settings.SD_POOL_WORKERS > 0:
+                # Chaque worker se préchauffe avant de se déclarer prêt
+                from app.models.inference_pool import get_inference_pool
+                pool = get_inference_pool()
+                start = time.perf_counter()
+                pool.start()
+                if not pool.wait_ready():
+                    raise RuntimeError("Workers du pool d'inference non demarres")
+                self.runs.append({"stage": "pool", "seconds": time.perf_counter() - start})
+            else:
+                from app.models.stable_diffusion import sd_generator
+                self.runs.extend(warm_up_generator(sd_generator, sizes, settings.SD_WARMUP_STEPS))
+
+            from app.models.aesthetic_scorer import aesthetic_scorer
+            start = time.perf_counter()
+            aesthetic_scorer.score(Image.new("RGB", sizes[0] if sizes else (512, 512)))
+            self.runs.append({"stage": "score", "seconds": time.perf_counter() - start})
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            print(f"WARNING: Echec du warm-up: {e}")
+            return False
+        finally:
+            self.duration = time.time() - self.started_at
+        self.state = "ready"
+        print(f"OK: Warm-up termine en {self.duration:.1f}s, service pret")
+        return True
+
+    def start(self) -> None:
+        """Lance le préchauffage en arrière-plan (le serveur répond pendant ce temps)."""
+        with self._lock:
+            if self.state != "pending" or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name="warm-up", daemon=True)
+        self._thread.start()
+
+
+# Instance globale (état lu par GET /ready)
+warmup_state = WarmupState(enabled=settings.SD_WARMUP_ENABLED)
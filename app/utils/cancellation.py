@@ -0,0 +1,79 @@
+"""
+Annulation coopérative des générations en cours.
+
+POURQUOI ?
+----------
+Quand un client se déconnecte (ou qu'un utilisateur Gradio quitte la page),
+la boucle de débruitage continue jusqu'au bout: l'image est ensuite
+sauvegardée, scorée et insérée en base pour personne. Sous charge, ces
+requêtes abandonnées consomment une part importante du CPU.
+
+PRINCIPE:
+---------
+Chaque requête porte un CancellationToken. Le code qui abandonne la
+requête (déconnexion, DELETE /jobs/{id}, bouton Stop) appelle cancel();
+la boucle de débruitage vérifie le token entre deux steps et lève
+GenerationCancelled: le travail s'arrête en au plus un step UNet et
+le worker est libéré.
+"""
+import threading
+from typing import Callable, List, Optional
+
+
+class GenerationCancelled(Exception):
+    """Levée quand une génération est interrompue par son token."""
+
+
+class CancellationToken:
+    """
+    Drapeau d'annulation partagé entre le demandeur et le code exécutant.
+
+    Args:
+        event: Objet Event sous-jacent (threading.Event par défaut;
+               un multiprocessing.Event permet de traverser les processus)
+
+    Exemple:
+        >>> token = CancellationToken()
+        >>> token.cancel("client deconnecte")
+        >>> token.raise_if_cancelled()  # GenerationCancelled
+    """
+
+    def __init__(self, event=None):
+        self._event = event if event is not None else threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self.reason: Optional[str] = None
+
+    @property
+    def is_cancelled(self) -> bool:
+        """True si l'annulation a été demandée."""
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Demande l'annulation (idempotent) et notifie les callbacks."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks)
+            self._callbacks.clear()
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """
+        Appelle callback() à l'annulation (immédiatement si déjà annulé).
+
+        Sert à réveiller un thread en attente plutôt que de scruter le token.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self) -> None:
+        """Lève GenerationCancelled si l'annulation a été demandée."""
+        if self.is_cancelled:
+            raise GenerationCancelled(self.reason or "cancelled")
@@ -4,6 +4,7 @@ Utilise Pydantic Settings pour gérer les variables d'environnement.
 """
 import os
 import torch
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings
 
 # ============================================
@@ -46,6 +47,10 @@ class Settings(BaseSettings):
     API_VERSION: str = "1.0.0"
     API_HOST: str = "0.0.0.0"  # Accessible depuis toutes les interfaces réseau
     API_PORT: int = 8000       # Port par défaut de l'API REST
+    API_PREFIX: str = "/api/v1"  # Préfixe des routes (URLs des fichiers images comprises)
+    
+    # Endpoint GET /metrics (format Prometheus) et mesure des requêtes HTTP
+    METRICS_ENABLED: bool = True
     
     # ============================================
     # STABLE DIFFUSION - Modèle de génération d'images
@@ -63,6 +68,51 @@ class Settings(BaseSettings):
     # AUTO-DÉTECTÉ: float16 sur GPU, float32 sur CPU
     SD_DTYPE: str = AUTO_DTYPE
     
+    # Snapshot local du pipeline configuré (démarrage à froid rapide)
+    # Créé avec: python -m app.models.snapshot --output models/sd_snapshot
+    # None = chargement classique depuis Hugging Face
+    SD_SNAPSHOT_DIR: Optional[str] = None
+    
+    # Pipeline miniature à poids aléatoires (app/models/tiny_pipeline.py)
+    # Remplace DreamShaper-8 pour les benchmarks, la CI et le développement
+    # sans réseau: mêmes tailles d'image, images = bruit coloré
+    SD_TINY_PIPELINE: bool = False
+    
+    # LoRA LCM fusionnée au chargement (ex: "latent-consistency/lcm-lora-sdv1-5")
+    # Rend le scheduler "lcm" disponible: images en 4-8 steps (nécessite peft)
+    # None = pas de LoRA (LCM disponible seulement pour un modèle distillé LCM)
+    SD_LCM_LORA: Optional[str] = None
+    
+    # Budget mémoire du cache des embeddings CLIP (Mo)
+    # ~236 Ko par texte en float32 → 64 Mo ≈ 270 prompts/negative prompts
+    # 0 = cache désactivé
+    SD_TEXT_EMBED_CACHE_MB: float = 64.0
+    
+    # Haute résolution (app/models/highres.py)
+    # Décodage VAE par tuiles au-delà de ce nombre de pixels (None = jamais)
+    # 262144 = 512x512: les formats bannière/marketing sont décodés par tuiles
+    SD_VAE_TILING_PIXELS: Optional[int] = 262144
+    
+    # Taille max d'une matrice d'attention du UNet (Mo); au-delà, les
+    # requêtes sont traitées par blocs (None = jamais, 64 = 512x512 intact)
+    SD_ATTENTION_MAX_MB: Optional[float] = 64.0
+    
+    # Mode d'inférence (app/models/inference_modes.py)
+    # "default": attention slicing (mémoire minimale, lent sur CPU)
+    # "optimized": channels_last + attention SDPA + torch.compile (+ bfloat16)
+    SD_INFERENCE_MODE: str = "default"
+    
+    # Mode "optimized": compilation du UNet et du décodeur VAE
+    # Le premier appel à chaque résolution compile (plusieurs minutes sur CPU)
+    SD_TORCH_COMPILE: bool = True
+    
+    # Mode "optimized": autocast bfloat16 si le CPU le supporte (AVX512-BF16/AMX)
+    # Les images diffèrent légèrement de celles en float32
+    SD_BF16_AUTOCAST: bool = True
+    
+    # Cache persistant des noyaux compilés (un redémarrage ne recompile pas)
+    SD_COMPILE_CACHE_DIR: str = "./models/compile_cache"
+    
     # ============================================
     # RL AGENT - Optimisation des prompts (optionnel)
     # ============================================
@@ -87,12 +137,146 @@ class Settings(BaseSettings):
     DEFAULT_WIDTH: int = 512
     DEFAULT_HEIGHT: int = 512
     
+    # Aperçu basse résolution (projection des latents) tous les k steps
+    # pendant la génération (0 = progression sans aperçu)
+    SD_PREVIEW_EVERY: int = 5
+    
+    # Variations max par requête (num_images / seeds de GenerateRequest)
+    # Générées en un seul batch: un encodage du prompt pour toutes
+    SD_MAX_IMAGES_PER_REQUEST: int = 8
+    
+    # ============================================
+    # FILE DE JOBS - Génération asynchrone (API)
+    # ============================================
+    # Nombre de générations exécutées en parallèle par l'API
+    # 1 = une génération à la fois (recommandé sur CPU: torch utilise déjà tous les cœurs)
+    JOB_WORKERS: int = 1
+    
+    # Nombre max de jobs en attente (au-delà: HTTP 503)
+    JOB_QUEUE_MAX_SIZE: int = 100
+    
+    # Durée de conservation des résultats de jobs terminés (secondes)
+    JOB_RESULT_TTL: int = 3600
+    
+    # Ordonnancement équitable entre utilisateurs (voir app/utils/job_queue.py)
+    # Poids par utilisateur en JSON, ex: {"equipe-marketing": 2} (défaut: 1)
+    JOB_USER_WEIGHTS: Dict[str, float] = {}
+    
+    # Jobs en attente max par utilisateur (au-delà: HTTP 429, None = pas de limite)
+    JOB_MAX_QUEUED_PER_USER: Optional[int] = 20
+    
+    # Workers supplémentaires réservés aux jobs "interactive"
+    # (attente bornée même pendant un flot de jobs "batch")
+    JOB_INTERACTIVE_WORKERS: int = 0
+    
+    # Classe "interactive": au plus N steps et une seule image
+    JOB_INTERACTIVE_MAX_STEPS: int = 20
+    
+    # ============================================
+    # MICRO-BATCHING - Regroupement des requêtes compatibles
+    # ============================================
+    # Regroupe les requêtes concurrentes de mêmes dimensions/steps/guidance
+    # en un seul appel du pipeline (une passe UNet pour tout le batch)
+    SD_BATCH_ENABLED: bool = False
+    
+    # Taille max d'un batch (l'API lance au moins autant de workers)
+    SD_BATCH_MAX_SIZE: int = 4
+    
+    # Fenêtre d'attente pour remplir un batch (millisecondes)
+    SD_BATCH_WINDOW_MS: float = 50.0
+    
+    # ============================================
+    # POOL D'INFÉRENCE - Plusieurs processus CPU
+    # ============================================
+    # Nombre de processus workers, chacun avec son pipeline et ses cœurs
+    # 0 = désactivé (génération dans le processus principal)
+    # Ex: 32 cœurs → 4 workers x 8 threads produisent plus d'images/minute
+    # qu'une seule génération sur 32 threads
+    SD_POOL_WORKERS: int = 0
+    
+    # Cœurs (et threads torch) par worker
+    # None = cœurs disponibles / SD_POOL_WORKERS
+    SD_POOL_THREADS_PER_WORKER: Optional[int] = None
+    
+    # ============================================
+    # WARM-UP - Préchauffage au démarrage
+    # ============================================
+    # Charge le modèle et exécute de petites générations + un score avant
+    # de déclarer le service prêt (GET /api/v1/ready: 503 jusque-là)
+    SD_WARMUP_ENABLED: bool = False
+    
+    # Tailles préchauffées (celles du trafic réel), ex: "512x512,768x512"
+    SD_WARMUP_SIZES: str = "512x512"
+    
+    # Steps de débruitage par génération de préchauffage
+    SD_WARMUP_STEPS: int = 2
+    
+    # ============================================
+    # ADMISSION - Budget mémoire des générations
+    # ============================================
+    # Estime la mémoire crête et la durée de chaque génération (résolution,
+    # batch, dtype) avant de l'exécuter: une requête trop grosse est refusée
+    # (413) au lieu de faire swapper ou tuer (OOM) le worker
+    # Désactivé par défaut: la file se comporte comme avant (seul
+    # JOB_QUEUE_MAX_SIZE limite les jobs en attente)
+    SD_ADMISSION_ENABLED: bool = False
+    
+    # Mémoire disponible pour les générations simultanées (Mo, hors poids)
+    # None = auto: 80% de la RAM (ou VRAM) totale - poids du modèle chargé
+    # Pool d'inférence: auto retire SD_POOL_WORKERS x poids estimés (SD 1.5,
+    # une copie par processus); à fixer explicitement pour un budget exact
+    SD_MEMORY_BUDGET_MB: Optional[float] = None
+    
+    # Travail en file max (secondes de génération estimées) avant HTTP 429
+    # None = pas de limite (seul JOB_QUEUE_MAX_SIZE s'applique)
+    SD_ADMISSION_MAX_QUEUED_SECONDS: Optional[float] = 1800.0
+    
+    # Modèle de coût calibré sur cette machine (JSON)
+    # Créé avec: python -m app.models.admission --output models/admission_model.json
+    # None = coefficients par défaut (SD 1.5, CPU)
+    SD_ADMISSION_MODEL: Optional[str] = None
+    
     # ============================================
     # CHEMINS DE FICHIERS
     # ============================================
     OUTPUT_DIR: str = "outputs"      # Dossier pour les images générées
     MODELS_DIR: str = "models"       # Dossier pour les modèles RL
     
+    # ============================================
+    # IMAGES - Format et écriture des fichiers
+    # ============================================
+    # Format par défaut (une requête ou un template peut le changer):
+    # "png", "webp_lossless" (sans perte), "webp" ou "jpeg" (avec perte)
+    IMAGE_FORMAT: str = "png"
+    
+    # Compression zlib des PNG (0-9): 1 encode ~3x plus vite que 6 pour
+    # des fichiers ~10% plus gros
+    IMAGE_PNG_COMPRESS_LEVEL: int = 6
+    
+    # Qualité (1-100) des formats avec perte
+    IMAGE_WEBP_QUALITY: int = 90
+    IMAGE_JPEG_QUALITY: int = 92
+    
+    # Threads d'encodage: la génération n'attend pas l'écriture du fichier
+    # 0 = écriture synchrone
+    IMAGE_WRITER_WORKERS: int = 2
+    
+    # Miniatures WebP (côté le plus long, en px) écrites après chaque image
+    # pour l'historique et la galerie, ex: "64,128,256" ("" = aucune)
+    # Images existantes: python -m app.utils.image_store --thumbnails
+    IMAGE_THUMBNAIL_SIZES: str = "64,128,256"
+    IMAGE_THUMBNAIL_QUALITY: int = 80
+    
+    # ============================================
+    # SCORING - Score esthétique
+    # ============================================
+    # Sous-échantillonnage: au-delà de ce nombre de pixels, le score est
+    # estimé sur un tirage de SCORING_MAX_PIXELS pixels (graine fixe)
+    # Écart borné, voir app.models.aesthetic_scorer.score_error_bound:
+    # 262144 (512x512) → 0.82 point au pire, ~0.01 en pratique
+    # None = toute l'image (score exact)
+    SCORING_MAX_PIXELS: Optional[int] = None
+    
     # ============================================
     # BASE DE DONNÉES
     # ============================================
@@ -102,6 +286,10 @@ class Settings(BaseSettings):
     # - Feedbacks utilisateurs
     DATABASE_URL: str = "sqlite:///./data/ai_creative_studio.db"
     
+    # Cache des résultats: une requête avec seed explicite déjà générée à
+    # l'identique renvoie l'image existante sans repasser par le pipeline
+    RESULT_CACHE_ENABLED: bool = True
+    
     # Configuration Pydantic pour charger depuis .env
     model_config = {
         "env_file": ".env"  # Fichier .env optionnel pour override
@@ -0,0 +1,426 @@
+"""
+Stockage des images adressé par leur contenu.
+
+PROBLÈME:
+---------
+Les fichiers étaient nommés generated_<timestamp>_<aléa>.png dans un seul
+dossier outputs/portfolio/:
+- deux images identiques (même seed, mêmes paramètres, use_cache=False)
+  occupaient deux fichiers
+- des centaines de milliers de fichiers dans un même dossier rendent
+  listings et sauvegardes lents
+- le nom ne dit rien du contenu: impossible de servir un ETag fiable
+
+SOLUTION:
+---------
+Le nom du fichier est l'empreinte SHA-256 de l'image (pixels, mode,
+taille, format et qualité des formats avec perte), répartie sur deux
+niveaux de sous-dossiers:
+
+    outputs/portfolio/3f/2a/3f2a9c1e...(64 caractères).webp
+
+- 65 536 dossiers feuilles: quelques fichiers par dossier même avec des
+  millions d'images
+- Déduplication: une image identique réutilise le fichier existant
+  (plusieurs lignes de generated_images peuvent partager un chemin)
+- L'empreinte est calculée sur les pixels avant l'encodage: le chemin est
+  connu tout de suite et l'écriture reste en arrière-plan (image_writer)
+
+API: put / get / stat / delete, utilisée par l'API, Gradio et
+ImageRepository (suppression du fichier quand plus aucune ligne ne le
+référence).
+
+Un fichier renvoyé par put() est réservé jusqu'à release(), appelé une
+fois la ligne insérée en base: une suppression concurrente (dernière
+ligne effacée entre-temps) ne le retire pas sous les pieds de la
+nouvelle ligne.
+
+MINIATURES:
+-----------
+L'historique et la galerie affichaient l'image pleine taille (plusieurs
+centaines de Ko) pour une vignette de quelques dizaines de pixels. Après
+l'écriture d'une image, put() confie au même pool une miniature WebP par
+taille de IMAGE_THUMBNAIL_SIZES, à côté du fichier:
+
+    outputs/portfolio/3f/2a/3f2a9c1e..._256.webp
+
+Elles sont supprimées avec l'image. Images existantes:
+    python -m app.utils.image_store --thumbnails [--dry-run]
+
+MIGRATION:
+----------
+Les images existantes (noms horodatés) sont déplacées dans le stockage
+et leurs lignes mises à jour:
+    python -m app.utils.image_store [--dry-run]
+"""
+import argparse
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+from PIL import Image
+from app.utils.config import settings
+from app.utils.image_writer import (
+    IMAGE_FORMATS, PendingWrite, encoder_options, image_extension, image_writer, resolve_image_format,
+)
+
+# Sous-dossiers: SHARD_DEPTH niveaux de SHARD_WIDTH caractères hexadécimaux
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+DIGEST_LENGTH = 64
+
+# Format Pillow d'un fichier existant → format du stockage (migration)
+PIL_FORMATS = {"PNG": "png", "WEBP": "webp", "JPEG": "jpeg"}
+
+# Format des miniatures
+THUMBNAIL_FORMAT = "webp"
+
+
+def parse_thumbnail_sizes(spec: Optional[str] = None) -> List[int]:
+    """
+    Tailles des miniatures depuis "64,128,256" (None = IMAGE_THUMBNAIL_SIZES).
+
+    Raises:
+        ValueError: Taille invalide
+    """
+    spec = settings.IMAGE_THUMBNAIL_SIZES if spec is None else spec
+    sizes = set()
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if not item.isdigit() or int(item) <= 0:
+            raise ValueError(f"Taille de miniature invalide: '{item}' (attendu: entier positif)")
+        sizes.add(int(item))
+    return sorted(sizes)
+
+
+def content_digest(image: Image.Image, image_format: str, quality: Optional[int] = None) -> str:
+    """
+    Empreinte SHA-256 d'une image telle qu'elle sera stockée.
+
+    Les formats sans perte ne dépendent que des pixels (le niveau de
+    compression PNG ne change pas le contenu); la qualité des formats
+    avec perte fait partie de l'empreinte.
+    """
+    digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:{image_format}".encode())
+    options = encoder_options(image_format, quality)
+    if "quality" in options:
+        digest.update(f":q{options['quality']}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class ImageStore:
+    """
+    Fichiers images nommés par empreinte, répartis en sous-dossiers.
+
+    Args:
+        root: Dossier racine du stockage
+        thumbnail_sizes: Tailles des miniatures (None = IMAGE_THUMBNAIL_SIZES)
+    """
+
+    def __init__(self, root: Union[str, Path], thumbnail_sizes: Optional[List[int]] = None):
+        self.root = Path(root)
+        self.thumbnail_sizes = (
+            parse_thumbnail_sizes() if thumbnail_sizes is None else sorted(thumbnail_sizes)
+        )
+        # Chemin → nombre de put() pas encore suivis de release()
+        self._reserved: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _shard_dir(self, digest: str) -> Path:
+        """Sous-dossier d'une empreinte (ex: root/3f/2a)."""
+        return self.root.joinpath(*(
+            digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)
+        ))
+
+    def path_for(self, digest: str, image_format: str) -> Path:
+        """Chemin d'une image (ex: root/3f/2a/3f2a9c....png)."""
+        return self._shard_dir(digest) / f"{digest}.{image_extension(image_format)}"
+
+    def digest_of(self, path: Union[str, Path]) -> Optional[str]:
+        """Empreinte d'un fichier du stockage (None pour un autre chemin)."""
+        path = Path(path)
+        digest = path.stem
+        if len(digest) != DIGEST_LENGTH or any(c not in "0123456789abcdef" for c in digest):
+            return None
+        return digest if path.parent == self._shard_dir(digest) else None
+
+    def thumbnail_path(self, path: Union[str, Path], size: int) -> Path:
+        """Miniature d'une image (ex: root/3f/2a/3f2a9c..._256.webp)."""
+        path = Path(path)
+        return path.with_name(f"{path.stem}_{size}.{image_extension(THUMBNAIL_FORMAT)}")
+
+    def etag_of(self, path: Union[str, Path]) -> Optional[str]:
+        """
+        Identifiant immuable d'un fichier du stockage: l'empreinte, suivie de
+        la taille pour une miniature (None hors stockage).
+        """
+        path = Path(path)
+        if self.digest_of(path) is not None:
+            return path.stem
+        digest, _, size = path.stem.rpartition("_")
+        if size.isdigit() and self.digest_of(path.with_name(digest + path.suffix)) is not None:
+            return path.stem
+        return None
+
+    def put(self, image: Image.Image, image_format: Optional[str] = None,
+            quality: Optional[int] = None) -> PendingWrite:
+        """
+        Stocke une image (écriture en arrière-plan, voir image_writer).
+
+        Une image identique déjà stockée (ou en cours d'écriture) n'est pas
+        réécrite: son écriture est renvoyée (durée d'écriture 0).
+
+        Le fichier reste réservé (voir delete) jusqu'à release(path), à
+        appeler une fois la ligne qui le référence insérée en base.
+
+        Returns:
+            PendingWrite: path = chemin définitif, connu immédiatement
+
+        Raises:
+            ValueError: Format inconnu
+        """
+        image_format = resolve_image_format(image_format)
+        path = self.path_for(content_digest(image, image_format, quality), image_format)
+        # Réservé avant la vérification: une suppression concurrente voit
+        # la réservation, ou a déjà supprimé le fichier (réécrit ci-dessous)
+        with self._lock:
+            self._reserved[str(path)] = self._reserved.get(str(path), 0) + 1
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write, submitted = image_writer.submit_missing(image, path, image_format, quality)
+        if submitted:
+            write.add_done_callback(lambda done: self.put_thumbnails(image, done.path))
+        elif write.done:
+            self.put_thumbnails(image, path)
+        return write
+
+    def release(self, path: Union[str, Path]) -> None:
+        """Lève la réservation d'un put() (ligne insérée en base, ou abandon)."""
+        with self._lock:
+            count = self._reserved.get(str(path), 0) - 1
+            if count > 0:
+                self._reserved[str(path)] = count
+            else:
+                self._reserved.pop(str(path), None)
+
+    def is_reserved(self, path: Union[str, Path]) -> bool:
+        """True si un put() de ce fichier attend encore son release()."""
+        with self._lock:
+            return str(path) in self._reserved
+
+    def put_thumbnails(self, image: Image.Image, path: Union[str, Path]) -> List[PendingWrite]:
+        """
+        Confie à image_writer les miniatures manquantes d'une image (réduites
+        dans le thread d'écriture).
+
+        Returns:
+            list: Écritures lancées (vide si toutes existent déjà)
+        """
+        writes = []
+        for size in self.thumbnail_sizes:
+            write, submitted = image_writer.submit_missing(
+                image, self.thumbnail_path(path, size), THUMBNAIL_FORMAT,
+                settings.IMAGE_THUMBNAIL_QUALITY, max_size=size,
+            )
+            if submitted:
+                writes.append(write)
+        return writes
+
+    def get(self, digest: str) -> Optional[Path]:
+        """Fichier d'une empreinte, quel que soit son format (None si absent)."""
+        for extension in dict.fromkeys(ext for _, ext in IMAGE_FORMATS.values()):
+            path = self._shard_dir(digest) / f"{digest}.{extension}"
+            if path.is_file():
+                return path
+        return None
+
+    def stat(self, path: Union[str, Path]) -> Optional[Dict[str, Any]]:
+        """
+        Métadonnées d'un fichier, une fois son écriture terminée.
+
+        Returns:
+            dict: {"path", "digest" (None hors stockage), "etag" (voir
+            etag_of), "file_size", "modified"}, None si le fichier n'existe pas
+        """
+        image_writer.wait(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return {
+            "path": str(path),
+            "digest": self.digest_of(path),
+            "etag": self.etag_of(path),
+            "file_size": stat.st_size,
+            "modified": stat.st_mtime,
+        }
+
+    def delete(self, path: Union[str, Path], referenced: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Supprime un fichier (après son écriture en cours), ses miniatures et
+        les sous-dossiers devenus vides.
+
+        Args:
+            path: Fichier du stockage
+            referenced: Vérification des références (ex: une ligne de la
+                        base partage encore le fichier). Si fournie, le
+                        fichier est conservé s'il est référencé, réservé
+                        par un put() ou en cours d'écriture; vérification et
+                        suppression sont atomiques vis-à-vis de put().
+                        None: suppression inconditionnelle.
+
+        Returns:
+            bool: False si le fichier n'existait pas ou a été conservé
+        """
+        path = Path(path)
+        if referenced is None:
+            image_writer.wait(path)
+            keep = None
+        else:
+            def keep():
+                return self.is_reserved(path) or referenced()
+        if not image_writer.unlink_if_idle(path, keep):
+            return False
+        self._delete_thumbnails(path)
+        parent = path.parent
+        while parent != self.root and self.root in parent.parents:
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+            parent = parent.parent
+        return True
+
+    def _delete_thumbnails(self, path: Path) -> None:
+        """Supprime les miniatures d'une image, quelles que soient leurs tailles."""
+        # Miniatures encore en cours d'écriture (confiées après l'image)
+        for size in self.thumbnail_sizes:
+            image_writer.wait(self.thumbnail_path(path, size))
+        for thumbnail in path.parent.glob(f"{path.stem}_*.{image_extension(THUMBNAIL_FORMAT)}"):
+            if thumbnail.stem.rpartition("_")[2].isdigit():
+                image_writer.wait(thumbnail)
+                thumbnail.unlink(missing_ok=True)
+
+
+def migrate_existing_images(db, store: Optional[ImageStore] = None, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Déplace les fichiers des images existantes dans le stockage et met à
+    jour leurs lignes (image_path, file_size).
+
+    Idempotent: les lignes déjà migrées sont ignorées. Chaque ligne est
+    validée juste après le déplacement de son fichier.
+
+    Returns:
+        dict: Nombre de lignes migrated, deduplicated (fichier identique
+        déjà stocké), skipped (déjà migrées), missing (fichier absent) et
+        unsupported (format autre que PNG, WebP, JPEG: laissées en place)
+    """
+    from app.database.models import GeneratedImage
+
+    store = store or image_store
+    counts = {"migrated": 0, "deduplicated": 0, "skipped": 0, "missing": 0, "unsupported": 0}
+    for row in db.query(GeneratedImage).order_by(GeneratedImage.id).all():
+        source = Path(row.image_path)
+        if store.digest_of(source) is not None:
+            counts["skipped"] += 1
+            continue
+        if not source.is_file():
+            counts["missing"] += 1
+            continue
+        with Image.open(source) as image:
+            image_format = PIL_FORMATS.get(image.format)
+            if image_format is None:
+                counts["unsupported"] += 1
+                continue
+            target = store.path_for(content_digest(image, image_format), image_format)
+        duplicate = target.is_file()
+        counts["deduplicated" if duplicate else "migrated"] += 1
+        if dry_run:
+            continue
+        if duplicate:
+            source.unlink()
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(source, target)
+        store._delete_thumbnails(source)
+        row.image_path = str(target)
+        row.file_size = target.stat().st_size
+        db.commit()
+    return counts
+
+
+def backfill_thumbnails(db, store: Optional[ImageStore] = None, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Écrit les miniatures manquantes des images existantes.
+
+    Idempotent: seules les tailles absentes sont écrites. Attend la fin des
+    écritures avant de rendre la main.
+
+    Returns:
+        dict: Nombre d'images generated (au moins une miniature écrite),
+        complete (rien à faire) et missing (fichier absent)
+    """
+    from app.database.models import GeneratedImage
+
+    store = store or image_store
+    counts = {"generated": 0, "complete": 0, "missing": 0}
+    paths = db.query(GeneratedImage.image_path).distinct().order_by(GeneratedImage.image_path).all()
+    for (image_path,) in paths:
+        source = Path(image_path)
+        if not source.is_file():
+            counts["missing"] += 1
+            continue
+        if all(store.thumbnail_path(source, size).is_file() for size in store.thumbnail_sizes):
+            counts["complete"] += 1
+            continue
+        counts["generated"] += 1
+        if dry_run:
+            continue
+        with Image.open(source) as image:
+            image.load()
+            store.put_thumbnails(image, source)
+            # Une image à la fois: la mémoire reste bornée sur un gros historique
+            image_writer.flush()
+    return counts
+
+
+# Instance globale (API, Gradio, ImageRepository)
+image_store = ImageStore(Path(settings.OUTPUT_DIR) / "portfolio")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Déplacer les images existantes dans le stockage adressé par contenu"
+    )
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Compter les images à traiter sans rien écrire")
+    parser.add_argument("--thumbnails", action="store_true",
+                        help="Écrire les miniatures manquantes au lieu de migrer")
+    args = parser.parse_args()
+
+    from app.database.database import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.thumbnails:
+            counts = backfill_thumbnails(db, dry_run=args.dry_run)
+        else:
+            counts = migrate_existing_images(db, dry_run=args.dry_run)
+    finally:
+        db.close()
+    prefix = "INFO: (dry-run) " if args.dry_run else "OK: "
+    if args.thumbnails:
+        print(f"{prefix}{counts['generated']} image(s) sans miniatures, {counts['complete']} complete(s), "
+              f"{counts['missing']} fichier(s) absent(s)")
+        return
+    print(f"{prefix}{counts['migrated']} image(s) migree(s), {counts['deduplicated']} doublon(s), "
+          f"{counts['skipped']} deja migree(s), {counts['missing']} fichier(s) absent(s), "
+          f"{counts['unsupported']} format(s) non pris en charge")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Encodage et écriture des images générées hors du chemin de la génération.
+
+PROBLÈME:
+---------
+image.save() encodait un PNG (zlib niveau 6) de manière synchrone entre
+la génération et le scoring: de l'ordre de 100 ms de CPU par image
+512x512, bien plus au-delà, pendant lesquels le worker ne génère rien.
+Ces PNG occupent aussi l'essentiel du disque.
+
+SOLUTION:
+---------
+- ImageWriter: pool de threads d'encodage (IMAGE_WRITER_WORKERS). Le
+  worker confie l'image et passe au scoring, à la base puis au job
+  suivant; les encodeurs de Pillow libèrent le GIL.
+- Format par requête (image_format), par template, sinon IMAGE_FORMAT:
+    png            sans perte, zlib niveau IMAGE_PNG_COMPRESS_LEVEL (0-9)
+    webp_lossless  sans perte, ~25% plus petit que le PNG
+    webp           avec perte, qualité IMAGE_WEBP_QUALITY (~10x plus petit)
+    jpeg           avec perte, qualité IMAGE_JPEG_QUALITY
+- Écriture atomique: fichier temporaire dans le même dossier, puis
+  os.replace(). Un lecteur ne voit jamais un fichier à moitié écrit.
+- Taille du fichier et durée d'encodage remontées à l'appelant.
+
+Les lecteurs d'un fichier encore en cours d'écriture (résultat d'un job,
+suppression) attendent la fin via image_writer.wait(path).
+
+Exemple:
+    >>> write = image_writer.submit(image, path, "webp")
+    >>> write.add_done_callback(lambda w: print(w.result["file_size"]))
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from PIL import Image
+from app.utils.config import settings
+from app.utils.metrics import IMAGE_SAVE_SECONDS, IMAGE_WRITES_PENDING
+
+# Format → (format Pillow, extension du fichier)
+IMAGE_FORMATS = {
+    "png": ("PNG", "png"),
+    "webp_lossless": ("WEBP", "webp"),
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+}
+
+
+def resolve_image_format(image_format: Optional[str] = None) -> str:
+    """
+    Format validé (None = IMAGE_FORMAT).
+
+    Raises:
+        ValueError: Format inconnu
+    """
+    name = (image_format or settings.IMAGE_FORMAT).lower()
+    if name not in IMAGE_FORMATS:
+        raise ValueError(f"Format d'image inconnu: '{name}' (disponibles: {', '.join(IMAGE_FORMATS)})")
+    return name
+
+
+def image_extension(image_format: str) -> str:
+    """Extension des fichiers d'un format (ex: "jpeg" → "jpg")."""
+    return IMAGE_FORMATS[image_format][1]
+
+
+def encoder_options(image_format: str, quality: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Paramètres de Image.save() pour un format.
+
+    Args:
+        image_format: Format validé (voir IMAGE_FORMATS)
+        quality: Qualité 1-100 des formats avec perte (None = réglage par défaut)
+    """
+    if image_format == "png":
+        return {"format": "PNG", "compress_level": settings.IMAGE_PNG_COMPRESS_LEVEL}
+    if image_format == "webp_lossless":
+        return {"format": "WEBP", "lossless": True}
+    if image_format == "webp":
+        return {"format": "WEBP", "quality": quality or settings.IMAGE_WEBP_QUALITY}
+    return {"format": "JPEG", "quality": quality or settings.IMAGE_JPEG_QUALITY, "optimize": True}
+
+
+def write_image(image: Image.Image, path: Union[str, Path], image_format: str = "png",
+                quality: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Encode et écrit une image de façon atomique (bloquant).
+
+    Returns:
+        dict: {"path", "format", "file_size" (octets), "seconds"}
+    """
+    path = Path(path)
+    options = encoder_options(image_format, quality)
+    if options["format"] == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    start = time.perf_counter()
+    try:
+        image.save(tmp_path, **options)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    seconds = time.perf_counter() - start
+    IMAGE_SAVE_SECONDS.labels(format=image_format).observe(seconds)
+    return {"path": str(path), "format": image_format, "file_size": path.stat().st_size, "seconds": seconds}
+
+
+class PendingWrite:
+    """
+    Écriture confiée à ImageWriter.
+
+    result est renseigné à la fin ({"path", "format", "file_size",
+    "seconds"}), error en cas d'échec. wait() ne rend la main qu'une fois
+    les callbacks exécutés: un lecteur voit les métadonnées à jour (ou
+    l'échec déjà répercuté).
+    """
+
+    def __init__(self, path: Path, image_format: str):
+        self.path = path
+        self.image_format = image_format
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self._callbacks: List[Callable[["PendingWrite"], None]] = []
+        self._failure_callbacks: List[Callable[["PendingWrite"], None]] = []
+        self._finished = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @classmethod
+    def completed(cls, path: Path, image_format: str, result: Dict[str, Any]) -> "PendingWrite":
+        """Écriture déjà terminée (ex: fichier déjà présent dans le stockage)."""
+        write = cls(path, image_format)
+        write._finish(result, None)
+        return write
+
+    @property
+    def done(self) -> bool:
+        """True si l'écriture (et ses callbacks) est terminée."""
+        return self._done.is_set()
+
+    def add_done_callback(self, callback: Callable[["PendingWrite"], None]) -> None:
+        """
+        Appelle callback(write) après une écriture réussie.
+
+        Exécuté par le thread d'écriture, ou immédiatement par l'appelant
+        si l'écriture est déjà terminée.
+        """
+        with self._lock:
+            if not self._finished:
+                self._callbacks.append(callback)
+                return
+        if self.result is not None:
+            self._run(callback)
+
+    def add_failure_callback(self, callback: Callable[["PendingWrite"], None]) -> None:
+        """
+        Appelle callback(write) si l'écriture échoue (error renseigné).
+
+        Même exécution que add_done_callback: thread d'écriture, ou
+        immédiatement si l'écriture a déjà échoué.
+        """
+        with self._lock:
+            if not self._finished:
+                self._failure_callbacks.append(callback)
+                return
+        if self.result is None:
+            self._run(callback)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Attend la fin de l'écriture. Returns: result (None si échec ou timeout)."""
+        self._done.wait(timeout)
+        return self.result
+
+    def _finish(self, result: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+        self.result, self.error = result, error
+        with self._lock:
+            self._finished = True
+            callbacks, self._callbacks = self._callbacks, []
+            failure_callbacks, self._failure_callbacks = self._failure_callbacks, []
+        for callback in callbacks if result is not None else failure_callbacks:
+            self._run(callback)
+        self._done.set()
+
+    def _run(self, callback: Callable[["PendingWrite"], None]) -> None:
+        try:
+            callback(self)
+        except Exception as e:
+            print(f"WARNING: Erreur apres l'ecriture de {self.path}: {e}")
+
+
+class ImageWriter:
+    """
+    Pool de threads qui encode et écrit les images générées.
+
+    Args:
+        max_workers: Threads d'encodage (0 = écriture synchrone dans submit)
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max(0, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Dict[str, PendingWrite] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, image: Image.Image, path: Union[str, Path], image_format: Optional[str] = None,
+               quality: Optional[int] = None, max_size: Optional[int] = None) -> PendingWrite:
+        """
+        Confie une image à écrire et rend la main aussitôt.
+
+        Args:
+            image: Image PIL (ni modifiée ni écrite ailleurs ensuite: Pillow
+                   n'écrit pas le même objet depuis deux threads)
+            path: Fichier de destination (extension cohérente avec le format)
+            image_format: Format (None = IMAGE_FORMAT)
+            quality: Qualité des formats avec perte (None = réglage par défaut)
+            max_size: Réduit l'image (copie) à ce côté maximal avant
+                      l'encodage, dans le thread d'écriture (miniatures)
+
+        Raises:
+            ValueError: Format inconnu
+        """
+        write = PendingWrite(Path(path), resolve_image_format(image_format))
+        with self._lock:
+            self._register(write)
+        self._start(write, image, quality, max_size)
+        return write
+
+    def submit_missing(self, image: Image.Image, path: Union[str, Path], image_format: Optional[str] = None,
+                       quality: Optional[int] = None, max_size: Optional[int] = None) -> Tuple[PendingWrite, bool]:
+        """
+        Comme submit, sauf si le fichier existe déjà ou est en cours
+        d'écriture. Vérification et soumission sont atomiques: deux appels
+        concurrents pour le même chemin ne lancent qu'une écriture.
+
+        Returns:
+            tuple: (écriture, True si lancée par cet appel). Fichier déjà
+            présent: écriture terminée, durée 0.
+
+        Raises:
+            ValueError: Format inconnu
+        """
+        write = PendingWrite(Path(path), resolve_image_format(image_format))
+        with self._lock:
+            # Une écriture terminée reste listée jusqu'à la fin de _write
+            pending = self._pending.get(str(write.path))
+            if pending is not None and not pending.done:
+                return pending, False
+            exists = write.path.is_file()
+            if not exists:
+                self._register(write)
+        if exists:
+            write._finish({
+                "path": str(write.path), "format": write.image_format,
+                "file_size": write.path.stat().st_size, "seconds": 0.0,
+            }, None)
+            return write, False
+        self._start(write, image, quality, max_size)
+        return write, True
+
+    def unlink_if_idle(self, path: Union[str, Path], keep: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Supprime un fichier sauf s'il est en cours d'écriture ou si keep()
+        est vrai. Vérification et suppression sont atomiques vis-à-vis de
+        submit et submit_missing.
+
+        Returns:
+            bool: True si le fichier a été supprimé
+        """
+        path = Path(path)
+        with self._lock:
+            pending = self._pending.get(str(path))
+            if (pending is not None and not pending.done) or (keep is not None and keep()):
+                return False
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                return False
+        return True
+
+    def _register(self, write: PendingWrite) -> None:
+        """Déclare une écriture en cours (appelé sous self._lock)."""
+        self._pending[str(write.path)] = write
+        if self.max_workers > 0 and self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="image-writer"
+            )
+
+    def _start(self, write: PendingWrite, image: Image.Image, quality: Optional[int],
+               max_size: Optional[int]) -> None:
+        if self._executor is None:
+            self._write(write, image, quality, max_size)
+        else:
+            self._executor.submit(self._write, write, image, quality, max_size)
+
+    def _write(self, write: PendingWrite, image: Image.Image, quality: Optional[int],
+               max_size: Optional[int] = None) -> None:
+        result, error = None, None
+        try:
+            if max_size is not None:
+                image = image.copy()
+                image.thumbnail((max_size, max_size), Image.LANCZOS)
+            result = write_image(image, write.path, write.image_format, quality)
+        except Exception as e:
+            error = str(e)
+            print(f"WARNING: Echec de l'ecriture de {write.path}: {e}")
+        write._finish(result, error)
+        with self._lock:
+            # Une écriture plus récente du même chemin reste en attente
+            key = str(write.path)
+            if self._pending.get(key) is write:
+                del self._pending[key]
+
+    def pending_write(self, path: Union[str, Path]) -> Optional[PendingWrite]:
+        """Écriture en cours d'un fichier (None si aucune)."""
+        with self._lock:
+            return self._pending.get(str(path))
+
+    def wait(self, path: Union[str, Path], timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Attend l'écriture en cours d'un fichier (retour immédiat si aucune).
+
+        Returns:
+            dict: Résultat de l'écriture, None si aucune n'était en cours
+        """
+        write = self.pending_write(path)
+        return write.wait(timeout) if write is not None else None
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Attend toutes les écritures en cours (arrêt du service)."""
+        with self._lock:
+            writes = list(self._pending.values())
+        for write in writes:
+            write.wait(timeout)
+
+    def pending(self) -> int:
+        """Nombre d'écritures en cours."""
+        with self._lock:
+            return len(self._pending)
+
+
+# Instance globale (API et Gradio)
+image_writer = ImageWriter(max_workers=settings.IMAGE_WRITER_WORKERS)
+IMAGE_WRITES_PENDING.set_function(image_writer.pending)
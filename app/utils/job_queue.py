@@ -0,0 +1,535 @@
+"""
+File d'attente de jobs pour les générations longues.
+
+PROBLÈME RÉSOLU:
+----------------
+Une génération Stable Diffusion prend 30s à 2min sur CPU. Exécutée directement
+dans un endpoint `async def`, elle bloque la boucle d'événements de FastAPI:
+plus aucune requête (/health, /history...) n'est servie pendant ce temps.
+
+SOLUTION:
+---------
+1. L'endpoint dépose le job dans la file et répond immédiatement (job_id)
+2. Un pool de workers (threads) dépile les jobs et exécute le handler
+3. Le client interroge le statut / la position puis récupère le résultat
+
+    POST /generate → submit() → [file équitable] → worker → handler(payload)
+    GET /jobs/{id} → get() + position()
+
+ORDONNANCEMENT ÉQUITABLE:
+-------------------------
+Une file FIFO laisse un utilisateur qui soumet des dizaines de jobs de
+50 steps affamer tous les autres. Chaque job a donc un utilisateur et une
+classe de priorité:
+- Classes servies par priorité stricte, aux frontières de jobs (un job
+  commencé n'est jamais interrompu): "interactive" (peu de steps, un
+  humain attend) passe avant "batch"
+- Dans une classe: weighted fair queuing entre utilisateurs. Chaque job
+  reçoit une étiquette de fin virtuelle
+      fin = max(temps virtuel de la classe, fin du job précédent de
+                l'utilisateur) + coût / poids de l'utilisateur
+  et le worker prend la plus petite. Un utilisateur qui a 50 jobs en
+  file n'en fait passer qu'un pendant que chacun des autres en fait
+  passer un (à coût égal), et l'ordre de ses propres jobs est conservé.
+- Des workers peuvent être réservés aux jobs interactifs: leur attente
+  reste bornée même quand tous les autres workers sont occupés par un
+  flot de jobs batch
+
+Pendant l'exécution, le handler peut publier la progression du job en
+cours via current_job().report_progress(...) (suivi step par step).
+
+Annulation (cancel()): un job en attente est retiré de la file; un job en
+cours voit son cancel_token annulé, le handler s'interrompt de lui-même
+(annulation coopérative, voir app/utils/cancellation.py).
+
+Les workers sont des threads: PyTorch relâche le GIL pendant les calculs,
+la boucle d'événements reste donc disponible pendant une génération.
+"""
+import bisect
+import threading
+import time
+import uuid
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+from app.utils.cancellation import CancellationToken
+from app.utils.metrics import JOB_WAIT_SECONDS
+
+# Classes de priorité, dans l'ordre de service
+PRIORITIES = ("interactive", "batch")
+DEFAULT_PRIORITY = "batch"
+ANONYMOUS_USER = "anonymous"
+
+
+class JobStatus(str, Enum):
+    """États possibles d'un job de génération."""
+    QUEUED = "queued"          # En attente dans la file
+    RUNNING = "running"        # En cours d'exécution par un worker
+    COMPLETED = "completed"    # Terminé avec succès (résultat disponible)
+    FAILED = "failed"          # Terminé en erreur (message disponible)
+    CANCELLED = "cancelled"    # Annulé (en file ou en cours d'exécution)
+
+
+class QueueFullError(Exception):
+    """Levée quand la file a atteint sa taille maximale."""
+
+
+class UserQueueFullError(QueueFullError):
+    """Levée quand un utilisateur a déjà max_queued_per_user jobs en attente."""
+
+
+class Job:
+    """
+    Un job soumis à la file: payload d'entrée + état + résultat.
+
+    Le payload est opaque pour la file (ex: GenerateRequest),
+    seul le handler sait l'interpréter.
+    """
+
+    def __init__(self, payload: Any, cost: float = 0.0, user_id: str = ANONYMOUS_USER,
+                 priority: str = DEFAULT_PRIORITY):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        # Durée d'exécution estimée (secondes), voir JobQueue.queued_cost()
+        self.cost = cost
+        # Ordonnancement: utilisateur, classe et étiquette de fin virtuelle
+        self.user_id = user_id
+        self.priority = priority
+        self.finish_tag = 0.0
+        self.status = JobStatus.QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Dernière progression publiée par le handler (None = aucune)
+        # et dernier aperçu (conservé entre les steps qui n'en ont pas)
+        self.progress: Optional[Dict[str, Any]] = None
+        self.preview: Optional[str] = None
+        # Annulé par JobQueue.cancel(), vérifié par le handler
+        self.cancel_token = CancellationToken()
+
+    def report_progress(self, progress: Dict[str, Any]) -> None:
+        """
+        Publie la progression du job (appelé depuis le worker).
+
+        Le dict est remplacé en bloc (jamais modifié en place): un lecteur
+        concurrent voit toujours un état cohérent, et peut détecter une
+        nouvelle progression par identité (is not).
+        """
+        progress = dict(progress)
+        preview = progress.pop("preview", None)
+        if preview is not None:
+            self.preview = preview
+        self.progress = progress
+
+    @property
+    def wait_time(self) -> Optional[float]:
+        """Attente en file (secondes) jusqu'au début de l'exécution (None si pas démarré)."""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.created_at
+
+    @property
+    def is_finished(self) -> bool:
+        """True si le job est terminé (succès, échec ou annulation)."""
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Métadonnées du job (sans le résultat) pour sérialisation JSON."""
+        return {
+            "job_id": self.id,
+            "status": self.status.value,
+            "user_id": self.user_id,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "progress": self.progress,
+        }
+
+
+# Job en cours d'exécution dans le thread worker courant
+_current = threading.local()
+
+
+def current_job() -> Optional[Job]:
+    """Job exécuté par le thread courant (None hors d'un worker de JobQueue)."""
+    return getattr(_current, "job", None)
+
+
+class JobQueue:
+    """
+    File bornée à ordonnancement équitable + pool de workers threads.
+
+    Args:
+        handler: Fonction exécutée par les workers pour chaque payload.
+                 Sa valeur de retour devient job.result, une exception
+                 passe le job en FAILED avec le message d'erreur.
+        num_workers: Nombre de jobs exécutés en parallèle
+        max_queue_size: Nombre max de jobs en attente (au-delà: QueueFullError)
+        result_ttl: Durée de conservation (secondes) des jobs terminés
+        user_weights: Poids de chaque utilisateur (défaut 1.0): un poids 2
+                      obtient deux fois plus de temps de génération
+        max_queued_per_user: Jobs en attente max par utilisateur
+                             (au-delà: UserQueueFullError; None = pas de limite)
+        interactive_workers: Workers supplémentaires réservés aux jobs
+                             "interactive" (en plus de num_workers)
+
+    Les workers sont démarrés paresseusement à la première soumission,
+    ce qui évite de créer des threads au simple import du module.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Any],
+        num_workers: int = 1,
+        max_queue_size: int = 100,
+        result_ttl: float = 3600.0,
+        user_weights: Optional[Dict[str, float]] = None,
+        max_queued_per_user: Optional[int] = None,
+        interactive_workers: int = 0,
+    ):
+        self.handler = handler
+        self.interactive_workers = max(0, interactive_workers)
+        self.num_workers = max(1, num_workers) + self.interactive_workers
+        self.max_queue_size = max_queue_size
+        self.result_ttl = result_ttl
+        self.user_weights = dict(user_weights or {})
+        self.max_queued_per_user = max_queued_per_user
+
+        self._jobs: Dict[str, Job] = {}
+        # Une file par classe, triée par étiquette de fin virtuelle
+        self._pending: Dict[str, List[Job]] = {priority: [] for priority in PRIORITIES}
+        # Temps virtuel de chaque classe (étiquette du dernier job servi)
+        # et dernière étiquette attribuée à chaque (classe, utilisateur)
+        self._virtual_time: Dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._last_finish: Dict[tuple, float] = {}
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._running_count = 0
+        self._stopping = False
+
+    # ========================================
+    # CYCLE DE VIE DES WORKERS
+    # ========================================
+
+    def start(self) -> None:
+        """Démarre les workers (idempotent)."""
+        with self._cond:
+            if self._workers:
+                return
+            self._stopping = False
+            for i in range(self.num_workers):
+                # Les premiers workers ne prennent que des jobs interactifs
+                interactive_only = i < self.interactive_workers
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    args=(interactive_only,),
+                    name=f"job-worker-{i}{'-interactive' if interactive_only else ''}",
+                    daemon=True,
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Arrête les workers après leur job en cours.
+
+        Les jobs encore en attente restent dans la file (statut QUEUED).
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            workers = list(self._workers)
+        for worker in workers:
+            worker.join(timeout)
+        with self._cond:
+            self._workers = []
+
+    def _next_job(self, interactive_only: bool) -> Optional[Job]:
+        """
+        Retire le prochain job à exécuter (verrou tenu).
+
+        Priorité stricte entre classes, plus petite étiquette de fin
+        virtuelle dans la classe.
+        """
+        for priority in PRIORITIES:
+            if interactive_only and priority != "interactive":
+                break
+            pending = self._pending[priority]
+            if pending:
+                job = pending.pop(0)
+                self._virtual_time[priority] = job.finish_tag
+                # Les étiquettes dépassées par le temps virtuel ne servent plus
+                self._last_finish = {
+                    key: tag for key, tag in self._last_finish.items()
+                    if key[0] != priority or tag > job.finish_tag
+                }
+                return job
+        return None
+
+    def _worker_loop(self, interactive_only: bool = False) -> None:
+        """Boucle d'un worker: attend un job, l'exécute, recommence."""
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    job = self._next_job(interactive_only)
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                job.status = JobStatus.RUNNING
+                job.started_at = time.time()
+                self._running_count += 1
+            JOB_WAIT_SECONDS.labels(priority=job.priority).observe(job.wait_time)
+
+            _current.job = job
+            try:
+                result = self.handler(job.payload)
+                with self._cond:
+                    job.result = result
+                    # fail() a pu être appelé pendant le handler
+                    job.status = JobStatus.COMPLETED if job.error is None else JobStatus.FAILED
+            except Exception as e:
+                job.error = str(e)
+                if job.cancel_token.is_cancelled:
+                    job.status = JobStatus.CANCELLED
+                    print(f"INFO: Job {job.id} annule en cours d'execution ({job.cancel_token.reason})")
+                else:
+                    job.status = JobStatus.FAILED
+                    print(f"WARNING: Job {job.id} en echec: {e}")
+            finally:
+                _current.job = None
+                job.finished_at = time.time()
+                with self._cond:
+                    self._running_count -= 1
+                    self._cond.notify_all()
+
+    # ========================================
+    # API PUBLIQUE
+    # ========================================
+
+    def _enqueue(self, job: Job) -> None:
+        """Insère le job dans la file de sa classe, à sa place (verrou tenu)."""
+        bisect.insort(self._pending[job.priority], job, key=lambda j: j.finish_tag)
+
+    def _queued_jobs(self) -> List[Job]:
+        """Jobs en attente, dans l'ordre où ils seraient servis (verrou tenu)."""
+        return [job for priority in PRIORITIES for job in self._pending[priority]]
+
+    def submit(self, payload: Any, cost: float = 0.0, user_id: Optional[str] = None,
+               priority: str = DEFAULT_PRIORITY) -> Job:
+        """
+        Ajoute un job à la file et retourne immédiatement.
+
+        Args:
+            payload: Entrée du handler
+            cost: Durée d'exécution estimée (secondes), 0 si inconnue
+                  (chaque job compte alors pour une unité)
+            user_id: Utilisateur pour le partage équitable (None = anonyme)
+            priority: Classe de priorité (PRIORITIES)
+
+        Raises:
+            ValueError: Classe de priorité inconnue
+            QueueFullError: Si max_queue_size jobs sont déjà en attente
+            UserQueueFullError: Si l'utilisateur a déjà max_queued_per_user jobs en attente
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priorite inconnue: '{priority}' (disponibles: {', '.join(PRIORITIES)})")
+        user_id = user_id or ANONYMOUS_USER
+        self.start()
+        with self._cond:
+            self._purge_expired()
+            queued = self._queued_jobs()
+            if len(queued) >= self.max_queue_size:
+                raise QueueFullError(
+                    f"File de generation pleine ({self.max_queue_size} jobs en attente)"
+                )
+            if self.max_queued_per_user is not None:
+                user_queued = sum(1 for job in queued if job.user_id == user_id)
+                if user_queued >= self.max_queued_per_user:
+                    raise UserQueueFullError(
+                        f"{user_queued} jobs deja en attente pour l'utilisateur '{user_id}' "
+                        f"(max {self.max_queued_per_user})"
+                    )
+            job = Job(payload, cost, user_id, priority)
+            # Étiquette de fin virtuelle (weighted fair queuing)
+            weight = self.user_weights.get(user_id, 1.0)
+            start_tag = max(self._virtual_time[priority], self._last_finish.get((priority, user_id), 0.0))
+            job.finish_tag = start_tag + (cost if cost > 0 else 1.0) / weight
+            self._last_finish[(priority, user_id)] = job.finish_tag
+            self._jobs[job.id] = job
+            self._enqueue(job)
+            self._cond.notify_all()
+            return job
+
+    def add_completed(self, payload: Any, result: Any, user_id: Optional[str] = None,
+                      priority: str = DEFAULT_PRIORITY) -> Job:
+        """
+        Enregistre un job déjà terminé, sans passer par la file.
+
+        Sert quand le résultat est connu d'avance (ex: cache de résultats):
+        le client suit le même parcours (/jobs/{id}, /result) qu'un job normal.
+        """
+        job = Job(payload, user_id=user_id or ANONYMOUS_USER, priority=priority)
+        job.result = result
+        job.status = JobStatus.COMPLETED
+        job.started_at = job.finished_at = job.created_at
+        with self._cond:
+            self._purge_expired()
+            self._jobs[job.id] = job
+        return job
+
+    def fail(self, job: Job, error: str) -> None:
+        """
+        Passe en échec un job en cours ou terminé avec succès.
+
+        Sert quand une étape différée du résultat échoue (ex: écriture en
+        arrière-plan d'un fichier): un job encore en cours finit FAILED
+        même si son handler réussit. Sans effet sur un job déjà en échec
+        ou annulé.
+        """
+        with self._cond:
+            if job.status in (JobStatus.FAILED, JobStatus.CANCELLED):
+                return
+            job.error = error
+            if job.status == JobStatus.COMPLETED:
+                job.status = JobStatus.FAILED
+                self._cond.notify_all()
+        print(f"WARNING: Job {job.id} en echec: {error}")
+
+    def cancel(self, job_id: str, reason: str = "cancelled") -> Optional[Job]:
+        """
+        Annule un job.
+
+        - En attente: retiré de la file immédiatement (statut CANCELLED)
+        - En cours: son cancel_token est annulé; le statut passe à
+          CANCELLED quand le handler s'interrompt
+        - Terminé: aucun effet
+
+        Returns:
+            Le job (None si inconnu ou expiré)
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.is_finished:
+                return job
+            if job.status == JobStatus.QUEUED:
+                self._pending[job.priority].remove(job)
+                job.status = JobStatus.CANCELLED
+                job.error = reason
+                job.finished_at = time.time()
+                self._cond.notify_all()
+        # Hors du verrou: les callbacks du token (pool, batching) peuvent
+        # réveiller d'autres threads
+        job.cancel_token.cancel(reason)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Retourne le job correspondant (None si inconnu ou expiré)."""
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """
+        Position du job dans la file d'attente.
+
+        Estimation: un job soumis ensuite (interactif, ou d'un utilisateur
+        qui a moins de travail en file) peut passer devant.
+
+        Returns:
+            1 = prochain job exécuté, None si le job n'est plus en attente
+        """
+        with self._cond:
+            for index, job in enumerate(self._queued_jobs()):
+                if job.id == job_id:
+                    return index + 1
+        return None
+
+    def queued_cost(self, priority: Optional[str] = None) -> float:
+        """
+        Somme des durées estimées des jobs en attente (secondes).
+
+        Args:
+            priority: Ne compter que le travail servi avant (ou avec) un job
+                      de cette classe (None = toute la file)
+        """
+        with self._cond:
+            if priority is None:
+                return sum(job.cost for job in self._queued_jobs())
+            ahead = PRIORITIES[:PRIORITIES.index(priority) + 1]
+            return sum(job.cost for p in ahead for job in self._pending[p])
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """Bloque jusqu'à la fin du job (ou l'expiration du timeout)."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            job = self._jobs.get(job_id)
+            while job is not None and not job.is_finished:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return job
+
+    def stats(self) -> Dict[str, Any]:
+        """Profondeur de la file et compteurs, pour le monitoring."""
+        with self._cond:
+            completed = sum(1 for j in self._jobs.values() if j.status == JobStatus.COMPLETED)
+            failed = sum(1 for j in self._jobs.values() if j.status == JobStatus.FAILED)
+            cancelled = sum(1 for j in self._jobs.values() if j.status == JobStatus.CANCELLED)
+            return {
+                "queued": sum(len(pending) for pending in self._pending.values()),
+                "queued_by_priority": {p: len(pending) for p, pending in self._pending.items()},
+                "running": self._running_count,
+                "completed": completed,
+                "failed": failed,
+                "cancelled": cancelled,
+                "workers": self.num_workers,
+                "interactive_workers": self.interactive_workers,
+                "max_queue_size": self.max_queue_size,
+                "users": self._user_stats(),
+            }
+
+    def _user_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Profondeur de file et attente par utilisateur (verrou tenu).
+
+        Attentes calculées sur les jobs démarrés encore conservés (result_ttl),
+        plus l'attente en cours du plus ancien job en file.
+        """
+        now = time.time()
+        users: Dict[str, Dict[str, Any]] = {}
+        for job in self._jobs.values():
+            user = users.setdefault(job.user_id, {"queued": 0, "running": 0, "waits": [], "oldest_queued": 0.0})
+            if job.status == JobStatus.QUEUED:
+                user["queued"] += 1
+                user["oldest_queued"] = max(user["oldest_queued"], now - job.created_at)
+            elif job.status == JobStatus.RUNNING:
+                user["running"] += 1
+            if job.wait_time is not None:
+                user["waits"].append(job.wait_time)
+        return {
+            user_id: {
+                "queued": user["queued"],
+                "running": user["running"],
+                "weight": self.user_weights.get(user_id, 1.0),
+                "mean_wait": sum(user["waits"]) / len(user["waits"]) if user["waits"] else None,
+                "max_wait": max(user["waits"]) if user["waits"] else None,
+                "oldest_queued_wait": user["oldest_queued"] if user["queued"] else None,
+            }
+            for user_id, user in users.items()
+        }
+
+    def _purge_expired(self) -> None:
+        """Oublie les jobs terminés depuis plus de result_ttl secondes."""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.is_finished and job.finished_at is not None
+            and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
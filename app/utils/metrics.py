@@ -0,0 +1,401 @@
+"""
+Métriques du service au format d'exposition Prometheus (GET /metrics).
+
+POURQUOI ?
+----------
+Derrière un load balancer, rien ne montrait le débit de requêtes, la
+profondeur de la file, les latences, les taux de cache ni l'état du
+modèle. Les compteurs sont alimentés là où le travail est fait
+(StableDiffusionGenerator, AestheticScorer, ImageRepository, sauvegarde
+des images): API, Gradio et entraînement produisent les mêmes chiffres.
+
+IMPLÉMENTATION:
+---------------
+Registre minimal sans dépendance (même interface que prometheus_client:
+labels(), inc(), set(), observe(), time()), sortie au format texte
+version 0.0.4. Les jauges "à la demande" (mémoire du processus, file,
+modèle chargé) sont calculées par une fonction au moment du scrape.
+
+Chaque processus a son registre: avec le pool d'inférence, le processus
+principal compte les générations de ses workers à leur retour.
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Durées de la milliseconde (requêtes en base) à plusieurs minutes (génération CPU)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+GENERATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    """Base commune: nom, aide, labels et une valeur par combinaison de labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional["MetricsRegistry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._function: Optional[Callable[[], Optional[float]]] = None
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._values[()] = self._new_value()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_value(self):
+        return 0.0
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: labels attendus {self.labelnames}, recus {tuple(labels)}")
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values.setdefault(key, self._new_value())
+        return key
+
+    def labels(self, **labels: str) -> "_Series":
+        """Série correspondant à ces valeurs de labels (créée au premier usage)."""
+        return _Series(self, self._key(labels))
+
+    def set_function(self, function: Callable[[], Optional[float]]) -> None:
+        """Valeur calculée à chaque scrape (None = série absente)."""
+        self._function = function
+
+    def _samples(self) -> List[Tuple[str, Tuple[str, ...], Tuple[str, ...], float]]:
+        """(nom, labels, valeurs des labels, valeur) de chaque échantillon."""
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                return []  # Source indisponible: série absente plutôt qu'un scrape en erreur
+            return [] if value is None else [(self.exposed_name, (), (), value)]
+        with self._lock:
+            return [(self.exposed_name, self.labelnames, key, value) for key, value in self._values.items()]
+
+    @property
+    def exposed_name(self) -> str:
+        return self.name + ("_total" if self.kind == "counter" else "")
+
+    def render(self) -> str:
+        """Bloc HELP/TYPE puis une ligne par échantillon."""
+        lines = [
+            f"# HELP {self.exposed_name} {self.documentation}",
+            f"# TYPE {self.exposed_name} {self.kind}",
+        ]
+        for name, names, values, value in self._samples():
+            lines.append(f"{name}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Valeur qui ne fait que croître (exposée avec le suffixe _total)."""
+
+    kind = "counter"
+
+    def _inc(self, key: Tuple[str, ...], amount: float) -> None:
+        if amount < 0:
+            raise ValueError("Un compteur ne peut que croitre")
+        with self._lock:
+            self._values[key] += amount
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._inc((), amount)
+
+
+class Gauge(_Metric):
+    """Valeur instantanée (peut monter et descendre)."""
+
+    kind = "gauge"
+
+    def _set(self, key: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            self._values[key] = float(value)
+
+    def _inc(self, key: Tuple[str, ...], amount: float) -> None:
+        with self._lock:
+            self._values[key] += amount
+
+    def set(self, value: float) -> None:
+        self._set((), value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._inc((), amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._inc((), -amount)
+
+    @contextmanager
+    def track_inprogress(self) -> Iterator[None]:
+        """+1 pendant le bloc."""
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class Histogram(_Metric):
+    """Distribution de durées: compteurs cumulés par seuil, somme et nombre."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional["MetricsRegistry"] = None):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_value(self):
+        return {"counts": [0] * len(self.buckets), "sum": 0.0}
+
+    def _observe(self, key: Tuple[str, ...], value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values[key]
+            state["counts"][index] += 1
+            state["sum"] += value
+
+    def observe(self, value: float) -> None:
+        self._observe((), value)
+
+    def time(self) -> "_Timer":
+        """Mesure un bloc (with) ou chaque appel d'une fonction (décorateur)."""
+        return _Timer(lambda seconds: self._observe((), seconds))
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            series = [(key, list(state["counts"]), state["sum"]) for key, state in self._values.items()]
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", self.labelnames + ("le",),
+                                key + (_format_value(bound),), cumulative))
+            samples.append((f"{self.name}_sum", self.labelnames, key, total))
+            samples.append((f"{self.name}_count", self.labelnames, key, cumulative))
+        return samples
+
+
+class _Series:
+    """Série d'une métrique à labels (retournée par labels())."""
+
+    def __init__(self, metric: _Metric, key: Tuple[str, ...]):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._metric._inc(self._key, amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._metric._inc(self._key, -amount)
+
+    def set(self, value: float) -> None:
+        self._metric._set(self._key, value)
+
+    def observe(self, value: float) -> None:
+        self._metric._observe(self._key, value)
+
+    def time(self) -> "_Timer":
+        return _Timer(self.observe)
+
+
+class _Timer:
+    """Context manager et décorateur retournés par time()."""
+
+    def __init__(self, observe: Callable[[float], None]):
+        self._observe = observe
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._observe(time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Timer(self._observe):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+class MetricsRegistry:
+    """Ensemble des métriques exposées par un processus."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metrique deja enregistree: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Toutes les métriques au format texte Prometheus."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Mémoire résidente du processus (Linux: /proc/self/statm; None ailleurs)."""
+    import os
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# Registre global du processus
+REGISTRY = MetricsRegistry()
+
+# ========================================
+# REQUÊTES HTTP (middleware de app/main.py)
+# ========================================
+HTTP_REQUESTS = Counter(
+    "http_requests", "Requetes HTTP traitees", ["method", "route", "status"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Duree de traitement des requetes HTTP", ["method", "route"])
+
+# ========================================
+# GÉNÉRATION (StableDiffusionGenerator, pool d'inférence)
+# ========================================
+GENERATIONS = Counter(
+    "sd_generations", "Appels du pipeline par issue", ["outcome"])
+IMAGES_GENERATED = Counter(
+    "sd_images_generated", "Images produites par le pipeline")
+GENERATION_SECONDS = Histogram(
+    "sd_generation_duration_seconds", "Duree d'un appel du pipeline (batch complet)",
+    buckets=GENERATION_BUCKETS)
+GENERATION_STAGE_SECONDS = Histogram(
+    "sd_generation_stage_seconds", "Duree par image de chaque etape du pipeline", ["stage"],
+    buckets=GENERATION_BUCKETS)
+GENERATIONS_IN_FLIGHT = Gauge(
+    "sd_generations_in_flight", "Appels du pipeline en cours")
+MODEL_LOADED = Gauge(
+    "sd_model_loaded", "1 si le modele Stable Diffusion est charge")
+MODEL_LOAD_SECONDS = Gauge(
+    "sd_model_load_seconds", "Duree du dernier chargement du modele")
+TEXT_EMBEDDING_CACHE_HITS = Counter(
+    "sd_text_embedding_cache_hits", "Embeddings CLIP servis par le cache")
+TEXT_EMBEDDING_CACHE_MISSES = Counter(
+    "sd_text_embedding_cache_misses", "Embeddings CLIP calcules (absents du cache)")
+
+# ========================================
+# SCORING, SAUVEGARDE, BASE DE DONNÉES
+# ========================================
+SCORING_SECONDS = Histogram(
+    "aesthetic_scoring_duration_seconds", "Duree du calcul du score esthetique")
+AESTHETIC_SCORES = Histogram(
+    "aesthetic_score", "Scores esthetiques attribues (0-10)", buckets=tuple(range(1, 11)))
+IMAGE_SAVE_SECONDS = Histogram(
+    "image_save_duration_seconds", "Duree d'encodage et d'ecriture d'une image", ["format"])
+IMAGE_WRITES_PENDING = Gauge(
+    "image_writes_pending", "Images en attente d'encodage ou d'ecriture")
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Duree des operations ImageRepository", ["operation"],
+    buckets=DB_BUCKETS)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors", "Operations ImageRepository en erreur", ["operation"])
+
+# ========================================
+# FILE DE JOBS, CACHE DE RÉSULTATS, ADMISSION
+# ========================================
+JOBS_QUEUED = Gauge("job_queue_depth", "Jobs en attente dans la file")
+JOBS_RUNNING = Gauge("job_queue_running", "Jobs en cours d'execution")
+JOB_WAIT_SECONDS = Histogram(
+    "job_queue_wait_seconds", "Attente en file avant execution", ["priority"],
+    buckets=GENERATION_BUCKETS)
+RESULT_CACHE = Counter(
+    "result_cache_lookups", "Recherches dans le cache de resultats (POST /generate)", ["result"])
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections", "Generations refusees par le controle d'admission", ["status"])
+
+# ========================================
+# PROCESSUS
+# ========================================
+PROCESS_RSS = Gauge("process_resident_memory_bytes", "Memoire residente du processus")
+PROCESS_RSS.set_function(process_rss_bytes)
+
+
+def track_generation(method: Callable) -> Callable:
+    """
+    Décorateur des méthodes generate/generate_batch qui exécutent le
+    pipeline: appels en cours, durée, issue, images produites et temps
+    par étape joints aux images (app/utils/timings.py).
+    """
+    from app.utils.cancellation import GenerationCancelled
+    from app.utils.timings import GENERATOR_STAGES, image_timings
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        with GENERATIONS_IN_FLIGHT.track_inprogress():
+            try:
+                output = method(*args, **kwargs)
+            except GenerationCancelled:
+                GENERATIONS.labels(outcome="cancelled").inc()
+                raise
+            except Exception:
+                GENERATIONS.labels(outcome="failed").inc()
+                raise
+        GENERATION_SECONDS.observe(time.perf_counter() - start)
+        GENERATIONS.labels(outcome="completed").inc()
+        images = output if isinstance(output, list) else [output]
+        IMAGES_GENERATED.inc(len(images))
+        for image in images:
+            timings = image_timings(image).to_dict()
+            for stage in GENERATOR_STAGES:
+                if stage in timings:
+                    GENERATION_STAGE_SECONDS.labels(stage=stage).observe(timings[stage])
+        return output
+
+    return wrapper
+
+
+def track_query(operation: str) -> Callable:
+    """Décorateur des méthodes ImageRepository: durée et erreurs par opération."""
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with DB_QUERY_SECONDS.labels(operation=operation).time():
+                try:
+                    return method(*args, **kwargs)
+                except Exception:
+                    DB_QUERY_ERRORS.labels(operation=operation).inc()
+                    raise
+        return wrapper
+    return decorator
@@ -7,7 +7,9 @@ Au lieu de laisser l'utilisateur écrire des prompts complexes, ce module:
 1. Prend un prompt simple de l'utilisateur (ex: "a cat")
 2. Applique un template selon le cas d'usage choisi (logo, marketing, etc.)
 3. Enrichit automatiquement avec des keywords optimisés
-4. Configure les meilleurs paramètres de génération
+4. Configure les meilleurs paramètres de génération (dont le scheduler,
+   voir app/models/schedulers.py, et le format du fichier, voir
+   app/utils/image_writer.py)
 
 AVANTAGES:
 ----------
@@ -23,12 +25,12 @@ UseCase → Style → Template → Prompt enrichi + Paramètres optimisés
 Exemple:
   Input:  use_case="logo", style="minimalist", prompt="a cat"
   Output: "a cat, logo design, minimalist, clean lines, simple shapes..."
-          + guidance_scale=9.0, steps=50, negative_prompt="..."
+          + guidance_scale=9.0, steps=50, scheduler="dpmpp", negative_prompt="..."
 
 CAS D'USAGE SUPPORTÉS:
 ----------------------
 - LOGO: Designs de logos professionnels (8 styles)
-- MARKETING: Visuels publicitaires (8 styles)  
+- MARKETING: Visuels publicitaires (9 styles, dont "draft": brouillon rapide)
 - GAME_ASSETS: Éléments de jeux vidéo (8 styles)
 - ARTISTIC: Art créatif et concept art (8 styles)
 - GENERAL: Sans template, enrichissement minimal
@@ -83,7 +85,8 @@ USE_CASE_STYLES: Dict[str, List[str]] = {
         "promotional",
         "branded",
         "product_showcase",
-        "infographic"
+        "infographic",
+        "draft"
     ],
     UseCase.GAME_ASSETS: [
         "pixel_art",
@@ -143,6 +146,8 @@ def get_logo_prompt(base_prompt: str, style: str = "minimalist") -> Tuple[str, s
     params = {
         "guidance_scale": 9.0,  # Plus élevé pour meilleure fidélité au prompt
         "num_inference_steps": 50,
+        "scheduler": "dpmpp",
+        "image_format": "png",  # Sans perte: aplats et bords nets
         "width": 512,
         "height": 512
     }
@@ -169,7 +174,8 @@ def get_marketing_prompt(base_prompt: str, style: str = "social_media") -> Tuple
         "promotional": "promotional material, festive, attractive, engaging, colorful",
         "branded": "branded content, consistent color scheme, professional, corporate identity",
         "product_showcase": "product photography, studio lighting, professional, clean background, high quality",
-        "infographic": "infographic style, clear information hierarchy, visual data representation, educational"
+        "infographic": "infographic style, clear information hierarchy, visual data representation, educational",
+        "draft": "quick concept draft, simple composition, clear layout, marketing mockup"
     }
     
     style_text = style_keywords.get(style.lower(), style_keywords["social_media"])
@@ -184,10 +190,16 @@ def get_marketing_prompt(base_prompt: str, style: str = "social_media") -> Tuple
     params = {
         "guidance_scale": 8.5,
         "num_inference_steps": 50,
+        "scheduler": "dpmpp",
         "width": 1024 if style in ["banner", "poster"] else 512,
         "height": 512 if style == "banner" else (1024 if style == "poster" else 512)
     }
     
+    # Brouillon: UniPC converge en ~15 steps au lieu de 50 (3x plus rapide)
+    # Suffisant pour valider une composition avant la version finale
+    if style == "draft":
+        params.update({"scheduler": "unipc", "num_inference_steps": 15, "guidance_scale": 7.5})
+    
     return optimized_prompt, negative_prompt, params
 
 
@@ -225,6 +237,8 @@ def get_game_assets_prompt(base_prompt: str, style: str = "pixel_art") -> Tuple[
     params = {
         "guidance_scale": 8.0,
         "num_inference_steps": 50,
+        "scheduler": "dpmpp",
+        "image_format": "png",  # Sans perte: pixel art et bords nets
         "width": 512,
         "height": 512
     }
@@ -266,6 +280,7 @@ def get_artistic_prompt(base_prompt: str, style: str = "photorealistic") -> Tupl
     params = {
         "guidance_scale": 7.5,
         "num_inference_steps": 60,  # Plus de steps pour meilleure qualité artistique
+        "scheduler": "dpmpp",
         "width": 512,
         "height": 512
     }
@@ -308,6 +323,7 @@ def apply_prompt_template(
         params = {
             "guidance_scale": 7.0,  # DreamShaper fonctionne bien avec 7-8
             "num_inference_steps": 35,  # Réduit de 50 à 35 pour CPU
+            "scheduler": "dpmpp",  # DPM-Solver++: bon compromis qualité/steps
             "width": 512,
             "height": 512
         }
@@ -331,6 +347,7 @@ def apply_prompt_template(
         params = {
             "guidance_scale": 7.5,
             "num_inference_steps": 50,
+            "scheduler": "dpmpp",
             "width": 512,
             "height": 512
         }
@@ -0,0 +1,80 @@
+"""
+Cache des résultats de génération, adressé par le contenu des paramètres.
+
+PRINCIPE:
+---------
+Avec une seed explicite, l'image est entièrement déterminée par:
+- le prompt final et le negative prompt
+- guidance_scale, num_inference_steps, width, height, seed, scheduler
+- le modèle, le device et le dtype
+  (le bruit initial d'un torch.Generator CPU diffère de celui d'un CUDA)
+
+Le format et la qualité du fichier en font aussi partie: une requête
+jpeg ne reçoit pas une image stockée en PNG.
+
+L'empreinte SHA-256 de ces champs est enregistrée dans la colonne
+generated_images.cache_key. Une requête identique retrouve la ligne
+et son fichier (voir app/utils/image_store.py) en quelques millisecondes,
+sans passer par le pipeline.
+
+Sans seed, la génération n'est pas reproductible: jamais de cache.
+
+Exemple:
+    >>> key = generation_cache_key(params, sd_generator.cache_identity())
+    >>> image = find_cached_image(db, key)  # None si absent
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional
+from sqlalchemy.orm import Session
+from app.database.models import GeneratedImage
+from app.database.repository import ImageRepository
+from app.utils.image_writer import encoder_options, resolve_image_format
+
+# Champs de la requête qui déterminent l'image
+KEY_FIELDS = (
+    "prompt", "negative_prompt", "guidance_scale",
+    "num_inference_steps", "width", "height", "seed", "scheduler",
+    "image_format", "image_quality",
+)
+
+
+def generation_cache_key(params: Dict[str, Any], identity: Dict[str, Any]) -> Optional[str]:
+    """
+    Calcule l'empreinte d'une génération.
+
+    Args:
+        params: Paramètres finaux (voir KEY_FIELDS)
+        identity: Modèle, device, dtype (cache_identity() du générateur)
+
+    Returns:
+        str: Empreinte hexadécimale (64 caractères), None si seed absente
+    """
+    if params.get("seed") is None:
+        return None
+    payload = {field: params.get(field) for field in KEY_FIELDS}
+    # Normalisation: 7 et 7.0 donnent la même empreinte
+    payload["guidance_scale"] = float(payload["guidance_scale"])
+    payload["negative_prompt"] = payload["negative_prompt"] or ""
+    # Qualité effective (réglage par défaut si absente, ignorée sans perte)
+    payload["image_format"] = resolve_image_format(payload["image_format"])
+    payload["image_quality"] = encoder_options(payload["image_format"], payload["image_quality"]).get("quality")
+    payload.update(identity)
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def find_cached_image(db: Session, cache_key: Optional[str]) -> Optional[GeneratedImage]:
+    """
+    Image déjà générée avec cette empreinte, dont le fichier existe encore.
+
+    Returns:
+        GeneratedImage la plus récente, None en cas de miss
+    """
+    if cache_key is None:
+        return None
+    for image in ImageRepository.get_by_cache_key(db, cache_key):
+        if Path(image.image_path).is_file():
+            return image
+    return None
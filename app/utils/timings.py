@@ -0,0 +1,93 @@
+"""
+Temps par étape d'une génération.
+
+POURQUOI ?
+----------
+generation_time mélange pipeline, sauvegarde PNG et scoring (et l'API ne
+mesurait pas la même chose que Gradio). Impossible de savoir quelle
+étape ralentit d'une version à l'autre, ni de dimensionner le matériel.
+
+ÉTAPES (secondes PAR IMAGE, un batch étant partagé entre ses images):
+---------------------------------------------------------------------
+- text_encoding:  encodage CLIP des prompts (quasi nul si le cache répond)
+- denoising:      boucle de débruitage du UNet
+- denoising_step: moyenne par step du batch entier (denoising /
+                  num_inference_steps), non répartie entre les images
+- vae_decode:     décodage VAE des latents et conversion en PIL
+- image_save:     encodage et écriture du fichier (en arrière-plan, voir
+                  app/utils/image_writer.py)
+- scoring:        score esthétique
+- db_write:       insertion en base
+
+Les quatre premières sont mesurées par le générateur et voyagent avec
+l'image (image.info["timings"]): elles traversent ainsi le micro-batching,
+le contrôle d'admission et le pool de processus sans changer leur
+interface. Les suivantes sont ajoutées par l'API ou Gradio.
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from PIL import Image
+
+STAGES = (
+    "text_encoding", "denoising", "denoising_step", "vae_decode",
+    "image_save", "scoring", "db_write",
+)
+
+# Étapes mesurées par le générateur (les suivantes par l'appelant)
+GENERATOR_STAGES = STAGES[:4]
+
+# Durées par step, pas par image: jamais réparties entre les images d'un batch
+PER_STEP_STAGES = ("denoising_step",)
+
+TIMINGS_INFO_KEY = "timings"
+
+
+class StageTimings:
+    """
+    Accumule la durée de chaque étape.
+
+    Exemple:
+        >>> timings = StageTimings()
+        >>> with timings.measure("scoring"):
+        ...     score = aesthetic_scorer.score(image)
+        >>> timings.to_dict()
+        {'scoring': 0.21}
+    """
+
+    def __init__(self, initial: Optional[Dict[str, float]] = None):
+        self.seconds: Dict[str, float] = dict(initial or {})
+
+    def add(self, stage: str, seconds: float) -> None:
+        """Ajoute une durée à une étape."""
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Mesure le bloc et l'ajoute à l'étape (même en cas d'exception)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def per_image(self, batch_size: int) -> "StageTimings":
+        """Part de chaque image d'un batch (denoising_step reste la durée d'un step)."""
+        return StageTimings({
+            stage: s if stage in PER_STEP_STAGES else s / batch_size
+            for stage, s in self.seconds.items()
+        })
+
+    def to_dict(self) -> Dict[str, float]:
+        """Durées dans l'ordre de STAGES (secondes)."""
+        return {stage: self.seconds[stage] for stage in STAGES if stage in self.seconds}
+
+
+def attach_timings(image: Image.Image, timings: StageTimings) -> None:
+    """Joint les temps à l'image (conservés par pickle, jamais écrits dans le PNG)."""
+    image.info[TIMINGS_INFO_KEY] = timings.to_dict()
+
+
+def image_timings(image: Image.Image) -> StageTimings:
+    """Temps joints par le générateur (vide pour une image d'une autre source)."""
+    return StageTimings(image.info.get(TIMINGS_INFO_KEY))
@@ -0,0 +1,432 @@
+"""
+Benchmark du chemin de génération, sans GPU ni réseau.
+
+POURQUOI ?
+----------
+Mesurer le débit de /generate demandait jusqu'ici de télécharger
+DreamShaper-8. Ce script remplace le pipeline du StableDiffusionGenerator
+par le pipeline miniature (app/models/tiny_pipeline.py): même chemin de
+code (cache CLIP, generate_batch, callbacks), mêmes tailles d'image.
+
+Les temps absolus ne représentent pas DreamShaper-8, mais leur ÉVOLUTION
+d'un commit à l'autre révèle les régressions du code autour du modèle.
+
+ÉTAPES MESURÉES (comme dans _run_generation de l'API):
+------------------------------------------------------
+- pipeline: generate_batch() (un appel par batch)
+- save:     image.save() en PNG
+- score:    aesthetic_scorer.score()
+- db:       ImageRepository.create() (SQLite temporaire)
+- total:    somme des étapes pour un batch
+
+Pour chaque combinaison steps x taille x batch x threads: p50/p95/moyenne
+(ms par appel) et images/s, écrits dans un fichier JSON comparable.
+
+Chaque combinaison peut aussi être mesurée dans plusieurs modes d'inférence
+(app/models/inference_modes.py): le rapport donne alors l'accélération de
+chaque mode par rapport au mode "default" (chemin historique).
+
+Usage:
+    python -m benchmarks.bench_generation --steps 4 8 --sizes 64 256 \\
+        --batch-sizes 1 4 --threads 1 2 --output bench.json
+
+    # Comparaison avec une exécution précédente (code retour 1 si régression)
+    python -m benchmarks.bench_generation --baseline bench.json --tolerance 0.15
+
+    # Mode optimisé (channels_last, SDPA, torch.compile) contre le mode historique
+    python -m benchmarks.bench_generation --modes default optimized --warmup 2
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+import torch
+import diffusers
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database.models import Base
+from app.database.repository import ImageRepository
+from app.models.aesthetic_scorer import aesthetic_scorer
+from app.models.inference_modes import INFERENCE_MODES
+from app.models.stable_diffusion import StableDiffusionGenerator
+from app.models.tiny_pipeline import build_tiny_pipeline
+from app.utils.timings import image_timings
+
+# Étapes mesurées, dans l'ordre du chemin de génération
+# (text_encoding, denoising et vae_decode détaillent "pipeline")
+PIPELINE_STAGES = ["text_encoding", "denoising", "vae_decode"]
+STAGES = ["pipeline"] + PIPELINE_STAGES + ["save", "score", "db", "total"]
+
+# Métrique comparée à la baseline
+REGRESSION_METRIC = "p50_ms"
+
+PROMPT = "a majestic cat on a throne, royal palace, cinematic lighting"
+NEGATIVE_PROMPT = "ugly, blurry, low quality"
+
+
+def summarize(latencies: List[float], images: int) -> Dict[str, float]:
+    """
+    Statistiques d'une étape.
+
+    Args:
+        latencies: Durée de chaque appel (secondes)
+        images: Nombre total d'images traitées par ces appels
+
+    Returns:
+        dict: p50_ms, p95_ms, mean_ms, images_per_sec, samples
+    """
+    values = np.asarray(latencies, dtype=np.float64)
+    total = float(values.sum())
+    return {
+        "p50_ms": float(np.percentile(values, 50)) * 1000.0,
+        "p95_ms": float(np.percentile(values, 95)) * 1000.0,
+        "mean_ms": float(values.mean()) * 1000.0,
+        "images_per_sec": images / total if total > 0 else 0.0,
+        "samples": len(latencies),
+    }
+
+
+def run_config(
+    generator: StableDiffusionGenerator,
+    db_session,
+    output_dir: Path,
+    steps: int,
+    size: int,
+    batch_size: int,
+    threads: int,
+    repeats: int,
+    warmup: int,
+) -> Dict:
+    """
+    Mesure une combinaison de paramètres (warmup exclu des statistiques).
+
+    En mode "optimized", le warmup absorbe aussi la compilation de la taille.
+    """
+    torch.set_num_threads(threads)
+    latencies = {stage: [] for stage in STAGES}
+
+    for run in range(warmup + repeats):
+        measured = run >= warmup
+        seeds = [run * batch_size + i for i in range(batch_size)]
+
+        start = time.perf_counter()
+        images = generator.generate_batch(
+            prompts=[PROMPT] * batch_size,
+            negative_prompts=[NEGATIVE_PROMPT] * batch_size,
+            seeds=seeds,
+            guidance_scale=7.5,
+            num_inference_steps=steps,
+            width=size,
+            height=size,
+        )
+        batch_time = time.perf_counter() - start
+        if measured:
+            latencies["pipeline"].append(batch_time)
+            # Temps joints par le générateur: part de chaque image du batch
+            timings = image_timings(images[0]).to_dict()
+            for stage in PIPELINE_STAGES:
+                latencies[stage].append(timings[stage] * batch_size)
+
+        for index, (image, seed) in enumerate(zip(images, seeds)):
+            image_path = output_dir / f"bench_{steps}_{size}_{batch_size}_{run}_{index}.png"
+
+            start = time.perf_counter()
+            image.save(image_path)
+            save_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            score = aesthetic_scorer.score(image)
+            score_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            ImageRepository.create(
+                db=db_session,
+                prompt=PROMPT,
+                image_path=str(image_path),
+                negative_prompt=NEGATIVE_PROMPT,
+                num_inference_steps=steps,
+                width=size,
+                height=size,
+                seed=seed,
+                score=score,
+                generation_time=batch_time,
+            )
+            db_time = time.perf_counter() - start
+
+            batch_time += save_time + score_time + db_time
+            if measured:
+                latencies["save"].append(save_time)
+                latencies["score"].append(score_time)
+                latencies["db"].append(db_time)
+        if measured:
+            latencies["total"].append(batch_time)
+
+    images = repeats * batch_size
+    return {
+        "config": {
+            "mode": generator.inference_mode,
+            "steps": steps,
+            "size": size,
+            "batch_size": batch_size,
+            "threads": threads,
+        },
+        "stages": {stage: summarize(values, images) for stage, values in latencies.items()},
+    }
+
+
+def environment() -> Dict:
+    """Métadonnées de l'exécution (pour comparer des runs comparables)."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent.parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "diffusers": diffusers.__version__,
+    }
+
+
+def run_benchmark(
+    steps: List[int],
+    sizes: List[int],
+    batch_sizes: List[int],
+    threads: List[int],
+    repeats: int = 5,
+    warmup: int = 1,
+    generator: Optional[StableDiffusionGenerator] = None,
+    modes: Optional[List[str]] = None,
+    configured_model: bool = False,
+) -> Dict:
+    """
+    Exécute toutes les combinaisons steps x tailles x batches x threads.
+
+    Args:
+        generator: Générateur à mesurer (par défaut: pipeline miniature)
+        modes: Modes d'inférence mesurés, un générateur par mode
+               (ignoré si generator est fourni; défaut: ["default"])
+        configured_model: Charger le modèle configuré au lieu du pipeline
+                          miniature pour chaque mode
+
+    Returns:
+        dict: {"environment": {...}, "pipeline": {...}, "results": [...]}
+    """
+    if generator is not None:
+        generators = [lambda: generator]
+    else:
+        generators = [
+            lambda mode=mode: _build_generator(mode, configured_model)
+            for mode in modes or ["default"]
+        ]
+    initial_threads = torch.get_num_threads()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        engine = create_engine(f"sqlite:///{tmp_dir / 'bench.db'}")
+        Base.metadata.create_all(bind=engine)
+        db_session = sessionmaker(bind=engine)()
+        try:
+            # Un mode à la fois: un seul pipeline en mémoire
+            for build in generators:
+                current = build()
+                for n_steps, size, batch_size, n_threads in product(steps, sizes, batch_sizes, threads):
+                    result = run_config(
+                        current, db_session, tmp_dir,
+                        n_steps, size, batch_size, n_threads, repeats, warmup,
+                    )
+                    results.append(result)
+                    print(f"INFO: {format_config(result['config'])}: " + ", ".join(
+                        f"{stage} p50={stats['p50_ms']:.1f}ms"
+                        for stage, stats in result["stages"].items()
+                    ))
+        finally:
+            db_session.close()
+            engine.dispose()
+            torch.set_num_threads(initial_threads)
+
+    return {
+        "environment": environment(),
+        "pipeline": {
+            "model_id": current.model_id,
+            "source": current.load_source,
+            "device": current.device,
+            "dtype": str(current.dtype).replace("torch.", ""),
+            "bf16_autocast": current.bf16_autocast,
+        },
+        "repeats": repeats,
+        "warmup": warmup,
+        "results": results,
+    }
+
+
+def _build_generator(mode: str, configured_model: bool) -> StableDiffusionGenerator:
+    """Générateur dans le mode demandé (pipeline miniature ou modèle configuré)."""
+    generator = StableDiffusionGenerator(inference_mode=mode)
+    if configured_model:
+        generator.load()
+    else:
+        generator.use_pipeline(build_tiny_pipeline(), source="tiny")
+    return generator
+
+
+def format_config(config: Dict) -> str:
+    """Libellé court d'une combinaison (ex: 'mode=default steps=4 size=64 batch=1 threads=2')."""
+    return (
+        f"mode={config.get('mode', 'default')} steps={config['steps']} size={config['size']} "
+        f"batch={config['batch_size']} threads={config['threads']}"
+    )
+
+
+def compare_modes(report: Dict, reference: str = "default") -> List[Dict]:
+    """
+    Accélération de chaque mode par rapport au mode de référence.
+
+    Returns:
+        list: {"config", "mode", "reference_ms", "current_ms", "speedup"}
+              (speedup > 1 = plus rapide que la référence, sur p50 total)
+    """
+    def key(config: Dict) -> str:
+        return json.dumps({k: v for k, v in config.items() if k != "mode"}, sort_keys=True)
+
+    references = {
+        key(r["config"]): r["stages"]["total"][REGRESSION_METRIC]
+        for r in report["results"] if r["config"].get("mode") == reference
+    }
+    speedups = []
+    for result in report["results"]:
+        mode = result["config"].get("mode")
+        base = references.get(key(result["config"]))
+        if mode == reference or not base:
+            continue
+        current = result["stages"]["total"][REGRESSION_METRIC]
+        speedups.append({
+            "config": result["config"],
+            "mode": mode,
+            "reference_ms": base,
+            "current_ms": current,
+            "speedup": base / current if current else 0.0,
+        })
+    return speedups
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float = 0.15) -> List[Dict]:
+    """
+    Compare deux exécutions, combinaison par combinaison et étape par étape.
+
+    Args:
+        tolerance: Ralentissement relatif toléré sur p50 (0.15 = +15%)
+
+    Returns:
+        list: Régressions {"config", "stage", "baseline_ms", "current_ms", "ratio"}
+    """
+    baseline_results = {
+        json.dumps(r["config"], sort_keys=True): r["stages"] for r in baseline.get("results", [])
+    }
+    regressions = []
+    for result in current["results"]:
+        base_stages = baseline_results.get(json.dumps(result["config"], sort_keys=True))
+        if base_stages is None:
+            continue
+        for stage, stats in result["stages"].items():
+            base = base_stages.get(stage, {}).get(REGRESSION_METRIC)
+            if not base:
+                continue
+            ratio = stats[REGRESSION_METRIC] / base
+            if ratio > 1.0 + tolerance:
+                regressions.append({
+                    "config": result["config"],
+                    "stage": stage,
+                    "baseline_ms": base,
+                    "current_ms": stats[REGRESSION_METRIC],
+                    "ratio": ratio,
+                })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark du chemin de génération avec le pipeline miniature"
+    )
+    parser.add_argument("--steps", type=int, nargs="+", default=[4, 8],
+                        help="Nombres de steps de débruitage (défaut: 4 8)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 256],
+                        help="Côtés d'image en pixels, multiples de 16 (défaut: 64 256)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4],
+                        help="Tailles de batch (défaut: 1 4)")
+    parser.add_argument("--threads", type=int, nargs="+", default=[torch.get_num_threads()],
+                        help="Valeurs de torch.set_num_threads (défaut: valeur courante)")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="Répétitions mesurées par combinaison (défaut: 5)")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="Répétitions de chauffe non mesurées (défaut: 1)")
+    parser.add_argument("--modes", type=str, nargs="+", default=["default"], choices=INFERENCE_MODES,
+                        help="Modes d'inférence mesurés (défaut: default); "
+                             "avec plusieurs modes, accélération par rapport à default")
+    parser.add_argument("--configured-model", action="store_true",
+                        help="Mesurer le modèle configuré (SD_MODEL_ID, snapshot...) "
+                             "au lieu du pipeline miniature")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Fichier JSON de résultats "
+                             "(défaut: benchmarks/results/generation_<date>.json)")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Résultats JSON d'une exécution précédente à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Ralentissement p50 toléré avant régression (défaut: 0.15)")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        steps=args.steps,
+        sizes=args.sizes,
+        batch_sizes=args.batch_sizes,
+        threads=args.threads,
+        repeats=args.repeats,
+        warmup=args.warmup,
+        modes=args.modes,
+        configured_model=args.configured_model,
+    )
+
+    output = Path(args.output or (
+        f"benchmarks/results/generation_{datetime.now():%Y%m%d_%H%M%S}.json"
+    ))
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"OK: Resultats ecrits dans {output}")
+
+    for s in compare_modes(report):
+        print(
+            f"INFO: {format_config(s['config'])}: total p50 {s['reference_ms']:.1f}ms (default) "
+            f"-> {s['current_ms']:.1f}ms (x{s['speedup']:.2f})"
+        )
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(report, baseline, args.tolerance)
+        for r in regressions:
+            print(
+                f"WARNING: Regression {format_config(r['config'])} [{r['stage']}]: "
+                f"{r['baseline_ms']:.1f}ms -> {r['current_ms']:.1f}ms (x{r['ratio']:.2f})"
+            )
+        if regressions:
+            raise SystemExit(1)
+        print(f"OK: Aucune regression par rapport a {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,18 @@ Usage: python run_gradio.py
 """
 from app.gradio_ui import demo
 from app.database.database import init_db
+from app.models.warmup import warmup_state
+from app.utils.config import settings
 
 if __name__ == "__main__":
     # Initialiser la base de données
     init_db()
     
+    # Préchauffage (SD_WARMUP_ENABLED): aucune requête sur un modèle froid
+    if settings.SD_WARMUP_ENABLED:
+        print("Prechauffage du modele...")
+        warmup_state.run()
+    
     print("Lancement de l'interface Gradio...")
     print("L'interface sera accessible sur: http://localhost:7860")
     print("Base de donnees SQLite initialisee")
@@ -0,0 +1,87 @@
+"""
+Tests du modèle de coût et du budget mémoire des générations.
+"""
+import threading
+import time
+import pytest
+from app.models.admission import AdmissionController, AdmissionRejected, CostModel
+from app.utils.cancellation import CancellationToken, GenerationCancelled
+
+def test_cost_model_fit_and_estimate():
+    """Le modèle calibré retrouve des coûts générés par des coefficients connus."""
+    truth = CostModel({"base_bytes": 100e6, "pixel_bytes": 50e3, "attention_bytes": 8.0,
+                       "decode_seconds": 1e-4, "step_seconds": 2e-5, "step_attention_seconds": 1e-9})
+    samples = []
+    for size in (128, 256, 384, 512):
+        for batch_size in (1, 2):
+            for steps in (2, 4):
+                estimate = truth.estimate(size, size, steps, batch_size)
+                samples.append({"width": size, "height": size, "steps": steps, "batch_size": batch_size,
+                                "peak_bytes": estimate.peak_bytes, "seconds": estimate.seconds})
+
+    fitted = CostModel.fit(samples)
+    expected = truth.estimate(1024, 1024, 30)
+    estimate = fitted.estimate(1024, 1024, 30)
+    assert estimate.peak_bytes == pytest.approx(expected.peak_bytes, rel=1e-3)
+    assert estimate.seconds == pytest.approx(expected.seconds, rel=1e-3)
+
+    # Mémoire: quadratique en pixels latents, linéaire en batch, divisée par deux en float16
+    small, large = fitted.estimate(512, 512, 30), fitted.estimate(1024, 1024, 30)
+    assert large.peak_bytes > 4 * small.peak_bytes
+    assert CostModel(fitted.coefficients, dtype="float16").estimate(512, 512, 30).peak_bytes == small.peak_bytes // 2
+
+def test_controller_rejects_and_serializes_by_budget():
+    """413 si jamais dans le budget, 429 si la file déborde, sinon attente FIFO du budget."""
+    model = CostModel({"base_bytes": 0, "pixel_bytes": 100, "attention_bytes": 0})
+    controller = AdmissionController(model, budget_bytes=100 * 4096 * 3, max_queued_seconds=60)
+    small = controller.estimate(512, 512, 10)            # 1/3 du budget
+    large = controller.estimate(512, 512, 10, batch_size=2)
+
+    with pytest.raises(AdmissionRejected) as too_large:
+        controller.check(controller.estimate(1024, 1024, 10))
+    assert too_large.value.status_code == 413
+
+    with pytest.raises(AdmissionRejected) as overloaded:
+        controller.check(small, queued_seconds=120, workers=2)
+    assert overloaded.value.status_code == 429
+    assert overloaded.value.retry_after == 60
+    controller.check(small, queued_seconds=10)
+
+    # small + large remplissent le budget: une seconde "large" attend
+    order = []
+    with controller.reserve(small), controller.reserve(large):
+        def waiting():
+            with controller.reserve(large):
+                order.append("admitted")
+        thread = threading.Thread(target=waiting)
+        thread.start()
+        time.sleep(0.1)
+        assert controller.stats()["waiting"] == 1
+        order.append("released")
+    thread.join(5)
+    assert order == ["released", "admitted"]
+    assert controller.stats()["in_use_mb"] == 0
+
+    # Annulation pendant l'attente
+    token = CancellationToken()
+    with controller.reserve(large), controller.reserve(small):
+        threading.Timer(0.05, token.cancel).start()
+        with pytest.raises(GenerationCancelled):
+            with controller.reserve(large, token):
+                pass
+    assert controller.stats()["waiting"] == 0
+
+def test_auto_budget_counts_pool_worker_weights(monkeypatch):
+    """Pool d'inférence: le budget auto retire une copie estimée des poids par worker."""
+    from app.models import admission
+    from app.models.stable_diffusion import sd_generator
+    from app.utils.config import settings
+    monkeypatch.setattr(settings, "SD_POOL_WORKERS", 3)
+    monkeypatch.setattr(settings, "SD_MEMORY_BUDGET_MB", None)
+    monkeypatch.setattr(admission, "_admission_controller", None)
+    controller = admission.get_admission_controller()
+    dtype = str(sd_generator.dtype).replace("torch.", "")
+    total = admission.total_memory_bytes(controller.device)
+    expected = max(0, int(total * admission.AUTO_BUDGET_FRACTION) - admission.pool_weights_bytes(3, dtype))
+    assert sd_generator.weights_bytes() == 0 and controller.budget_bytes == expected
+    assert admission.pool_weights_bytes(3, "float16") == 3 * admission.SD_WEIGHT_PARAMS * 2
@@ -0,0 +1,53 @@
+"""
+Tests pour le front-end de micro-batching.
+"""
+import threading
+from PIL import Image
+from app.models.batching import BatchingGenerator
+
+class FakeGenerator:
+    """Générateur factice: enregistre les batches reçus."""
+    
+    def __init__(self):
+        self.batches = []
+    
+    def generate_batch(self, prompts, negative_prompts, seeds, guidance_scale,
+                       num_inference_steps, width, height, step_callbacks=None,
+                       preview_every=0, cancel_tokens=None, scheduler=None):
+        self.batches.append(list(prompts))
+        return [Image.new("RGB", (width, height), color=(len(p), 0, 0)) for p in prompts]
+
+def _generate_concurrently(batcher, requests):
+    results = {}
+    
+    def worker(prompt, width):
+        results[prompt] = batcher.generate(prompt=prompt, width=width, height=64)
+    
+    threads = [threading.Thread(target=worker, args=r) for r in requests]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+def test_compatible_requests_share_a_batch():
+    """Les requêtes compatibles concurrentes sont regroupées."""
+    fake = FakeGenerator()
+    batcher = BatchingGenerator(fake, max_batch_size=3, window_ms=2000)
+    
+    results = _generate_concurrently(batcher, [("a", 64), ("bb", 64), ("ccc", 64)])
+    
+    assert len(fake.batches) == 1
+    assert sorted(fake.batches[0]) == ["a", "bb", "ccc"]
+    # Chaque appelant reçoit sa propre image
+    assert results["bb"].getpixel((0, 0))[0] == 2
+
+def test_incompatible_requests_are_not_batched():
+    """Des dimensions différentes donnent des batches séparés."""
+    fake = FakeGenerator()
+    batcher = BatchingGenerator(fake, max_batch_size=4, window_ms=20)
+    
+    results = _generate_concurrently(batcher, [("a", 64), ("b", 128)])
+    
+    assert len(fake.batches) == 2
+    assert results["b"].size == (128, 64)
@@ -0,0 +1,37 @@
+"""
+Tests du pipeline miniature et du harnais de benchmark.
+"""
+from app.models.stable_diffusion import StableDiffusionGenerator
+from app.models.tiny_pipeline import TINY_MODEL_ID, build_tiny_pipeline
+from benchmarks.bench_generation import STAGES, compare, run_benchmark
+
+def test_tiny_pipeline_generates_reproducible_images():
+    """Le générateur tourne sur le pipeline miniature, même seed = même image."""
+    generator = StableDiffusionGenerator()
+    generator.use_pipeline(build_tiny_pipeline())
+    assert generator.get_status()["state"] == "ready"
+    assert generator.cache_identity()["model_id"] == TINY_MODEL_ID
+
+    first = generator.generate("a red cat", num_inference_steps=2, width=64, height=96, seed=7)
+    second = generator.generate("a red cat", num_inference_steps=2, width=64, height=96, seed=7)
+    assert first.size == (64, 96)
+    assert first.tobytes() == second.tobytes()
+
+def test_benchmark_report_and_regression_check():
+    """Une combinaison mesurée: toutes les étapes, comparables à une baseline."""
+    report = run_benchmark(steps=[2], sizes=[64], batch_sizes=[2], threads=[1], repeats=2, warmup=0)
+    assert report["pipeline"]["model_id"] == TINY_MODEL_ID
+    [result] = report["results"]
+    assert result["config"] == {"mode": "default", "steps": 2, "size": 64, "batch_size": 2, "threads": 1}
+    assert set(result["stages"]) == set(STAGES)
+    assert result["stages"]["pipeline"]["samples"] == 2
+    assert result["stages"]["save"]["samples"] == 4
+    assert result["stages"]["total"]["images_per_sec"] > 0
+
+    assert compare(report, report) == []
+    faster = {"results": [{
+        "config": result["config"],
+        "stages": {"pipeline": {"p50_ms": result["stages"]["pipeline"]["p50_ms"] / 2}},
+    }]}
+    [regression] = compare(report, faster, tolerance=0.15)
+    assert regression["stage"] == "pipeline"
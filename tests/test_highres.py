@@ -0,0 +1,49 @@
+"""
+Tests de la génération haute résolution à mémoire bornée.
+"""
+import numpy as np
+from app.models.admission import CostModel
+from app.models.highres import ChunkedAttnProcessor
+from app.models.stable_diffusion import StableDiffusionGenerator
+from app.models.tiny_pipeline import build_tiny_pipeline
+from app.utils.config import settings
+
+def _generate(generator, **kwargs):
+    image = generator.generate("a wide banner", num_inference_steps=2, seed=5, **kwargs)
+    return np.asarray(image, dtype=np.int16)
+
+def test_chunked_attention_and_tiled_decode(monkeypatch):
+    """Attention par blocs: même image; décodage par tuiles: mêmes dimensions, écart faible."""
+    monkeypatch.setattr(settings, "SD_VAE_TILING_PIXELS", None)
+    monkeypatch.setattr(settings, "SD_ATTENTION_MAX_MB", None)
+    reference = StableDiffusionGenerator()
+    reference.use_pipeline(build_tiny_pipeline())
+    expected = _generate(reference, width=128, height=64)
+
+    # 1 Ko = 256 éléments float32: la self-attention (128 x 128) est découpée
+    monkeypatch.setattr(settings, "SD_ATTENTION_MAX_MB", 1 / 1024)
+    chunked = StableDiffusionGenerator()
+    chunked.use_pipeline(build_tiny_pipeline())
+    assert chunked.attention_chunking
+    assert all(isinstance(p, ChunkedAttnProcessor) for p in chunked.pipe.unet.attn_processors.values())
+    assert np.abs(_generate(chunked, width=128, height=64) - expected).max() <= 1
+
+    calls = []
+    tiled_decode = chunked.pipe.vae.tiled_decode
+    monkeypatch.setattr(chunked.pipe.vae, "tiled_decode", lambda *a, **k: calls.append(1) or tiled_decode(*a, **k))
+    monkeypatch.setattr(settings, "SD_VAE_TILING_PIXELS", 64 * 64)
+    assert _generate(chunked, width=64, height=64).shape == (64, 64, 3)
+    assert calls == []
+    tiled = _generate(chunked, width=128, height=64)
+    assert tiled.shape == expected.shape
+    assert len(calls) == 1
+    assert np.abs(tiled - expected).mean() < 8
+
+def test_cost_model_caps_attention_memory():
+    """Avec l'attention découpée, la mémoire crête n'est plus quadratique."""
+    uncapped = CostModel.default()
+    capped = CostModel.default()
+    capped.attention_cap = 4096 ** 2
+    assert capped.estimate(512, 512, 30).peak_bytes == uncapped.estimate(512, 512, 30).peak_bytes
+    assert capped.estimate(1024, 1024, 30).peak_bytes < uncapped.estimate(1024, 1024, 30).peak_bytes / 2
+    assert capped.estimate(1024, 1024, 30).seconds == uncapped.estimate(1024, 1024, 30).seconds
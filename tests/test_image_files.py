@@ -0,0 +1,53 @@
+"""
+Tests de l'endpoint de fichiers images (ETag, 304, Range).
+"""
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.api import routes
+from app.database.database import get_db
+from app.database.models import Base
+from app.database.repository import ImageRepository
+from app.main import app
+
+def test_image_file_etag_304_and_range(tmp_path, monkeypatch):
+    """ETag = empreinte, immutable; 304 si inchangé; Range / If-Range → 206, 416 ou fichier entier."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)
+    monkeypatch.setattr(routes.image_store, "root", tmp_path)
+    write = routes.image_store.put(Image.effect_noise((32, 32), 30).convert("RGB"), "webp")
+    write.wait()
+    db_image = ImageRepository.create(db=session(), prompt="a cat", image_path=str(write.path))
+    app.dependency_overrides[get_db] = lambda: session()
+    try:
+        client = TestClient(app)
+        response = client.get(db_image.file_url)
+        assert response.status_code == 200
+        assert response.content == write.path.read_bytes()
+        assert response.headers["content-type"] == "image/webp"
+        assert response.headers["etag"] == f'"{write.path.stem}"'
+        assert "immutable" in response.headers["cache-control"]
+
+        cached = client.get(db_image.file_url, headers={"If-None-Match": f'W/"other", {response.headers["etag"]}'})
+        assert cached.status_code == 304 and cached.content == b""
+
+        partial = client.get(db_image.file_url, headers={"Range": "bytes=0-9"})
+        assert partial.status_code == 206 and partial.content == response.content[:10]
+        assert partial.headers["content-range"] == f"bytes 0-9/{len(response.content)}"
+        size = len(response.content)
+        suffix = client.get(db_image.file_url, headers={"Range": "bytes=-5", "If-Range": response.headers["etag"]})
+        assert suffix.status_code == 206 and suffix.content == response.content[-5:]
+        assert suffix.headers["content-range"] == f"bytes {size - 5}-{size - 1}/{size}"
+        # If-Range périmé: fichier entier; plage hors du fichier: 416
+        stale = client.get(db_image.file_url, headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+        assert stale.status_code == 200 and stale.content == response.content
+        unsatisfiable = client.get(db_image.file_url, headers={"Range": f"bytes={size}-"})
+        assert unsatisfiable.status_code == 416 and unsatisfiable.headers["content-range"] == f"bytes */{size}"
+        assert routes._byte_range("bytes=0-9,20-29", size) is None and routes._byte_range("items=0-9", size) is None
+
+        assert client.head(db_image.file_url).headers["content-length"] == str(len(response.content))
+        assert client.get("/api/v1/images/999/file").status_code == 404
+    finally:
+        app.dependency_overrides.pop(get_db)
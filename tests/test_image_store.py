@@ -0,0 +1,77 @@
+"""
+Tests du stockage des images adressé par contenu.
+"""
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database.models import Base
+from app.database.repository import ImageRepository
+from app.utils.image_store import ImageStore, image_store, migrate_existing_images
+from app.utils.image_writer import image_writer
+
+def test_put_shards_and_deduplicates(tmp_path):
+    """Même image → même fichier (sous-dossiers ab/cd/); autre qualité → autre fichier."""
+    store = ImageStore(tmp_path)
+    image = Image.effect_noise((32, 32), 30).convert("RGB")
+    first = store.put(image.copy(), "png")
+    first.wait()
+    digest = first.path.stem
+    assert first.path == tmp_path / digest[:2] / digest[2:4] / f"{digest}.png"
+    assert store.digest_of(first.path) == digest and store.get(digest) == first.path
+
+    again = store.put(image.copy(), "png")
+    assert again.path == first.path and again.result["seconds"] == 0.0
+    assert store.put(image.copy(), "webp", quality=50).path != store.put(image.copy(), "webp", quality=90).path
+    assert store.stat(first.path)["file_size"] == first.result["file_size"]
+
+    assert store.delete(first.path) and store.stat(first.path) is None
+    assert not (tmp_path / digest[:2]).exists()  # Sous-dossiers vides supprimés
+
+def test_migration_moves_legacy_files_and_shared_file_deletion(tmp_path):
+    """Fichiers horodatés déplacés dans le stockage; fichier partagé supprimé avec sa dernière ligne."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    store = ImageStore(tmp_path / "portfolio")
+    image = Image.new("RGB", (16, 16), "red")
+    for name in ("generated_1_a.png", "generated_2_b.png"):
+        image.save(tmp_path / name)
+        ImageRepository.create(db=db, prompt="a cat", image_path=str(tmp_path / name))
+    ImageRepository.create(db=db, prompt="a cat", image_path=str(tmp_path / "deleted.png"))
+
+    counts = migrate_existing_images(db, store)
+    assert counts == {"migrated": 1, "deduplicated": 1, "skipped": 0, "missing": 1, "unsupported": 0}
+    first, second = (ImageRepository.get_by_id(db, image_id) for image_id in (1, 2))
+    assert first.image_path == second.image_path and store.digest_of(first.image_path)
+    assert not (tmp_path / "generated_1_a.png").exists()
+    assert migrate_existing_images(db, store)["skipped"] == 2
+
+    ImageRepository.delete(db, first.id)
+    assert store.stat(second.image_path) is not None
+    ImageRepository.delete(db, second.id)
+    assert store.stat(second.image_path) is None
+
+def test_deletion_keeps_file_reused_by_pending_put(tmp_path, monkeypatch):
+    """Fichier réutilisé par un put() dont la ligne n'est pas encore insérée: conservé à la suppression."""
+    monkeypatch.setattr(image_store, "root", tmp_path)
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    image = Image.effect_noise((32, 32), 30).convert("RGB")
+    write = image_store.put(image.copy(), "png")
+    write.wait()
+    first = ImageRepository.create(db=db, prompt="a cat", image_path=str(write.path))
+    image_store.release(write.path)
+
+    # Déduplication: même fichier, déjà écrit, réservé jusqu'à release()
+    again, submitted = image_writer.submit_missing(image.copy(), write.path, "png")
+    assert again.done and not submitted
+    reused = image_store.put(image.copy(), "png")
+    assert reused.path == write.path and image_store.is_reserved(write.path)
+    ImageRepository.delete(db, first.id)
+    assert write.path.is_file()
+
+    second = ImageRepository.create(db=db, prompt="a cat", image_path=str(reused.path))
+    image_store.release(reused.path)
+    ImageRepository.delete(db, second.id)
+    assert not write.path.exists() and not image_store.is_reserved(write.path)
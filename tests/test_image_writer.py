@@ -0,0 +1,98 @@
+"""
+Tests de l'écriture des images en arrière-plan.
+"""
+import threading
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.api import routes
+from app.api.schemas import GenerateRequest
+from app.database.models import Base, GeneratedImage
+from app.models.stable_diffusion import StableDiffusionGenerator
+from app.models.tiny_pipeline import build_tiny_pipeline
+from app.utils import image_writer as image_writer_module
+from app.utils.image_writer import IMAGE_FORMATS, ImageWriter, PendingWrite, resolve_image_format
+from app.utils.job_queue import JobQueue, JobStatus
+
+def test_formats_written_atomically_with_file_size(tmp_path):
+    """Chaque format relu à l'identique (sans perte) ou à la bonne taille; aucun fichier temporaire."""
+    image = Image.merge("RGB", [Image.effect_noise((128, 128), sigma) for sigma in (20, 40, 60)])
+    writer = ImageWriter(max_workers=2)
+    # Une copie par écriture: Pillow n'écrit pas le même objet depuis deux threads
+    writes = {
+        name: writer.submit(image.copy(), tmp_path / f"image.{name}", name, quality=80)
+        for name in IMAGE_FORMATS
+    }
+    writer.flush()
+
+    for name, write in writes.items():
+        assert write.done and write.error is None
+        assert write.result["file_size"] == write.path.stat().st_size > 0
+        reloaded = Image.open(write.path)
+        assert reloaded.format == IMAGE_FORMATS[name][0] and reloaded.size == image.size
+        if name in ("png", "webp_lossless"):
+            assert reloaded.convert("RGB").tobytes() == image.tobytes()
+    assert writes["webp"].result["file_size"] < writes["png"].result["file_size"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(f"image.{name}" for name in IMAGE_FORMATS)
+
+    with pytest.raises(ValueError):
+        resolve_image_format("gif")
+
+def test_wait_returns_after_callbacks(tmp_path, monkeypatch):
+    """submit rend la main avant l'écriture; wait(path) attend l'écriture et ses callbacks."""
+    release = threading.Event()
+    save = Image.Image.save
+    monkeypatch.setattr(Image.Image, "save", lambda self, *a, **kw: release.wait() and save(self, *a, **kw))
+    writer = ImageWriter(max_workers=1)
+    path = tmp_path / "image.png"
+    write = writer.submit(Image.new("RGB", (8, 8)), path)
+    sizes = []
+    write.add_done_callback(lambda w: sizes.append(w.result["file_size"]))
+    assert not write.done and not path.exists() and writer.pending() == 1
+
+    release.set()
+    assert writer.wait(path)["file_size"] == sizes[0] == path.stat().st_size
+    # Écriture terminée: le callback s'exécute immédiatement
+    write.add_done_callback(lambda w: sizes.append(w.result["file_size"]))
+    assert len(sizes) == 2 and writer.wait(path) is None
+
+def test_finished_write_keeps_newer_write_of_same_path(tmp_path):
+    """La fin d'une écriture ne retire pas de l'attente une écriture plus récente du même fichier."""
+    writer = ImageWriter(max_workers=0)
+    path = tmp_path / "image.png"
+    older, newer = PendingWrite(path, "png"), PendingWrite(path, "png")
+    writer._pending[str(path)] = newer
+    writer._write(older, Image.new("RGB", (8, 8)), None)
+    assert older.done and writer.pending_write(path) is newer and writer.pending() == 1
+
+def test_failed_write_fails_job_and_drops_row(tmp_path, monkeypatch):
+    """Écriture en échec: callbacks d'échec, job FAILED et entrée de l'historique supprimée."""
+    def write_image(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(image_writer_module, "write_image", write_image)
+    write = ImageWriter(max_workers=0).submit(Image.new("RGB", (8, 8)), tmp_path / "image.png")
+    errors = []
+    write.add_failure_callback(lambda w: errors.append(w.error))
+    write.add_done_callback(lambda w: errors.append("done"))
+    assert write.done and write.result is None and errors == ["No space left on device"]
+
+    generator = StableDiffusionGenerator()
+    generator.use_pipeline(build_tiny_pipeline())
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)
+    queue = JobQueue(handler=routes._run_generation)
+    monkeypatch.setattr(routes, "generation_queue", queue)
+    monkeypatch.setattr(routes, "get_generator", lambda: generator)
+    monkeypatch.setattr(routes, "SessionLocal", session)
+    monkeypatch.setattr(routes.image_store, "root", tmp_path / "images")
+    try:
+        job = queue.submit(GenerateRequest(prompt="a cat", num_inference_steps=2, width=64, height=64))
+        queue.wait(job.id, timeout=30)
+        routes.image_writer.flush()
+        assert job.status == JobStatus.FAILED and "No space left on device" in job.error
+        assert session().query(GeneratedImage).count() == 0
+    finally:
+        queue.stop(timeout=1)
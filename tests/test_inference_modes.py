@@ -0,0 +1,42 @@
+"""
+Tests du mode d'inférence optimisé (sans compilation: trop lente pour la CI).
+"""
+import torch
+from diffusers.models.attention_processor import AttnProcessor2_0
+from app.models.stable_diffusion import StableDiffusionGenerator
+from app.models.tiny_pipeline import build_tiny_pipeline
+from app.utils.config import settings
+from benchmarks.bench_generation import compare_modes
+
+def test_optimized_mode_generates_with_channels_last_and_sdpa(monkeypatch):
+    """channels_last + SDPA à la place du slicing, même taille d'image que le mode default."""
+    monkeypatch.setattr(settings, "SD_TORCH_COMPILE", False)
+    generator = StableDiffusionGenerator(inference_mode="optimized")
+    generator.use_pipeline(build_tiny_pipeline())
+
+    conv = generator.pipe.unet.conv_in.weight
+    assert conv.is_contiguous(memory_format=torch.channels_last)
+    processors = generator.pipe.unet.attn_processors.values()
+    # Éventuellement enveloppés par le découpage haute résolution
+    assert all(isinstance(getattr(p, "processor", p), AttnProcessor2_0) for p in processors)
+
+    status = generator.get_status()
+    assert status["inference_mode"] == "optimized" and status["compiled"] is False
+    assert ("autocast" in generator.cache_identity()) == generator.bf16_autocast
+
+    image = generator.generate("a cat", num_inference_steps=2, width=64, height=64, seed=3)
+    assert image.size == (64, 64)
+
+    # Mode inconnu: repli sur le comportement historique
+    assert StableDiffusionGenerator(inference_mode="turbo").inference_mode == "default"
+
+def test_compare_modes_reports_speedup_against_default():
+    """Accélération calculée combinaison par combinaison (mode exclu de la clé)."""
+    def result(mode, p50):
+        config = {"mode": mode, "steps": 2, "size": 64, "batch_size": 1, "threads": 1}
+        return {"config": config, "stages": {"total": {"p50_ms": p50}}}
+
+    report = {"results": [result("default", 100.0), result("optimized", 40.0)]}
+    [speedup] = compare_modes(report)
+    assert speedup["mode"] == "optimized"
+    assert speedup["speedup"] == 2.5
@@ -0,0 +1,27 @@
+"""Tests du partitionnement des cœurs du pool d'inférence"""
+import os
+from app.models.inference_pool import partition_cores
+
+
+def _available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def test_partition_cores_disjoint():
+    """Les workers reçoivent des ensembles de cœurs disjoints quand c'est possible"""
+    cores = _available_cores()
+    num_workers = max(1, len(cores) // 2)
+    partitions = partition_cores(num_workers)
+
+    assert len(partitions) == num_workers
+    flat = [c for part in partitions for c in part]
+    assert len(flat) == len(set(flat))
+    assert set(flat) <= set(cores)
+
+
+def test_partition_cores_threads_per_worker():
+    """threads_per_worker fixe la taille de chaque partition"""
+    partitions = partition_cores(3, threads_per_worker=2)
+    assert [len(p) for p in partitions] == [2, 2, 2]
@@ -0,0 +1,138 @@
+"""
+Tests pour la file de jobs de génération.
+"""
+import threading
+import time
+import pytest
+from app.utils.job_queue import JobQueue, JobStatus, QueueFullError, UserQueueFullError, current_job
+
+def test_job_completes():
+    """Le résultat du handler devient le résultat du job."""
+    queue = JobQueue(handler=lambda payload: payload * 2)
+    job = queue.submit(21)
+    queue.wait(job.id, timeout=5)
+    
+    assert job.status == JobStatus.COMPLETED
+    assert job.result == 42
+    queue.stop(timeout=1)
+
+def test_job_failure():
+    """Une exception du handler passe le job en FAILED."""
+    def handler(payload):
+        raise ValueError("boom")
+    
+    queue = JobQueue(handler=handler)
+    job = queue.submit(None)
+    queue.wait(job.id, timeout=5)
+    
+    assert job.status == JobStatus.FAILED
+    assert job.error == "boom"
+    queue.stop(timeout=1)
+
+def test_queue_position_and_limit():
+    """Les jobs en attente ont une position, la file est bornée."""
+    release = threading.Event()
+    queue = JobQueue(handler=lambda payload: release.wait(5), max_queue_size=2)
+    
+    running = queue.submit("a")
+    while running.status != JobStatus.RUNNING:
+        pass
+    second = queue.submit("b")
+    third = queue.submit("c")
+    
+    assert queue.position(running.id) is None
+    assert queue.position(second.id) == 1
+    assert queue.position(third.id) == 2
+    assert queue.stats()["queued"] == 2
+    with pytest.raises(QueueFullError):
+        queue.submit("d")
+    
+    release.set()
+    queue.wait(third.id, timeout=5)
+    assert third.status == JobStatus.COMPLETED
+    queue.stop(timeout=1)
+
+def test_cancel_queued_and_running_jobs():
+    """Un job en file est retiré, un job en cours s'interrompt via son token."""
+    started = threading.Event()
+    
+    def handler(payload):
+        job = current_job()
+        started.set()
+        # Handler coopératif: s'arrête dès que son token est annulé
+        while not job.cancel_token.is_cancelled:
+            time.sleep(0.01)
+        job.cancel_token.raise_if_cancelled()
+    
+    queue = JobQueue(handler=handler)
+    running = queue.submit("a")
+    started.wait(5)
+    queued = queue.submit("b")
+    
+    queue.cancel(queued.id)
+    assert queued.status == JobStatus.CANCELLED
+    assert queue.position(queued.id) is None
+    
+    queue.cancel(running.id, reason="client parti")
+    queue.wait(running.id, timeout=5)
+    assert running.status == JobStatus.CANCELLED
+    assert running.error == "client parti"
+    assert queue.stats()["cancelled"] == 2
+    queue.stop(timeout=1)
+
+def test_fair_share_between_users_and_priority_classes():
+    """Un flot de jobs d'un utilisateur n'affame pas les autres; interactive passe avant batch."""
+    release = threading.Event()
+    order = []
+    
+    def handler(payload):
+        release.wait(5)
+        order.append(payload)
+    
+    queue = JobQueue(handler=handler, user_weights={"vip": 2.0}, max_queued_per_user=4)
+    blocker = queue.submit("blocker")
+    while blocker.status != JobStatus.RUNNING:
+        time.sleep(0.001)
+    
+    flood = [queue.submit(f"flood-{i}", cost=10, user_id="flooder") for i in range(4)]
+    with pytest.raises(UserQueueFullError):
+        queue.submit("flood-4", cost=10, user_id="flooder")
+    queue.submit("alice-0", cost=10, user_id="alice")
+    queue.submit("vip-0", cost=10, user_id="vip")
+    queue.submit("vip-1", cost=10, user_id="vip")
+    draft = queue.submit("draft", cost=1, user_id="bob", priority="interactive")
+    
+    assert queue.position(draft.id) == 1
+    assert queue.position(flood[-1].id) == 8
+    users = queue.stats()["users"]
+    assert users["flooder"]["queued"] == 4 and users["vip"]["weight"] == 2.0
+    
+    release.set()
+    queue.wait(flood[-1].id, timeout=5)
+    # Poids 2: vip passe deux jobs pendant que alice et flooder en passent un
+    assert order == ["blocker", "draft", "vip-0", "flood-0", "alice-0", "vip-1",
+                     "flood-1", "flood-2", "flood-3"]
+    assert queue.stats()["users"]["flooder"]["max_wait"] > 0
+    queue.stop(timeout=1)
+
+def test_reserved_interactive_worker():
+    """Un worker réservé sert un job interactif pendant que le worker batch est occupé."""
+    release = threading.Event()
+    queue = JobQueue(handler=lambda payload: payload == "draft" or release.wait(5),
+                     num_workers=1, interactive_workers=1)
+    batch = [queue.submit(f"batch-{i}") for i in range(3)]
+    while batch[0].status != JobStatus.RUNNING:
+        time.sleep(0.001)
+    
+    draft = queue.submit("draft", priority="interactive")
+    queue.wait(draft.id, timeout=5)
+    assert draft.status == JobStatus.COMPLETED
+    # Le worker réservé ne prend jamais de job batch
+    assert [job.status for job in batch[1:]] == [JobStatus.QUEUED] * 2
+    with pytest.raises(ValueError):
+        queue.submit("x", priority="urgent")
+    
+    release.set()
+    queue.wait(batch[-1].id, timeout=5)
+    assert batch[-1].status == JobStatus.COMPLETED
+    queue.stop(timeout=1)
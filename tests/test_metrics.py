@@ -0,0 +1,77 @@
+"""
+Tests des métriques Prometheus (registre et instrumentation).
+"""
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.main import app
+from app.models.aesthetic_scorer import aesthetic_scorer
+from app.models.stable_diffusion import StableDiffusionGenerator
+from app.models.tiny_pipeline import build_tiny_pipeline
+from app.utils.cancellation import CancellationToken, GenerationCancelled
+from app.utils.metrics import Counter, Gauge, Histogram, MetricsRegistry, REGISTRY
+
+def sample(name: str, labels: str = "") -> float:
+    """Valeur d'un échantillon du registre global (0 si absent)."""
+    for line in REGISTRY.render().splitlines():
+        if line.startswith(f"{name}{labels} "):
+            return float(line.split()[-1])
+    return 0.0
+
+def test_registry_text_format():
+    """Suffixe _total, labels échappés, buckets cumulés jusqu'à +Inf."""
+    registry = MetricsRegistry()
+    requests = Counter("requests", "Requetes", ["route"], registry=registry)
+    latency = Histogram("latency_seconds", "Latence", buckets=(0.1, 1.0), registry=registry)
+    rss = Gauge("rss_bytes", "Memoire", registry=registry)
+    rss.set_function(lambda: 42)
+
+    requests.labels(route='/a"b').inc()
+    requests.labels(route='/a"b').inc(2)
+    for value in (0.05, 0.5, 0.1, 3.0):
+        latency.observe(value)
+    with pytest.raises(ValueError):
+        requests.labels(path="/a")
+    with pytest.raises(ValueError):
+        requests.labels(route="/a").inc(-1)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{route="/a\\"b"} 3.0' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 2.0' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 3.0' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4.0' in lines
+    assert "latency_seconds_count 4.0" in lines
+    assert "rss_bytes 42.0" in lines
+
+def test_components_report_to_metrics_endpoint():
+    """Générateur, scorer et requêtes HTTP alimentent GET /metrics."""
+    generator = StableDiffusionGenerator()
+    generator.use_pipeline(build_tiny_pipeline())
+    completed = sample("sd_generations_total", '{outcome="completed"}')
+    cancelled = sample("sd_generations_total", '{outcome="cancelled"}')
+    images = sample("sd_images_generated_total")
+    scored = sample("aesthetic_scoring_duration_seconds_count")
+
+    generator.generate_batch(prompts=["a cat"] * 2, num_inference_steps=2, width=64, height=64)
+    token = CancellationToken()
+    token.cancel()
+    with pytest.raises(GenerationCancelled):
+        generator.generate("a cat", num_inference_steps=2, width=64, height=64, cancel_token=token)
+    aesthetic_scorer.score(Image.new("RGB", (64, 64)))
+
+    client = TestClient(app)
+    client.get("/api/v1/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert sample("sd_generations_total", '{outcome="completed"}') == completed + 1
+    assert sample("sd_generations_total", '{outcome="cancelled"}') == cancelled + 1
+    assert sample("sd_images_generated_total") == images + 2
+    assert sample("sd_generation_stage_seconds_count", '{stage="denoising"}') >= 2
+    assert sample("aesthetic_scoring_duration_seconds_count") == scored + 1
+    # Label = gabarit de la route (pas l'URL): cardinalité bornée
+    assert any(line.startswith('http_requests_total{method="GET",route="') and '/health",status="200"}' in line
+               for line in response.text.splitlines())
+    assert sample("sd_generations_in_flight") == 0
+    assert "process_resident_memory_bytes" in response.text
@@ -4,7 +4,7 @@ Tests pour les modèles.
 import pytest
 import numpy as np
 from PIL import Image
-from app.models.aesthetic_scorer import aesthetic_scorer
+from app.models.aesthetic_scorer import AestheticScorer, aesthetic_scorer, score_error_bound
 
 def test_aesthetic_scorer():
     """Test du scorer esthétique."""
@@ -17,3 +17,41 @@ def test_aesthetic_scorer():
     assert isinstance(score, float)
     assert 0 <= score <= 10
 
+
+def test_aesthetic_scorer_batch_matches_score():
+    """score_batch: même résultat que score() (liste d'images ou array N,H,W,3)."""
+    rng = np.random.default_rng(0)
+    batch = rng.integers(0, 256, size=(3, 64, 48, 3), dtype=np.uint8)
+    images = [Image.fromarray(array) for array in batch]
+    images += [Image.new('RGB', (32, 32), color=(100, 150, 200)), Image.fromarray(batch[0][:, :, 0])]
+    
+    expected = [aesthetic_scorer.score(image) for image in images]
+    
+    assert aesthetic_scorer.score_batch(images) == expected
+    assert aesthetic_scorer.score_batch(batch) == expected[:3]
+    assert aesthetic_scorer.score_batch([]) == []
+    
+    # Référence: métriques calculées directement avec numpy
+    reference = np.array(images[0], dtype=np.float64)
+    metrics = aesthetic_scorer._calculate_metrics(batch[0])
+    assert np.allclose(metrics, (
+        np.var(reference), np.mean(reference), np.std(reference),
+        np.mean([np.std(reference[:, :, c]) for c in range(3)]),
+    ))
+
+def test_aesthetic_scorer_fused_kernel_and_sampling():
+    """Histogramme PIL = histogramme numpy (exact); tirage borné par score_error_bound."""
+    rng = np.random.default_rng(1)
+    small = rng.integers(0, 256, size=(24, 24, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((768, 768), Image.BICUBIC).point(lambda v: v // 3)
+    array = np.asarray(image)
+    
+    moments = aesthetic_scorer._channel_moments(image)
+    reference = array.reshape(-1, 3).astype(np.int64)
+    assert (moments[0] == reference.sum(axis=0)).all() and (moments[1] == (reference ** 2).sum(axis=0)).all()
+    assert aesthetic_scorer.score_batch(array[np.newaxis]) == [aesthetic_scorer.score(image)]
+    
+    sampled = AestheticScorer(max_pixels=65536)
+    error = abs(sampled.score_batch(array[np.newaxis])[0] - aesthetic_scorer.score(image))
+    assert error <= score_error_bound(65536)
+    assert sampled.score(image) == aesthetic_scorer.score(image)  # Images PIL: toujours exact
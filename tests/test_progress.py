@@ -0,0 +1,53 @@
+"""
+Tests de la progression step par step et des aperçus latents.
+"""
+import pytest
+import torch
+from app.models.progress import latents_to_preview, make_step_end_callback
+from app.utils.cancellation import CancellationToken, GenerationCancelled
+from app.utils.job_queue import Job
+
+def test_latents_to_preview_size():
+    """L'aperçu a la résolution des latents (1/8 de l'image finale)."""
+    preview = latents_to_preview(torch.randn(4, 8, 12))
+    assert preview.size == (12, 8)
+    assert preview.mode == "RGB"
+
+def test_step_callback_reports_each_step_with_previews():
+    """Un événement par step, un aperçu tous les k steps et au dernier step."""
+    events = {0: [], 1: []}
+    callback = make_step_end_callback(
+        [events[0].append, events[1].append], total_steps=5, preview_every=2
+    )
+    latents = torch.randn(2, 4, 8, 8)
+    for step_index in range(5):
+        kwargs = {"latents": latents}
+        assert callback(None, step_index, None, kwargs) is kwargs
+    
+    steps = [p.step for p in events[0]]
+    assert steps == [1, 2, 3, 4, 5]
+    with_preview = [p.step for p in events[1] if p.preview is not None]
+    assert with_preview == [2, 4, 5]
+    assert events[0][-1].eta == 0
+
+def test_job_keeps_last_preview():
+    """Une progression sans aperçu ne fait pas oublier le précédent."""
+    job = Job(payload=None)
+    job.report_progress({"step": 1, "preview": "data:image/jpeg;base64,AAA"})
+    job.report_progress({"step": 2, "preview": None})
+    
+    assert job.progress == {"step": 2}
+    assert job.preview == "data:image/jpeg;base64,AAA"
+    assert job.to_dict()["progress"] == {"step": 2}
+
+def test_cancelled_batch_stops_between_steps():
+    """Le batch s'arrête quand toutes ses images sont annulées."""
+    first, second = CancellationToken(), CancellationToken()
+    callback = make_step_end_callback(None, total_steps=10, cancel_tokens=[first, second])
+    latents = {"latents": torch.randn(2, 4, 8, 8)}
+    
+    first.cancel()
+    callback(None, 0, None, latents)  # une image reste attendue
+    second.cancel()
+    with pytest.raises(GenerationCancelled):
+        callback(None, 1, None, latents)
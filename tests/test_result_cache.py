@@ -0,0 +1,68 @@
+"""
+Tests du cache de résultats (empreinte des paramètres + base SQLite).
+"""
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from app.database.database import migrate_schema
+from app.database.models import Base
+from app.database.repository import ImageRepository
+from app.utils.result_cache import find_cached_image, generation_cache_key
+
+PARAMS = {
+    "prompt": "a cat logo, vector art",
+    "negative_prompt": "blurry",
+    "guidance_scale": 7,
+    "num_inference_steps": 30,
+    "width": 512,
+    "height": 512,
+    "seed": 42,
+    "scheduler": "dpmpp",
+}
+IDENTITY = {"model_id": "Lykon/dreamshaper-8", "device": "cpu", "dtype": "float32"}
+
+def test_cache_key_is_deterministic():
+    """Mêmes paramètres = même empreinte; tout changement la modifie."""
+    key = generation_cache_key(PARAMS, IDENTITY)
+    assert key == generation_cache_key(dict(PARAMS, guidance_scale=7.0), IDENTITY)
+    assert key != generation_cache_key(dict(PARAMS, seed=43), IDENTITY)
+    assert key != generation_cache_key(dict(PARAMS, scheduler="unipc"), IDENTITY)
+    assert key != generation_cache_key(PARAMS, dict(IDENTITY, device="cuda"))
+    # Format et qualité effective du fichier (qualité ignorée sans perte)
+    assert key != generation_cache_key(dict(PARAMS, image_format="jpeg"), IDENTITY)
+    assert key == generation_cache_key(dict(PARAMS, image_format="png", image_quality=50), IDENTITY)
+    webp = generation_cache_key(dict(PARAMS, image_format="webp"), IDENTITY)
+    assert webp != generation_cache_key(dict(PARAMS, image_format="webp", image_quality=50), IDENTITY)
+    # Sans seed: génération non reproductible, pas de cache
+    assert generation_cache_key(dict(PARAMS, seed=None), IDENTITY) is None
+
+def test_find_cached_image_requires_existing_file(tmp_path):
+    """Un hit exige que le fichier image existe encore."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    key = generation_cache_key(PARAMS, IDENTITY)
+    
+    existing = tmp_path / "kept.png"
+    existing.write_bytes(b"png")
+    ImageRepository.create(db=db, prompt="a cat", image_path=str(existing), cache_key=key, score=6.5)
+    ImageRepository.create(db=db, prompt="a cat", image_path=str(tmp_path / "deleted.png"), cache_key=key)
+    
+    hit = find_cached_image(db, key)
+    assert hit is not None and hit.image_path == str(existing)
+    assert find_cached_image(db, "0" * 64) is None
+    db.close()
+
+def test_migrate_schema_adds_missing_columns(tmp_path):
+    """Une base créée avant l'ajout de cache_key est complétée au démarrage."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE generated_images (id INTEGER PRIMARY KEY, prompt TEXT NOT NULL)"
+        ))
+    
+    migrate_schema(engine)
+    
+    columns = {c["name"] for c in inspect(engine).get_columns("generated_images")}
+    assert "cache_key" in columns
+    indexes = {i["name"] for i in inspect(engine).get_indexes("generated_images")}
+    assert "ix_generated_images_cache_key" in indexes
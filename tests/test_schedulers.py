@@ -0,0 +1,48 @@
+"""
+Tests du registre de schedulers et de leur sélection par requête.
+"""
+import pytest
+from app.api.routes import _resolve_generation_params
+from app.api.schemas import GenerateRequest
+from app.models.schedulers import SCHEDULERS, build_scheduler
+from app.models.stable_diffusion import StableDiffusionGenerator
+from app.models.tiny_pipeline import build_tiny_pipeline
+
+def test_switching_scheduler_reuses_loaded_modules():
+    """Chaque génération a son scheduler; UNet/VAE restent ceux du pipeline chargé."""
+    generator = StableDiffusionGenerator()
+    generator.use_pipeline(build_tiny_pipeline())
+
+    for name, spec in SCHEDULERS.items():
+        assert isinstance(build_scheduler(name, generator.scheduler_config), spec.scheduler_class)
+
+    view = generator._pipeline_for("unipc")
+    assert view.unet is generator.pipe.unet and view.vae is generator.pipe.vae
+    assert view.scheduler is not generator._pipeline_for("unipc").scheduler
+
+    image = generator.generate("a cat", num_inference_steps=2, width=64, height=64, seed=1, scheduler="euler_a")
+    assert image.size == (64, 64)
+
+    # Pas de poids LCM: refusé
+    with pytest.raises(ValueError):
+        generator.generate("a cat", num_inference_steps=2, width=64, height=64, scheduler="lcm")
+
+def test_scheduler_resolution_from_template_and_request():
+    """Le template fixe son scheduler; un autre choix prend les steps du registre."""
+    draft = _resolve_generation_params(GenerateRequest(prompt="a shoe", use_case="marketing", style="draft"))
+    assert draft["scheduler"] == "unipc"
+    assert draft["num_inference_steps"] == 15
+
+    general = _resolve_generation_params(GenerateRequest(prompt="a shoe"))
+    assert general["scheduler"] == "dpmpp"
+    assert general["num_inference_steps"] == 35
+
+    lcm = _resolve_generation_params(GenerateRequest(prompt="a shoe", scheduler="lcm"))
+    assert lcm["num_inference_steps"] == SCHEDULERS["lcm"].default_steps
+    assert lcm["guidance_scale"] == SCHEDULERS["lcm"].guidance_scale
+
+    explicit = _resolve_generation_params(GenerateRequest(prompt="a shoe", scheduler="euler", num_inference_steps=12))
+    assert explicit["num_inference_steps"] == 12
+
+    with pytest.raises(ValueError):
+        _resolve_generation_params(GenerateRequest(prompt="a shoe", scheduler="ddim"))
@@ -0,0 +1,47 @@
+"""
+Tests des snapshots du pipeline (écriture, chargement memory-mappé, manifeste).
+"""
+import torch
+from app.models import stable_diffusion
+from app.models.snapshot import load_snapshot, read_manifest, save_snapshot, snapshot_mismatch
+from app.models.stable_diffusion import StableDiffusionGenerator
+from app.models.tiny_pipeline import build_tiny_pipeline
+from app.utils.config import settings
+
+def test_save_and_load_snapshot_keeps_weights(tmp_path):
+    """Les poids rechargés sont identiques; le manifeste décrit le modèle source."""
+    pipe = build_tiny_pipeline()
+    snapshot_dir = save_snapshot(pipe, tmp_path / "snapshot", model_id="tiny/model")
+    manifest = read_manifest(snapshot_dir)
+    assert manifest["model_id"] == "tiny/model" and manifest["dtype"] == "float32"
+
+    loaded = load_snapshot(snapshot_dir)
+    for name in ("unet", "vae", "text_encoder"):
+        expected = getattr(pipe, name).state_dict()
+        actual = getattr(loaded, name).state_dict()
+        assert expected.keys() == actual.keys()
+        assert all(torch.equal(expected[key], actual[key]) for key in expected)
+    assert type(loaded.scheduler) is type(pipe.scheduler)
+
+def test_snapshot_of_another_model_is_rejected(tmp_path, monkeypatch):
+    """Autre model_id ou dtype: le snapshot est ignoré, chargement depuis le hub."""
+    manifest = {"model_id": "tiny/model", "dtype": "float32"}
+    assert snapshot_mismatch(manifest, "tiny/model", "float32") is None
+    assert "tiny/model" in snapshot_mismatch(manifest, "Lykon/dreamshaper-8", "float32")
+    assert "float16" in snapshot_mismatch(manifest, "tiny/model", "float16")
+    assert snapshot_mismatch(None, "tiny/model", "float32") is not None
+
+    save_snapshot(build_tiny_pipeline(), tmp_path / "snapshot", model_id="tiny/model")
+    monkeypatch.setattr(settings, "SD_TINY_PIPELINE", False)
+    monkeypatch.setattr(settings, "SD_SNAPSHOT_DIR", str(tmp_path / "snapshot"))
+    monkeypatch.setattr(settings, "SD_MODEL_ID", "other/model")
+    hub_loads = []
+
+    def from_pretrained(model_id, **kwargs):
+        hub_loads.append(model_id)
+        return build_tiny_pipeline()
+
+    monkeypatch.setattr(stable_diffusion.StableDiffusionPipeline, "from_pretrained", from_pretrained)
+    generator = StableDiffusionGenerator(inference_mode="default")
+    generator._load_pipeline()
+    assert hub_loads == ["other/model"] and generator.load_source == "hub"
@@ -0,0 +1,37 @@
+"""
+Tests pour le cache des embeddings CLIP.
+"""
+import torch
+from app.models.text_embedding_cache import TextEmbeddingCache
+
+def test_hits_and_misses():
+    """Un texte déjà encodé n'est pas recalculé."""
+    cache = TextEmbeddingCache(max_bytes=1024 * 1024)
+    calls = []
+    
+    def encode(text):
+        calls.append(text)
+        return torch.zeros(1, 77, 8)
+    
+    cache.get_or_compute("a cat", encode)
+    cache.get_or_compute("a cat", encode)
+    cache.get_or_compute("a dog", encode)
+    
+    assert calls == ["a cat", "a dog"]
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+def test_lru_eviction_respects_budget():
+    """Le budget mémoire est respecté en évinçant l'entrée la moins récente."""
+    tensor_bytes = 77 * 8 * 4
+    cache = TextEmbeddingCache(max_bytes=2 * tensor_bytes)
+    
+    cache.put("a", torch.zeros(1, 77, 8))
+    cache.put("b", torch.zeros(1, 77, 8))
+    cache.get("a")  # "a" devient la plus récente
+    cache.put("c", torch.zeros(1, 77, 8))
+    
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["bytes"] <= 2 * tensor_bytes
@@ -0,0 +1,63 @@
+"""
+Tests des miniatures (écriture après l'image, rattrapage, endpoint).
+"""
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.api import routes
+from app.database.database import get_db
+from app.database.models import Base
+from app.database.repository import ImageRepository
+from app.main import app
+from app.utils.image_store import ImageStore, backfill_thumbnails, parse_thumbnail_sizes
+from app.utils.image_writer import image_writer
+
+def test_put_writes_thumbnails_and_backfill(tmp_path):
+    """Une miniature WebP par taille (côté le plus long), supprimées avec l'image; rattrapage idempotent."""
+    assert parse_thumbnail_sizes("256, 64,,64") == [64, 256] and parse_thumbnail_sizes("") == []
+    store = ImageStore(tmp_path, thumbnail_sizes=[32, 64])
+    image = Image.effect_noise((128, 96), 30).convert("RGB")
+    write = store.put(image, "png")
+    write.wait()
+    image_writer.flush()
+    with Image.open(store.thumbnail_path(write.path, 64)) as thumbnail:
+        assert thumbnail.format == "WEBP" and thumbnail.size == (64, 48)
+    assert store.etag_of(store.thumbnail_path(write.path, 32)) == f"{write.path.stem}_32"
+
+    store.delete(write.path)
+    assert not any(tmp_path.iterdir())
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    image.save(tmp_path / "legacy.png")
+    ImageRepository.create(db=db, prompt="a cat", image_path=str(tmp_path / "legacy.png"))
+    ImageRepository.create(db=db, prompt="a dog", image_path=str(tmp_path / "deleted.png"))
+    assert backfill_thumbnails(db, store) == {"generated": 1, "complete": 0, "missing": 1}
+    assert store.thumbnail_path(tmp_path / "legacy.png", 32).is_file()
+    assert backfill_thumbnails(db, store)["complete"] == 1
+
+def test_thumbnail_endpoint(tmp_path, monkeypatch):
+    """URLs exposées par to_dict; ETag empreinte_taille; 404 pour une taille non configurée."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)
+    monkeypatch.setattr(routes.image_store, "root", tmp_path)
+    monkeypatch.setattr(routes.image_store, "thumbnail_sizes", [64, 128])
+    write = routes.image_store.put(Image.effect_noise((256, 256), 30).convert("RGB"), "png")
+    db_image = ImageRepository.create(db=session(), prompt="a cat", image_path=str(write.path))
+    assert db_image.to_dict()["thumbnail_urls"] == {
+        64: f"/api/v1/images/{db_image.id}/thumbnails/64",
+        128: f"/api/v1/images/{db_image.id}/thumbnails/128",
+    }
+    app.dependency_overrides[get_db] = lambda: session()
+    try:
+        client = TestClient(app)
+        response = client.get(db_image.thumbnail_urls[128])
+        assert response.status_code == 200 and response.headers["content-type"] == "image/webp"
+        assert response.headers["etag"] == f'"{write.path.stem}_128"'
+        assert len(response.content) < write.path.stat().st_size
+        assert client.get(f"/api/v1/images/{db_image.id}/thumbnails/256").status_code == 404
+    finally:
+        app.dependency_overrides.pop(get_db)
@@ -0,0 +1,59 @@
+"""
+Tests des temps par étape des générations.
+"""
+import pickle
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.api import routes
+from app.api.schemas import GenerateRequest
+from app.database.models import Base, GeneratedImage
+from app.database.repository import ImageRepository
+from app.models.stable_diffusion import StableDiffusionGenerator
+from app.models.tiny_pipeline import build_tiny_pipeline
+from app.utils.image_writer import image_writer
+from app.utils.timings import StageTimings, image_timings
+
+def test_generator_attaches_stage_timings(tmp_path):
+    """Encodage, débruitage et décodage joints à l'image; conservés par pickle, absents du PNG."""
+    generator = StableDiffusionGenerator()
+    generator.use_pipeline(build_tiny_pipeline())
+    [image] = generator.generate_batch(prompts=["a cat"], seeds=[1], num_inference_steps=4, width=64, height=64)
+
+    timings = image_timings(image).to_dict()
+    assert list(timings) == ["text_encoding", "denoising", "denoising_step", "vae_decode"]
+    assert all(seconds >= 0 for seconds in timings.values())
+    assert abs(timings["denoising_step"] * 4 - timings["denoising"]) < 1e-9
+    # Batch: chaque image en porte la moitié, la durée d'un step ne change pas
+    shared = StageTimings({"denoising": 4.0, "denoising_step": 1.0}).per_image(2)
+    assert shared.to_dict() == {"denoising": 2.0, "denoising_step": 1.0}
+
+    # Pool d'inférence: les images traversent les processus par pickle
+    assert image_timings(pickle.loads(pickle.dumps(image))).to_dict() == timings
+    image.save(tmp_path / "image.png")
+    assert image_timings(Image.open(tmp_path / "image.png")).to_dict() == {}
+
+def test_timings_returned_and_persisted(tmp_path, monkeypatch):
+    """Chaque étape dans la réponse et, sauf l'insertion elle-même, dans l'historique."""
+    generator = StableDiffusionGenerator()
+    generator.use_pipeline(build_tiny_pipeline())
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)
+    monkeypatch.setattr(routes, "get_generator", lambda: generator)
+    monkeypatch.setattr(routes, "SessionLocal", session)
+    monkeypatch.setattr(routes.image_store, "root", tmp_path)
+
+    request = GenerateRequest(prompt="a cat", num_inference_steps=2, width=64, height=64, num_images=2, seed=5)
+    response = routes._run_generation(request)
+    image_writer.flush()  # image_save: mesurée par le thread d'écriture
+    assert set(response.timings) == {"text_encoding", "denoising", "denoising_step", "vae_decode",
+                                     "image_save", "scoring", "db_write"}
+    assert all(image.timings["scoring"] >= 0 for image in response.images)
+
+    rows = session().query(GeneratedImage).all()
+    assert len(rows) == 2
+    stored = rows[0].to_dict()["timings"]
+    assert set(stored) == set(response.timings) - {"db_write"}
+    assert all(seconds is not None for seconds in stored.values())
+    assert ImageRepository.get_statistics(session())["average_timings"]["denoising"] > 0
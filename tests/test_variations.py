@@ -0,0 +1,45 @@
+"""
+Tests des variations multiples d'un même prompt (num_images / seeds).
+"""
+import numpy as np
+import pytest
+from app.api.routes import _resolve_generation_params
+from app.api.schemas import GenerateRequest
+from app.models.stable_diffusion import StableDiffusionGenerator
+from app.models.tiny_pipeline import build_tiny_pipeline
+
+def test_seeds_resolution():
+    """Seeds explicites, seed de départ + i, ou aléatoires; bornes vérifiées."""
+    assert _resolve_generation_params(GenerateRequest(prompt="a logo"))["seeds"] == [None]
+    params = _resolve_generation_params(GenerateRequest(prompt="a logo", seed=10, num_images=3))
+    assert params["seeds"] == [10, 11, 12] and params["seed"] == 10 and params["num_images"] == 3
+    assert _resolve_generation_params(GenerateRequest(prompt="a logo", seeds=[7, 3]))["num_images"] == 2
+    assert _resolve_generation_params(GenerateRequest(prompt="a logo", num_images=2))["seeds"] == [None, None]
+
+    with pytest.raises(ValueError):
+        _resolve_generation_params(GenerateRequest(prompt="a logo", seeds=[7, 3], num_images=3))
+    with pytest.raises(ValueError):
+        _resolve_generation_params(GenerateRequest(prompt="a logo", num_images=0))
+    with pytest.raises(ValueError):
+        _resolve_generation_params(GenerateRequest(prompt="a logo", num_images=1000))
+
+def test_variations_share_one_text_encoding():
+    """Un encodage par texte distinct; chaque variation reproduit sa génération individuelle."""
+    generator = StableDiffusionGenerator()
+    generator.use_pipeline(build_tiny_pipeline())
+    generator.text_embedding_cache.clear()
+    encoded = []
+    encode_prompt = generator.pipe.encode_prompt
+    generator.pipe.encode_prompt = lambda text, **kwargs: encoded.append(text) or encode_prompt(text, **kwargs)
+
+    images = generator.generate_batch(
+        prompts=["a game asset"] * 3, negative_prompts=["blurry"] * 3, seeds=[1, 2, 3],
+        num_inference_steps=2, width=64, height=64,
+    )
+    assert sorted(encoded) == ["a game asset", "blurry"]
+
+    single = generator.generate("a game asset", negative_prompt="blurry", num_inference_steps=2,
+                                width=64, height=64, seed=2)
+    difference = np.abs(np.asarray(images[1], dtype=np.int16) - np.asarray(single, dtype=np.int16))
+    assert difference.max() <= 1
+    assert images[0].tobytes() != images[1].tobytes()
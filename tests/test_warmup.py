@@ -0,0 +1,44 @@
+"""
+Tests du préchauffage au démarrage et de l'endpoint de readiness.
+"""
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import stable_diffusion, warmup
+from app.models.stable_diffusion import StableDiffusionGenerator
+from app.models.tiny_pipeline import build_tiny_pipeline
+from app.models.warmup import WarmupState, parse_sizes
+from app.utils.config import settings
+
+def test_parse_sizes():
+    """Format LARGEURxHAUTEUR séparé par des virgules."""
+    assert parse_sizes("512x512, 768X512") == [(512, 512), (768, 512)]
+    with pytest.raises(ValueError):
+        parse_sizes("512")
+
+def test_ready_only_after_warmup(monkeypatch):
+    """503 avant et pendant le préchauffage, 200 une fois les générations de warm-up faites."""
+    generator = StableDiffusionGenerator()
+    generator.use_pipeline(build_tiny_pipeline())
+    calls = []
+    generate = generator.generate
+    monkeypatch.setattr(generator, "generate", lambda *a, **k: calls.append((k["width"], k["height"])) or generate(*a, **k))
+    monkeypatch.setattr(stable_diffusion, "sd_generator", generator)
+    monkeypatch.setattr(settings, "SD_WARMUP_SIZES", "64x64,96x64")
+    state = WarmupState(enabled=True)
+    monkeypatch.setattr(warmup, "warmup_state", state)
+    monkeypatch.setattr("app.api.routes.warmup_state", state)
+    client = TestClient(app)
+
+    response = client.get("/api/v1/ready")
+    assert response.status_code == 503
+    assert response.json()["warmup"]["state"] == "pending"
+
+    assert state.run()
+    assert calls == [(64, 64), (96, 64)]
+    assert [run["stage"] for run in state.runs] == ["load", "generate", "generate", "score"]
+    response = client.get("/api/v1/ready")
+    assert response.status_code == 200
+    assert response.json()["ready"] is True
+
+    assert WarmupState(enabled=False).is_ready